@@ -0,0 +1,118 @@
+"""
+Recompute StudentBasicMetrics for every user.
+
+Streams user ids from Mongo in _id order, chunk by chunk. Each user's counters are recomputed with the
+aggregation pipeline by a bounded pool of workers (reconcile, so live submissions are not overwritten),
+the chunk's metrics are written to Firestore in batched writes and the last user id of the chunk is
+checkpointed. A rerun resumes after the checkpoint, redoing at most one chunk. --dry-run only
+reports how many users' counters drifted.
+
+Run it before deploying the incremental counters (analytics.metric_counters), so existing users
+already have counters when their next submission is recorded.
+
+    cd app && python -m analytics.backfill_metrics --concurrency 8 --chunk-size 500
+"""
+import argparse, asyncio, json, os, time
+from db_utility.mongo_db import mongo_db
+from db_utility.firestore_db import student_metrics_collection
+from analytics.metric_counters import student_metric_counters, metrics_from_counters, normalized_counters
+
+users_collection = mongo_db["users"]
+
+
+def load_checkpoint(path: str | None) -> dict:
+    if path is None or not os.path.exists(path):
+        return {"last_user_id": None, "users": 0, "published": 0, "errors": 0}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    # write then rename, so an interrupted run never leaves a torn checkpoint
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(f"{path}.tmp", path)
+
+
+async def user_id_chunks(after: str | None, chunk_size: int):
+    # one short query per chunk rather than a cursor held open while chunks are processed
+    while True:
+        query = {"_id": {"$gt": after}} if after is not None else {}
+        docs = await users_collection.find(query, {"_id": 1}).sort("_id", 1).limit(chunk_size).to_list()
+        if not docs:
+            return
+        after = docs[-1]["_id"]
+        yield [doc["_id"] for doc in docs]
+
+
+async def recompute(user_id: str, semaphore: asyncio.Semaphore, dry_run: bool) -> tuple[dict | None, bool]:
+    """
+    The user's metrics and whether their stored counters had drifted from their submissions.
+    A dry run only compares, reconcile() replaces drifted counters.
+    """
+    async with semaphore:
+        if dry_run:
+            stored, counters = await student_metric_counters.get(user_id), await student_metric_counters.scan(user_id)
+            drifted = normalized_counters(stored or {}) != normalized_counters(counters)
+        else:
+            corrected = await student_metric_counters.reconcile(user_id)
+            counters, drifted = corrected or await student_metric_counters.get(user_id), corrected is not None
+    return (metrics_from_counters(counters) if counters else None), drifted
+
+
+async def backfill(args) -> dict:
+    # a dry run writes nothing, not even a checkpoint a real run would resume from
+    checkpoint = load_checkpoint(None if args.dry_run else args.checkpoint)
+    checkpoint.setdefault("drifted", 0)
+    if checkpoint["last_user_id"] is not None:
+        print(f"Resuming after user {checkpoint['last_user_id']}")
+    semaphore = asyncio.Semaphore(args.concurrency)
+    started_at, processed = time.perf_counter(), 0
+
+    async for user_ids in user_id_chunks(checkpoint["last_user_id"], args.chunk_size):
+        results = await asyncio.gather(*(recompute(user_id, semaphore, args.dry_run) for user_id in user_ids),
+                                       return_exceptions=True)
+        metrics = {}
+        for user_id, result in zip(user_ids, results):
+            if isinstance(result, Exception):
+                checkpoint["errors"] += 1
+                print(f"Error recomputing metrics for user {user_id}: {result}")
+                continue
+            user_metrics, drifted = result
+            checkpoint["drifted"] += int(drifted)
+            if user_metrics is not None:
+                metrics[user_id] = user_metrics
+        if metrics and not args.dry_run:
+            await asyncio.to_thread(student_metrics_collection.add_or_update_documents, metrics, args.batch_size)
+
+        checkpoint["last_user_id"] = user_ids[-1]
+        checkpoint["users"] += len(user_ids)
+        checkpoint["published"] += 0 if args.dry_run else len(metrics)
+        if not args.dry_run:
+            save_checkpoint(args.checkpoint, checkpoint)
+        processed += len(user_ids)
+        rate = processed / (time.perf_counter() - started_at)
+        print(f"{checkpoint['users']} users, {checkpoint['drifted']} drifted, {checkpoint['published']} published, {rate:.0f} users/s")
+
+    return checkpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute student metrics for all users")
+    parser.add_argument("--concurrency", type=int, default=8, help="users recomputed at once")
+    parser.add_argument("--chunk-size", type=int, default=500, help="users per checkpoint")
+    parser.add_argument("--batch-size", type=int, default=500, help="Firestore writes per batch, at most 500")
+    parser.add_argument("--checkpoint", default="metrics_backfill.checkpoint.json")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="count drifted counters without writing to Mongo, Firestore or the checkpoint")
+    args = parser.parse_args()
+
+    if args.restart and not args.dry_run and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    checkpoint = asyncio.run(backfill(args))
+    print(f"Done: {json.dumps(checkpoint)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+from collections import Counter
+from datetime import datetime
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.asynchronous.database import AsyncDatabase
+from db_utility.mongo_db import mongo_db
+
+SUBMISSION_FIELDS = {"_id": 0, "quiz_id": 1, "is_correct": 1, "score": 1, "difficulty": 1, "subject": 1}
+COUNTER_FIELDS = ("total", "correct", "score")
+GROUPS = {"subjects": ("subject", "Unknown"), "difficulties": ("difficulty", "easy")}
+
+
+def encode_key(name: str) -> str:
+    # subject names become field names, which cannot contain dots or start with $
+    return str(name).replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+
+def decode_key(key: str) -> str:
+    return key.replace("%24", "$").replace("%2E", ".").replace("%25", "%")
+
+
+def submission_contribution(submission: dict | None) -> dict[str, float]:
+    """
+    What one submission adds to the counters, as dotted field paths.
+    """
+    if not submission:
+        return {}
+    fields = {
+        "total": 1,
+        "correct": 1 if submission.get("is_correct") else 0,
+        "score": submission.get("score") or 0,
+    }
+    contribution = dict(fields)
+    for group, (field, default) in GROUPS.items():
+        key = encode_key(submission.get(field) or default)
+        for name, value in fields.items():
+            contribution[f"{group}.{key}.{name}"] = value
+    return contribution
+
+
+def metric_delta(previous: dict | None, current: dict) -> dict[str, float]:
+    """
+    $inc that moves the counters from a user's previous answer to a quiz to the current one.
+    """
+    delta = Counter(submission_contribution(current))
+    delta.subtract(submission_contribution(previous))
+    return {path: value for path, value in delta.items() if value}
+
+
+def submission_filter(user_id: str, quiz_id: str) -> dict:
+    return {"user_id": user_id, "quiz_id": quiz_id}
+
+
+def submission_update(user_id: str, quiz_id: str, fields: dict, created_at: datetime) -> dict:
+    return {
+        "$set": fields,
+        "$setOnInsert": {"user_id": user_id, "quiz_id": quiz_id, "created_at": created_at},
+    }
+
+
+def previous_answers_filter(user_id: str, quiz_ids: list[str]) -> dict:
+    return {"user_id": user_id, "quiz_id": {"$in": quiz_ids}}
+
+
+def _group_totals(key) -> dict:
+    return {
+        "$group": {
+            "_id": key,
+            "total": {"$sum": 1},
+            "correct": {"$sum": {"$cond": ["$is_correct", 1, 0]}},
+            "score": {"$sum": {"$ifNull": ["$score", 0]}},
+        }
+    }
+
+
+def _name_or_default(field: str, default: str) -> dict:
+    # missing, null and empty names fall back to the default, like submission_contribution
+    return {"$cond": [{"$in": [{"$ifNull": [f"${field}", ""]}, [""]]}, default, f"${field}"]}
+
+
+def counters_pipeline(user_id: str) -> list[dict]:
+    """
+    Aggregation computing a user's counters on the server: only the totals cross the wire.
+    """
+    return [
+        {"$match": {"user_id": user_id}},
+        {"$facet": {
+            "overall": [_group_totals(None)],
+            **{group: [_group_totals(_name_or_default(field, default))] for group, (field, default) in GROUPS.items()},
+        }},
+    ]
+
+
+def counters_from_facets(facets: dict) -> dict:
+    overall = facets["overall"][0] if facets["overall"] else {}
+    return {
+        **{name: overall.get(name, 0) for name in COUNTER_FIELDS},
+        **{
+            group: {encode_key(row["_id"]): {name: row[name] for name in COUNTER_FIELDS} for row in facets[group]}
+            for group in GROUPS
+        },
+    }
+
+
+def counters_from_submissions(submissions: list[dict]) -> dict:
+    counters = {"total": 0, "correct": 0, "score": 0, "subjects": {}, "difficulties": {}}
+    for submission in submissions:
+        for path, value in submission_contribution(submission).items():
+            *parents, last = path.split(".")
+            doc = counters
+            for part in parents:
+                doc = doc.setdefault(part, {})
+            doc[last] = doc.get(last, 0) + value
+    return counters
+
+
+def normalized_counters(counters: dict) -> dict:
+    """
+    Counters without bookkeeping fields and groups emptied by re-answers, for comparison.
+    """
+    return {
+        "total": counters.get("total", 0),
+        "correct": counters.get("correct", 0),
+        "score": counters.get("score", 0),
+        **{
+            group: {
+                key: {name: values.get(name, 0) for name in COUNTER_FIELDS}
+                for key, values in counters.get(group, {}).items() if values.get("total")
+            }
+            for group in GROUPS
+        },
+    }
+
+
+def _ratios(group: dict) -> tuple[dict, dict, dict]:
+    group = {decode_key(key): values for key, values in group.items() if values.get("total")}
+    accuracy = {name: values.get("correct", 0) / values["total"] * 100 for name, values in group.items()}
+    average_score = {name: values.get("score", 0) / values["total"] for name, values in group.items()}
+    taken = {name: values["total"] for name, values in group.items()}
+    return accuracy, average_score, taken
+
+
+def metrics_from_counters(counters: dict) -> dict | None:
+    """
+    StudentBasicMetrics fields from a user's counters, None before their first submission.
+    """
+    total = counters.get("total", 0)
+    if not total:
+        return None
+    overall_accuracy = counters.get("correct", 0) / total * 100
+    subject_accuracy, subject_score, subject_taken = _ratios(counters.get("subjects", {}))
+    difficulty_accuracy, difficulty_score, difficulty_taken = _ratios(counters.get("difficulties", {}))
+    return dict(
+        overall_accuracy=overall_accuracy,
+        average_accuracy=overall_accuracy,
+        average_score=counters.get("score", 0) / total,
+        subject_wise_accuracy=subject_accuracy,
+        subject_wise_average_score=subject_score,
+        quizzes_taken_count=total,
+        subject_wise_quizzes_taken_count=subject_taken,
+        difficulty_wise_accuracy=difficulty_accuracy,
+        difficulty_wise_average_score=difficulty_score,
+        difficulty_wise_quizzes_taken_count=difficulty_taken,
+    )
+
+
+class StudentMetricCounters:
+    """
+    Running totals per user, kept next to the submissions so metrics never need a full rescan.
+
+    student_metric_counters: {_id: user_id, total, correct, score,
+                              subjects: {<subject>: {total, correct, score}},
+                              difficulties: {<difficulty>: {total, correct, score}},
+                              updates: int}
+
+    A submission is upserted with the previous version returned, and the difference between the
+    two answers is applied with one atomic $inc, so re-answering a quiz moves the counters instead
+    of adding to them. `updates` counts the deltas applied, reconcile() uses it to detect writes
+    that raced with its rescan.
+
+    Missing counters are seeded from a full scan with insert_one, a request that loses the insert
+    applies its delta instead. When two first submissions of one user race, the winning scan may
+    already include the loser's answer, which is then counted twice until reconcile() runs. Run
+    analytics.backfill_metrics before deploying, so existing users start with counters and only
+    brand-new users go through the seeding path.
+    """
+
+    def __init__(self, database: AsyncDatabase):
+        self.submissions = database["quiz_submissions"]
+        self.counters = database["student_metric_counters"]
+
+    async def record_submission(self, user_id: str, quiz_id: str, fields: dict) -> tuple[dict | None, dict]:
+        """
+        Upsert the user's answer to a quiz and update the counters.
+        Returns the previous answer (None when new) and the counters after the update.
+        """
+        previous = await self.submissions.find_one_and_update(
+            submission_filter(user_id, quiz_id),
+            submission_update(user_id, quiz_id, fields, datetime.now()),
+            projection=SUBMISSION_FIELDS,
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+        counters = await self.apply_delta(user_id, metric_delta(previous, fields))
+        return previous, counters
+
+    async def record_submissions(self, user_id: str, submissions: dict[str, dict]) -> dict[str, dict]:
+        """
+        Batch form of record_submission, keyed by quiz_id: the previous answers are read with one query,
+        the upserts go in one unordered bulk_write and the summed delta is applied with one $inc.
+        Returns {quiz_id: {"status": "created" | "updated" | "error", ...}}.
+        Previous answers are read before the write, so an answer to the same quiz racing with the batch
+        can skew the counters until the next reconcile.
+        """
+        quiz_ids = list(submissions)
+        previous = {
+            doc["quiz_id"]: doc
+            for doc in await self.submissions.find(previous_answers_filter(user_id, quiz_ids), SUBMISSION_FIELDS).to_list()
+        }
+        created_at = datetime.now()
+        operations = [
+            UpdateOne(
+                submission_filter(user_id, quiz_id),
+                submission_update(user_id, quiz_id, submissions[quiz_id], created_at),
+                upsert=True,
+            )
+            for quiz_id in quiz_ids
+        ]
+        try:
+            result = await self.submissions.bulk_write(operations, ordered=False)
+            upserted, errors = set(result.upserted_ids), {}
+        except BulkWriteError as e:
+            # unordered: every other operation was still applied
+            upserted = {item["index"] for item in e.details.get("upserted", [])}
+            errors = {error["index"]: error.get("errmsg", "Write failed") for error in e.details.get("writeErrors", [])}
+
+        statuses, delta = {}, Counter()
+        for index, quiz_id in enumerate(quiz_ids):
+            if index in errors:
+                statuses[quiz_id] = {"status": "error", "detail": errors[index]}
+                continue
+            statuses[quiz_id] = {"status": "created" if index in upserted else "updated"}
+            delta.update(metric_delta(previous.get(quiz_id), submissions[quiz_id]))
+        if len(errors) < len(quiz_ids):
+            await self.apply_delta(user_id, {path: value for path, value in delta.items() if value})
+        return statuses
+
+    async def apply_delta(self, user_id: str, delta: dict) -> dict:
+        update = {"$inc": {**delta, "updates": 1}}
+        counters = await self.counters.find_one_and_update({"_id": user_id}, update, return_document=ReturnDocument.AFTER)
+        if counters is not None:
+            return counters
+        # no counters yet (e.g. submissions from before they existed): seed them from a full scan,
+        # which already includes the submission being recorded
+        counters = {"_id": user_id, **await self.scan(user_id), "updates": 0}
+        try:
+            await self.counters.insert_one(counters)
+            return counters
+        except DuplicateKeyError:
+            # a concurrent submission seeded them first, apply this one on top
+            return await self.counters.find_one_and_update({"_id": user_id}, update, return_document=ReturnDocument.AFTER)
+
+    async def get(self, user_id: str) -> dict | None:
+        return await self.counters.find_one({"_id": user_id})
+
+    async def scan(self, user_id: str) -> dict:
+        cursor = await self.submissions.aggregate(counters_pipeline(user_id))
+        facets, = await cursor.to_list()
+        return counters_from_facets(facets)
+
+    async def rebuild(self, user_id: str) -> dict:
+        counters = {"_id": user_id, **await self.scan(user_id), "updates": 0}
+        await self.counters.replace_one({"_id": user_id}, counters, upsert=True)
+        return counters
+
+    async def reconcile(self, user_id: str) -> dict | None:
+        """
+        Rescan a user's submissions and replace the counters when they drifted.
+        Returns the corrected counters, or None when they matched or were updated during the rescan
+        (the next run picks those up).
+        """
+        stored = await self.get(user_id)
+        rebuilt = await self.scan(user_id)
+        if stored is None and not rebuilt["total"]:
+            return None
+        if stored is not None and normalized_counters(stored) == normalized_counters(rebuilt):
+            return None
+        updates = stored.get("updates", 0) if stored else 0
+        counters = {"_id": user_id, **rebuilt, "updates": updates}
+        if stored is None:
+            try:
+                await self.counters.insert_one(counters)
+            except DuplicateKeyError:
+                return None  # a first delta created them during the rescan
+            return counters
+        result = await self.counters.replace_one({"_id": user_id, "updates": updates}, counters)
+        return counters if result.matched_count else None
+
+
+student_metric_counters = StudentMetricCounters(mongo_db)
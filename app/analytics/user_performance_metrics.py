@@ -2,94 +2,86 @@ from db_utility.mongo_db import mongo_db
 from db_utility.firestore_db import student_metrics_collection, StudentBasicMetrics
 from fastapi import APIRouter, Depends, HTTPException, status
 from utility.auth import get_current_user_from_firebase_token
-from collections import defaultdict
+from analytics.metric_counters import student_metric_counters, metrics_from_counters
+from utility.background_queue import CoalescingQueue
+from utility.read_cache import ReadThroughCache
+import asyncio, os
+
+# Metric publish jobs running at once on this worker
+METRICS_WORKER_CONCURRENCY = int(os.getenv("METRICS_WORKER_CONCURRENCY", 4))
+
+# Firestore metrics documents polled by dashboards, invalidated when this worker publishes new ones
+student_metrics_cache = ReadThroughCache(
+    maxsize=int(os.getenv("METRICS_CACHE_SIZE", 10_000)),
+    ttl=float(os.getenv("METRICS_CACHE_TTL_SECONDS", 30)),
+)
 
 users_collection = mongo_db["users"]
 quiz_collection = mongo_db["quizzes"]
 quiz_submissions_collection = mongo_db["quiz_submissions"]
 
 
+async def publish_student_metrics(user_id: str, counters: dict) -> StudentBasicMetrics:
+    """
+    Derive the metrics from a user's counters and write them to Firestore.
+    """
+    student_metrics = metrics_from_counters(counters)
+    if student_metrics is None:
+        return {"message": "No quizzes taken by the user."}
+    await asyncio.to_thread(student_metrics_collection.add_or_update_document, user_id, student_metrics)
+    # the stored document is merged, so it is read back rather than cached from here
+    student_metrics_cache.invalidate(user_id)
+    return student_metrics
 
-def updateStudentBasicMetricInDB(user_id: str) -> StudentBasicMetrics:
+
+async def publish_latest_student_metrics(user_id: str):
     """
-    adds or updates student basic metrics in the database
+    Background job: publish the user's metrics from their current counters. Runs once for a burst
+    of submissions, whatever their number.
     """
-    try:
-        # Materialize the cursor once
-        quizzes_taken = list(
-            quiz_submissions_collection.find(
-                {"user_id": user_id},
-                {"_id": 0, "quiz_id": 1, "is_correct": 1, "score": 1, "difficulty": 1, "subject": 1}
-            )
-        )
+    counters = await student_metric_counters.get(user_id)
+    if counters is not None:
+        await publish_student_metrics(user_id, counters)
 
-        if not quizzes_taken:
-            # Optionally upsert an empty/default metrics doc here
-            return {"message": "No quizzes taken by the user."}
-
-        total_quizzes = len(quizzes_taken)
-        total_score = sum(q.get("score", 0) for q in quizzes_taken)
-        correct_count = sum(1 for q in quizzes_taken if q.get("is_correct", False))
-
-        overall_accuracy = (correct_count / total_quizzes) * 100 if total_quizzes else 0.0
-        average_score = (total_score / total_quizzes) if total_quizzes else 0.0
-
-        # Aggregate subject-wise and difficulty-wise in Python
-        subject_wise = defaultdict(lambda: {"total": 0, "correct": 0, "score": 0.0})
-        difficulty_wise = defaultdict(lambda: {"total": 0, "correct": 0, "score": 0.0})
-
-        for q in quizzes_taken:
-            subj = q.get("subject", "Unknown")
-            diff = q.get("difficulty", "easy")
-            is_correct = 1 if q.get("is_correct", False) else 0
-            sc = q.get("score", 0.0)
-
-            subject_wise[subj]["total"] += 1
-            subject_wise[subj]["correct"] += is_correct
-            subject_wise[subj]["score"] += sc
-
-            difficulty_wise[diff]["total"] += 1
-            difficulty_wise[diff]["correct"] += is_correct
-            difficulty_wise[diff]["score"] += sc
-
-        subject_wise_accuracy = {
-            s: (v["correct"] / v["total"]) * 100 if v["total"] else 0.0
-            for s, v in subject_wise.items()
-        }
-        subject_wise_average_score = {
-            s: (v["score"] / v["total"]) if v["total"] else 0.0
-            for s, v in subject_wise.items()
-        }
-        difficulty_wise_accuracy = {
-            d: (v["correct"] / v["total"]) * 100 if v["total"] else 0.0
-            for d, v in difficulty_wise.items()
-        }
-        difficulty_wise_average_score = {
-            d: (v["score"] / v["total"]) if v["total"] else 0.0
-            for d, v in difficulty_wise.items()
-        }
-
-        student_metrics = StudentBasicMetrics(
-            overall_accuracy=overall_accuracy,
-            average_accuracy=overall_accuracy,  # or compute separately if needed
-            average_score=average_score,
-            subject_wise_accuracy=subject_wise_accuracy,
-            subject_wise_average_score=subject_wise_average_score,
-            quizzes_taken_count=total_quizzes,
-            subject_wise_quizzes_taken_count={s: v["total"] for s, v in subject_wise.items()},
-            difficulty_wise_accuracy=difficulty_wise_accuracy,
-            difficulty_wise_average_score=difficulty_wise_average_score,
-            difficulty_wise_quizzes_taken_count={d: v["total"] for d, v in difficulty_wise.items()},
-        )
 
-        # Persist metrics (ensure this method accepts your model/dict)
-        student_metrics_collection.add_or_update_document(user_id, student_metrics)
+# Firestore metric writes, coalesced per user and run off the request path
+metrics_publish_queue = CoalescingQueue("student_metrics", publish_latest_student_metrics, METRICS_WORKER_CONCURRENCY)
 
-        return student_metrics
+
+async def updateStudentBasicMetricInDB(user_id: str) -> StudentBasicMetrics:
+    """
+    adds or updates student basic metrics in the database, rebuilding the user's counters
+    from all of their submissions
+    """
+    try:
+        counters = await student_metric_counters.rebuild(user_id)
+        return await publish_student_metrics(user_id, counters)
 
     except Exception as e:
         print(f"Error updating student metrics for user {user_id}: {str(e)}")
         return {"error": str(e)}
+
+
+async def reconcile_student_metrics(user_ids: list[str] | None = None) -> dict:
+    """
+    Compare every user's counters with a rescan of their submissions and fix the ones that drifted
+    (a request that failed between the submission write and the counter update).
+    """
+    stats = {"checked": 0, "corrected": 0, "errors": 0}
+    if user_ids is None:
+        user_ids = await quiz_submissions_collection.distinct("user_id")
+    for user_id in user_ids:
+        try:
+            counters = await student_metric_counters.reconcile(user_id)
+            if counters is not None:
+                await publish_student_metrics(user_id, counters)
+                stats["corrected"] += 1
+                print(f"Corrected metric counters for user {user_id}")
+        except Exception as e:
+            stats["errors"] += 1
+            print(f"Error reconciling metrics for user {user_id}: {e}")
+        stats["checked"] += 1
+    return stats
     
 
 analytics_router = APIRouter(
@@ -98,13 +90,14 @@ analytics_router = APIRouter(
 
 
 @analytics_router.get("/user-performance/{user_id}", response_model=StudentBasicMetrics)
-def get_user_performance(user_id: str, current_user: dict = Depends(get_current_user_from_firebase_token)):
+async def get_user_performance(user_id: str, current_user: dict = Depends(get_current_user_from_firebase_token)):
     """
     Return : overall accuracy, average accuracy, average score, subject-wise accuracy,
     subject-wise average score, quizzes taken count, subject-wise quizzes taken count
     """
     try:
-        user_metrics = student_metrics_collection.get_document(user_id)
+        user_metrics = await student_metrics_cache.get_or_load(
+            user_id, lambda: asyncio.to_thread(student_metrics_collection.get_document, user_id))
         if not user_metrics:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User metrics not found")
 
@@ -113,4 +106,10 @@ def get_user_performance(user_id: str, current_user: dict = Depends(get_current_
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error retrieving user performance metrics: {str(e)}",
-        )
\ No newline at end of file
+        )
+
+
+if __name__ == "__main__":
+    # Periodic reconciliation: python -m analytics.user_performance_metrics [user_id ...]
+    import sys
+    print(asyncio.run(reconcile_student_metrics(sys.argv[1:] or None)))
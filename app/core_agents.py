@@ -1,15 +1,59 @@
 from langgraph.graph import StateGraph, START, END
 from langchain_ollama import ChatOllama
-from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
+from langchain_core.messages import HumanMessage, AIMessage
 from typing import TypedDict
-from prompts import AI_TUTOR_PROMPT, QUIZ_GENERATOR_PROMPT, SUMMARIZE_HISTORY_PROMPT, AI_TUTOR_PROMPT_PERSONALIZED, INTENT_EXTRACTOR_PROMPT, TOPIC_GENERATOR_PROMPT, GENERAL_FALLBACK_PROMPT, SEARCH_QUERY_GENERATION_PROMPT
+from prompts import AI_TUTOR_PROMPT, QUIZ_GENERATOR_PROMPT, SUMMARIZE_HISTORY_PROMPT, ROLLING_SUMMARY_PROMPT, AI_TUTOR_PROMPT_PERSONALIZED, INTENT_EXTRACTOR_PROMPT, TOPIC_GENERATOR_PROMPT, GENERAL_FALLBACK_PROMPT, SEARCH_QUERY_GENERATION_PROMPT
 from llm import LLM
-import os
-from utility.custom_libs import CustomMongoDBChatMessageHistory
+import os, threading, asyncio
+from utility.custom_libs import get_chat_history
 from langchain_core.runnables import RunnableConfig
 from utility.web_search import get_unique_image_urls
+from utility.intent_classifier import intent_classifier
+from utility.speculation import SpeculativeStream
+from utility.answer_cache import answer_cache, split_into_chunks
+from utility.prompt_cache import PromptCache
+from utility.context_packer import pack_context, packed_history_messages
+from utility.llm_scheduler import llm_scheduler, Priority, LoadShedError
+from utility.metrics import timed_node
+from utility.tracing import traced
+from langgraph.config import get_stream_writer
 
-llm = LLM().get_llm()
+llm_provider = LLM()
+llm = llm_provider.get_llm()
+
+# every LLM call goes through the global scheduler at the priority of its caller,
+# one wrapper per prompt template so call latency is reported per template
+intent_llm = llm_scheduler.bind(llm, Priority.INTERACTIVE, "intent")
+answer_llm = llm_scheduler.bind(llm, Priority.INTERACTIVE, "answer")
+fallback_llm = llm_scheduler.bind(llm, Priority.INTERACTIVE, "general_fallback")
+quiz_llm = llm_scheduler.bind(llm, Priority.QUIZ, "quiz")
+quiz_summary_llm = llm_scheduler.bind(llm, Priority.QUIZ, "quiz_history_summary")
+topic_llm = llm_scheduler.bind(llm, Priority.BACKGROUND, "topic")
+image_query_llm = llm_scheduler.bind(llm, Priority.BACKGROUND, "image_search_query")
+summary_llm = llm_scheduler.bind(llm, Priority.BACKGROUND, "rolling_summary")
+
+# Short auxiliary prompts are memoized, ttls are in seconds per template
+prompt_cache = PromptCache(
+    model_settings=llm_provider.get_settings(),
+    max_entries=int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", 1024)),
+    sqlite_path=os.getenv("PROMPT_CACHE_SQLITE_PATH"),
+    template_ttls={
+        "topic": 7 * 24 * 3600,
+        "intent": 24 * 3600,
+        "image_search_query": 24 * 3600,
+    },
+)
+
+# Start generating the explanation while the LLM intent call is still in flight
+SPECULATIVE_ANSWERING = os.getenv("SPECULATIVE_ANSWERING", "false").lower() == "true"
+
+# Refresh the stored conversation summary every N turns, prompts then carry the summary
+# plus the messages it does not cover yet (at least the last few)
+SUMMARY_EVERY_TURNS = int(os.getenv("SUMMARY_EVERY_TURNS", 4))
+VERBATIM_HISTORY_MESSAGES = 6
+# A refresh folds at most this many of the newest unsummarized messages into the summary
+SUMMARY_MAX_MESSAGES = int(os.getenv("SUMMARY_MAX_MESSAGES", 40))
+_background_tasks = set()
 
 
 class AgentState(TypedDict, total=False):
@@ -19,36 +63,141 @@ class AgentState(TypedDict, total=False):
     board: str
     personalized_response: bool
     full_explanation: str
-    messages: list[BaseMessage]
+    messages: list[dict]  # {"role", "content"} history entries, see CustomMongoDBChatMessageHistory
     stage: str
     intent: str
+    speculative_answer: SpeculativeStream | None
 
-def get_image_urls(content: str):
+@traced("get_image_urls")
+async def get_image_urls(content: str):
     search_query = SEARCH_QUERY_GENERATION_PROMPT.invoke({"text": content})
-    search_query_content = llm.invoke(search_query).content.strip()
-    return get_unique_image_urls(search_query_content, num_results=10)
-
-def get_chat_history(session_id: str):
-    return CustomMongoDBChatMessageHistory(
-        session_id=session_id,
-        connection_string=os.getenv("MONGODB_CONNECTION_STRING"),
-        database_name="neurosattva",
-        collection_name="sessions",
-        max_recent_messages=100
-    )
+    try:
+        search_query_content = await prompt_cache.aget_or_invoke("image_search_query", search_query, image_query_llm)
+    except LoadShedError as e:
+        print(f"Skipping image search: {e}")
+        return []
+    return await asyncio.to_thread(get_unique_image_urls, search_query_content, 10)
+
+def to_prompt_history(messages: list) -> list[tuple[str, str]]:
+    """
+    Convert stored history entries ({"role", "content"} dicts or messages) into prompt tuples.
+    """
+    history_msgs = []
+    for msg in messages:
+        if isinstance(msg, dict):
+            role, content = msg.get("role"), msg.get("content", "")
+        else:
+            role, content = {"human": "human", "ai": "assistant"}.get(msg.type), msg.content
+        if role in ("human", "assistant"):
+            history_msgs.append((role, content))
+    return history_msgs
+
+def format_history_text(history: list[tuple[str, str]]) -> str:
+    history_text = ""
+    for role, content in history:
+        history_text += f"{'User' if role == 'human' else 'AI'}: {content}\n"
+    return history_text
 
-def generate_topic(text: str):
+def recent_history(chat_history, messages: list) -> list[tuple[str, str]]:
+    """
+    The verbatim turns sent with a prompt: fewer when the session's rolling summary covers the rest.
+    """
+    history_msgs = to_prompt_history(messages)
+    if getattr(chat_history, "summary", ""):
+        # everything after the summary is sent, including turns added while a refresh is running
+        unsummarized = chat_history.message_count - chat_history.summary_message_count
+        return history_msgs[-max(unsummarized, VERBATIM_HISTORY_MESSAGES):]
+    return history_msgs[-10:]
+
+async def update_session_summary(chat_history):
+    """
+    Fold the messages added since the last summary into the session's rolling summary.
+    The first summary of a long session covers only its newest SUMMARY_MAX_MESSAGES messages,
+    and the prompt is packed into the token budget.
+    """
+    chat_history.summary_in_progress = True
+    try:
+        end = chat_history.message_count
+        start = max(chat_history.summary_message_count, end - SUMMARY_MAX_MESSAGES)
+        new_messages = await chat_history.store.messages_between(start, end)
+        packed = pack_context(
+            history=to_prompt_history(new_messages),
+            summary=chat_history.summary,
+            label="rolling_summary",
+        )
+        prompt = ROLLING_SUMMARY_PROMPT.invoke({
+            "summary": packed["summary"] or "(no summary yet)",
+            "history": format_history_text(packed["history"]),
+        })
+        summary = (await summary_llm.ainvoke(prompt)).content.strip()
+        await chat_history.store.save_summary(summary, end)
+        chat_history.summary, chat_history.summary_message_count = summary, end
+        print(f"Updated summary for session {chat_history.session_id} up to message {end}")
+    except Exception as e:
+        print(f"Error updating summary for session {chat_history.session_id}: {e}")
+    finally:
+        chat_history.summary_in_progress = False
+
+def schedule_summary_update(chat_history):
+    """
+    Start a background summary refresh once enough turns have accumulated.
+    """
+    if hasattr(chat_history, "needs_summary") and chat_history.needs_summary(SUMMARY_EVERY_TURNS):
+        chat_history.summary_in_progress = True
+        task = asyncio.create_task(update_session_summary(chat_history))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+async def aget_chat_history(config: RunnableConfig):
+    """
+    Return the session history store and its recent messages.
+    Uses the connection's in-memory history when the caller provided one, otherwise
+    loads it from Mongo.
+    """
+    session_history = config["configurable"].get("chat_history")
+    if session_history is not None:
+        return session_history, session_history.messages
+
+    session_id = config["configurable"]["session_id"]
+    chat_history = get_chat_history(session_id)
+    return chat_history, await chat_history.get_messages()
+
+async def generate_topic(text: str):
     prompt = TOPIC_GENERATOR_PROMPT.invoke({"text": text})
-    topic = llm.invoke(prompt).content.strip()
+    try:
+        topic = await prompt_cache.aget_or_invoke("topic", prompt, topic_llm)
+    except LoadShedError as e:
+        print(f"Using a truncated topic: {e}")
+        topic = " ".join(text.split()[:7])
     return topic
 
 
-def orchestrator_node(state: AgentState, config: RunnableConfig):
+async def orchestrator_node(state: AgentState, config: RunnableConfig):
     print("--- Orchestrator Node ---")
-    prompt = INTENT_EXTRACTOR_PROMPT.invoke({"text": state.get("question")})
-    intent = llm.invoke(prompt).content.strip()
+    # Try the local classifier first, only ambiguous inputs pay for an LLM round trip
+    intent, confidence = intent_classifier.classify(state.get("question", ""))
+    if intent is None:
+        speculation = None
+        if SPECULATIVE_ANSWERING:
+            speculation = SpeculativeStream(answer_llm, lambda: build_answer_prompt(dict(state), config))
+        try:
+            prompt = INTENT_EXTRACTOR_PROMPT.invoke({"text": state.get("question")})
+            intent = await prompt_cache.aget_or_invoke("intent", prompt, intent_llm, config)
+        except BaseException:
+            # the speculation holds an interactive scheduler slot, it must not outlive the failed turn
+            if speculation:
+                speculation.cancel()
+            raise
+        print(f"Extracted intent with LLM (local confidence {confidence:.2f}): {intent}")
+        if speculation:
+            if route_node({"intent": intent}) == "answering_node":
+                speculation.commit()
+                state["speculative_answer"] = speculation
+            else:
+                speculation.cancel()
+    else:
+        print(f"Extracted intent locally ({confidence:.2f}): {intent}")
     state["intent"] = intent  # Store the intent in the state
-    print(f"Extracted intent: {intent}")
     return state
     
 def route_node(state: AgentState):
@@ -62,83 +211,152 @@ def route_node(state: AgentState):
     else:
         return "fallback_node"
 
-def answering_node(state: AgentState, config: RunnableConfig):
-    chat_history = get_chat_history(config["configurable"]["session_id"])
-    state["messages"] = list(chat_history.messages) + state.get("messages", [])
-    history_msgs = []
-    
-    for msg in state.get("messages", []):
-        if isinstance(msg, HumanMessage):
-            history_msgs.append(("human", msg.content))
-        elif isinstance(msg, AIMessage):
-            history_msgs.append(("assistant", msg.content))
-    # passing only the last 10 messages to the AI tutor prompt
+async def build_answer_prompt(state: AgentState, config: RunnableConfig):
+    chat_history, history = await aget_chat_history(config)
+    state["messages"] = history + state.get("messages", [])
+    # question, retrieved context, recent turns and the rolling summary are packed into the token budget
+    personalized = state.get("personalized_response", False)
+    packed = pack_context(
+        question=state.get("question", ""),
+        context=state.get("context", "") if personalized else "",
+        history=recent_history(chat_history, state.get("messages", [])),
+        summary=getattr(chat_history, "summary", ""),
+        label="answering_node",
+    )
+    history_msgs = packed_history_messages(packed)
     # If personalized response is enabled, use the personalized prompt
-    if state.get("personalized_response", False):
+    if personalized:
         question = AI_TUTOR_PROMPT_PERSONALIZED.invoke({
-            "history": history_msgs[-10:],
-            "query": state.get("question"),
+            "history": history_msgs,
+            "query": packed["question"],
             "grade": state.get("grade", "10"),
-            "context": state.get("context", "")
+            "context": packed["context"]
         })
     else:
-        question = AI_TUTOR_PROMPT.invoke({"history": history_msgs[-10:], "query": state.get("question")})
+        question = AI_TUTOR_PROMPT.invoke({"history": history_msgs, "query": packed["question"]})
+    return question
+
+async def release_speculative_answer(speculation: SpeculativeStream) -> str | None:
+    """
+    Stream the chunks generated ahead of time on the custom stream.
+    Returns None when the speculative generation failed before releasing anything, the caller then
+    answers without it. A failure after part of the answer went out fails the turn, a second answer
+    would be appended to the partial one.
+    """
+    writer = get_stream_writer()
+    content = ""
+    try:
+        async for text in speculation.stream():
+            writer({"node": "answering_node", "content": text})
+            content += text
+    except Exception as e:
+        if content:
+            print(f"Speculative answer failed after {len(content)} characters: {e}")
+            raise
+        print(f"Speculative answer failed before its first chunk, answering without it: {e}")
+        return None
+    except BaseException:
+        # the turn was cancelled (e.g. the client left), stop the generation with it
+        speculation.cancel()
+        raise
+    return content.strip()
 
-    content = llm.invoke(question).content.strip()
+async def answering_node(state: AgentState, config: RunnableConfig):
+    speculation = state.get("speculative_answer")
+    content = None
+    if speculation:
+        state["speculative_answer"] = None
+        content = await release_speculative_answer(speculation)
+    if content is None:
+        question = await build_answer_prompt(state, config)
+        cache_scope, cache_embedding, content = None, None, None
+        if not answer_cache.should_bypass(state["messages"]):
+            cache_scope = answer_cache.scope(state)
+            # a verbatim repeat is answered without embedding the question
+            content = answer_cache.lookup_text(cache_scope, state.get("question", ""))
+            if content is None:
+                cache_embedding = await asyncio.to_thread(answer_cache.embed, state.get("question", ""))
+                if cache_embedding is None:
+                    answer_cache.record_embedding_error()
+            if cache_embedding is not None:
+                content = answer_cache.lookup(cache_scope, cache_embedding)
+
+        if content:
+            # replay the cached explanation as a stream
+            writer = get_stream_writer()
+            for text in split_into_chunks(content):
+                writer({"node": "answering_node", "content": text})
+                await asyncio.sleep(0)
+        else:
+            content = (await answer_llm.ainvoke(question, config)).content.strip()
+            if cache_embedding is not None:
+                answer_cache.store(cache_scope, state.get("question", ""), cache_embedding, content)
     # chat_history.add_user_message(state.get("question"))
     # chat_history.add_ai_message(content)
     state["full_explanation"] = content
     state["stage"] = "quiz_generation"
     return state
 
-def quiz_generation_node(state: AgentState, config: RunnableConfig):
+async def quiz_generation_node(state: AgentState, config: RunnableConfig):
     if not state.get("full_explanation"):
-        print("No full explanation found, summarizing history instead.")
-        chat_history = get_chat_history(config["configurable"]["session_id"])
+        chat_history, history = await aget_chat_history(config)
         
-        state["messages"] = list(chat_history.messages) + state.get("messages", [])
+        state["messages"] = history + state.get("messages", [])
         
-        history_msgs = ""
-        for msg in state.get("messages", [])[-10:]:
-            if isinstance(msg, HumanMessage):
-                history_msgs += f"User: {msg.content}\n"
-            elif isinstance(msg, AIMessage):
-                history_msgs += f"AI: {msg.content}\n"
-        summarization_prompt = SUMMARIZE_HISTORY_PROMPT.invoke({"history": history_msgs})
-        summarization = llm.invoke(summarization_prompt).content.strip()
-        state["full_explanation"] = summarization
-
-    quiz_prompt = QUIZ_GENERATOR_PROMPT.invoke({"text": state.get("full_explanation", "No explanation provided")})
-    content = llm.invoke(quiz_prompt).content.strip()
+        packed = pack_context(
+            history=recent_history(chat_history, state.get("messages", [])),
+            summary=getattr(chat_history, "summary", ""),
+            label="quiz_generation",
+        )
+        recent = format_history_text(packed["history"])
+        if packed["summary"]:
+            print("No full explanation found, using the stored conversation summary.")
+            state["full_explanation"] = f"{packed['summary']}\n\nRecent conversation:\n{recent}"
+        else:
+            print("No full explanation found, summarizing history instead.")
+            summarization_prompt = SUMMARIZE_HISTORY_PROMPT.invoke({"history": recent})
+            summarization = (await quiz_summary_llm.ainvoke(summarization_prompt, config)).content.strip()
+            state["full_explanation"] = summarization
+        quiz_source = state["full_explanation"]
+    else:
+        # a long explanation is trimmed to the budget before it is turned into a quiz
+        quiz_source = pack_context(context=state["full_explanation"], context_share=1.0, label="quiz_generation")["context"]
+
+    quiz_prompt = QUIZ_GENERATOR_PROMPT.invoke({"text": quiz_source or "No explanation provided"})
+    content = (await quiz_llm.ainvoke(quiz_prompt, config)).content.strip()
     state["quiz_question"] = content
     # print(f"final state: {state}")
     return state
 
-def fallback_node(state: AgentState, config: RunnableConfig):
-    chat_history = get_chat_history(config["configurable"]["session_id"])
-    state["messages"] = list(chat_history.messages) + state.get("messages", [])
-    history_msgs = []
-    for msg in state.get("messages", []):
-        if isinstance(msg, HumanMessage):
-            history_msgs.append(("human", msg.content))
-        elif isinstance(msg, AIMessage):
-            history_msgs.append(("assistant", msg.content))
-
-    prompt = GENERAL_FALLBACK_PROMPT.invoke({"history": history_msgs[-10:], "question": state.get("question", "")})
-    state["full_explanation"] = llm.invoke(prompt).content.strip()
-    chat_history.add_user_message(state.get("question"))
-    chat_history.add_ai_message(state.get("full_explanation"))
+async def fallback_node(state: AgentState, config: RunnableConfig):
+    chat_history, history = await aget_chat_history(config)
+    state["messages"] = history + state.get("messages", [])
+    packed = pack_context(
+        question=state.get("question", ""),
+        history=recent_history(chat_history, state.get("messages", [])),
+        summary=getattr(chat_history, "summary", ""),
+        label="fallback_node",
+    )
+
+    prompt = GENERAL_FALLBACK_PROMPT.invoke({"history": packed_history_messages(packed), "question": packed["question"]})
+    state["full_explanation"] = (await fallback_llm.ainvoke(prompt, config)).content.strip()
+    await chat_history.add_user_message(state.get("question"))
+    await chat_history.add_ai_message(state.get("full_explanation"))
     state["stage"] = "completed"
     return state
 
+def instrumented_node(name: str, node):
+    # latency histogram plus a span per node in traced turns
+    return timed_node(name, traced(f"node.{name}")(node))
+
 def build_agent():
     agent_builder = StateGraph(AgentState)
 
     # Declare node names
-    agent_builder.add_node("orchestrator", orchestrator_node)  # Orchestrator node
-    agent_builder.add_node("answering_node", answering_node)
-    agent_builder.add_node("quiz_generation", quiz_generation_node)
-    agent_builder.add_node("fallback_node", fallback_node)
+    agent_builder.add_node("orchestrator", instrumented_node("orchestrator", orchestrator_node))  # Orchestrator node
+    agent_builder.add_node("answering_node", instrumented_node("answering_node", answering_node))
+    agent_builder.add_node("quiz_generation", instrumented_node("quiz_generation", quiz_generation_node))
+    agent_builder.add_node("fallback_node", instrumented_node("fallback_node", fallback_node))
 
     # Conditional branching logic
     agent_builder.add_conditional_edges(
@@ -160,4 +378,23 @@ def build_agent():
     agent_builder.set_entry_point("orchestrator")
     agent_builder.set_finish_point("quiz_generation")
 
-    return agent_builder.compile()
\ No newline at end of file
+    return agent_builder.compile()
+
+
+# Compiled graphs hold no per-run state, so a single instance is shared by
+# every WebSocket session in the process instead of being rebuilt per connect.
+_agent_registry: dict[str, object] = {}
+_agent_registry_lock = threading.Lock()
+
+def get_agent(name: str = "ai_tutor"):
+    """
+    Return the process-wide compiled agent graph, building it on first use.
+    """
+    agent = _agent_registry.get(name)
+    if agent is None:
+        with _agent_registry_lock:
+            agent = _agent_registry.get(name)
+            if agent is None:
+                agent = build_agent()
+                _agent_registry[name] = agent
+    return agent
@@ -1,7 +1,62 @@
+import copy, os, threading
+from types import SimpleNamespace
 from google.cloud.firestore import Client
 from typing_extensions import TypedDict
 
-firestore_client = Client()
+# memory keeps documents in-process, for load tests and CI without GCP credentials
+FIRESTORE_BACKEND = os.getenv("FIRESTORE_BACKEND", "google")
+
+
+class InMemoryDocument:
+    def __init__(self, store: dict, lock: threading.Lock, key: tuple[str, str]):
+        self.store, self.lock, self.key = store, lock, key
+
+    def set(self, data: dict, merge: bool = False):
+        with self.lock:
+            current = self.store.get(self.key, {}) if merge else {}
+            self.store[self.key] = {**current, **copy.deepcopy(data)}
+
+    def get(self):
+        with self.lock:
+            data = copy.deepcopy(self.store.get(self.key))
+        return SimpleNamespace(exists=data is not None, to_dict=lambda: data)
+
+    def delete(self):
+        with self.lock:
+            self.store.pop(self.key, None)
+
+
+class InMemoryBatch:
+    def __init__(self):
+        self.writes = []
+
+    def set(self, document: InMemoryDocument, data: dict, merge: bool = False):
+        self.writes.append((document, data, merge))
+
+    def commit(self):
+        for document, data, merge in self.writes:
+            document.set(data, merge=merge)
+        self.writes = []
+
+
+class InMemoryFirestoreClient:
+    """
+    In-process stand-in for the Firestore client, selected with FIRESTORE_BACKEND=memory.
+    Covers document set (with merge), get and delete, and batched sets.
+    """
+
+    def __init__(self):
+        self.documents = {}
+        self.lock = threading.Lock()
+
+    def collection(self, name: str):
+        return SimpleNamespace(document=lambda doc_id: InMemoryDocument(self.documents, self.lock, (name, doc_id)))
+
+    def batch(self) -> InMemoryBatch:
+        return InMemoryBatch()
+
+
+firestore_client = InMemoryFirestoreClient() if FIRESTORE_BACKEND == "memory" else Client()
 
 class StudentBasicMetrics(TypedDict):
     overall_accuracy: float
@@ -33,6 +88,23 @@ class FirestoreDB:
         except Exception as e:
             raise ValueError(f"Failed to add or update document: {e}")
     
+    def add_or_update_documents(self, documents: dict[str, dict], batch_size: int = 500):
+        """
+        Add or update many documents with batched writes (Firestore allows 500 writes per batch).
+
+        :param documents: A dictionary of document ID to the data to be stored.
+        :param batch_size: The number of writes committed together.
+        """
+        items = list(documents.items())
+        try:
+            for start in range(0, len(items), batch_size):
+                batch = firestore_client.batch()
+                for doc_id, data in items[start:start + batch_size]:
+                    batch.set(self.collection.document(doc_id), data, merge=True)
+                batch.commit()
+        except Exception as e:
+            raise ValueError(f"Failed to add or update documents: {e}")
+
     def get_document(self, doc_id: str) -> dict:
         """
         Retrieve a document from the Firestore collection.
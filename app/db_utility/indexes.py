@@ -0,0 +1,121 @@
+import asyncio, os, sys
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import OperationFailure
+from db_utility.mongo_db import mongo_db
+
+# Indexes each collection needs for the queries the app runs. _id lookups (users, quizzes, sessions,
+# student_metric_counters, session_message_buckets by _id, $in and anchored _id regex) are served
+# by the default _id index.
+INDEXES: dict[str, list[IndexModel]] = {
+    # GET /chat/conversations: by user, newest first, plus the count for pagination
+    "conversations": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_id_created_at"),
+    ],
+    # one submission per user and quiz (the save-user-quiz-result upsert), the user_id prefix
+    # serves the per-user metrics scan
+    "quiz_submissions": [
+        IndexModel([("user_id", ASCENDING), ("quiz_id", ASCENDING)], name="user_id_quiz_id", unique=True),
+    ],
+}
+
+
+def hot_queries() -> dict[str, dict]:
+    """
+    The hot queries as explain commands, with placeholder values. Filters, projections, sorts and
+    pipelines come from the helpers the code runs them with, so the check follows the real queries.
+    """
+    # imported here: the routers pull in the whole app, and main.py imports this module at startup
+    from utility.auth import PROFILE_PROJECTION
+    from utility.chat import CONVERSATION_LIST_PROJECTION, CONVERSATION_LIST_SORT, conversations_query
+    from db_utility.message_buckets import SESSION_FIELDS, message_bucket_store
+    from analytics.metric_counters import (SUBMISSION_FIELDS, counters_pipeline, metric_delta, previous_answers_filter,
+                                           submission_filter, submission_update)
+
+    user_id, quiz_id, session_id = "u", "q", "s"
+    answer = {"is_correct": True, "score": 10, "difficulty": "easy", "subject": "Physics"}
+    return {
+        "conversations.list": {
+            "find": "conversations", "filter": conversations_query(user_id), "sort": dict(CONVERSATION_LIST_SORT),
+            "projection": CONVERSATION_LIST_PROJECTION, "skip": 0, "limit": 10,
+        },
+        "conversations.count": {"count": "conversations", "query": conversations_query(user_id)},
+        "quiz_submissions.upsert": {
+            "findAndModify": "quiz_submissions", "query": submission_filter(user_id, quiz_id),
+            "update": submission_update(user_id, quiz_id, answer, datetime.now()), "upsert": True,
+            "fields": SUBMISSION_FIELDS,
+        },
+        "quiz_submissions.previous_answers": {
+            "find": "quiz_submissions", "filter": previous_answers_filter(user_id, [quiz_id, f"{quiz_id}2"]),
+            "projection": SUBMISSION_FIELDS,
+        },
+        "quiz_submissions.counters": {"aggregate": "quiz_submissions", "pipeline": counters_pipeline(user_id), "cursor": {}},
+        "users.profile": {"find": "users", "filter": {"_id": user_id}, "projection": PROFILE_PROJECTION},
+        "student_metric_counters.delta": {
+            "findAndModify": "student_metric_counters", "query": {"_id": user_id},
+            "update": {"$inc": {**metric_delta(None, answer), "updates": 1}}, "new": True,
+        },
+        "sessions.by_id": {"find": "sessions", "filter": {"_id": session_id}, "projection": SESSION_FIELDS},
+        "session_message_buckets.range": {
+            "find": "session_message_buckets", "filter": message_bucket_store.range_filter(session_id, 0, 100),
+            "projection": {"messages": 1},
+        },
+    }
+
+
+async def ensure_indexes(database: AsyncDatabase = mongo_db):
+    """
+    Create the registered indexes. Existing indexes are left alone, so this is cheap on every startup.
+    A collection whose index cannot be built (e.g. duplicates under a unique index) is reported, not fatal.
+    """
+    for collection_name, indexes in INDEXES.items():
+        try:
+            names = await database[collection_name].create_indexes(indexes)
+            print(f"Indexes ensured on {collection_name}: {', '.join(names)}")
+        except OperationFailure as e:
+            print(f"Error creating indexes on {collection_name}: {e}")
+
+
+def plan_stages(plan: dict):
+    """
+    Every stage name in a query plan tree.
+    """
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(key), dict):
+            yield from plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from plan_stages(child)
+
+
+async def collection_scans(database: AsyncDatabase = mongo_db) -> dict[str, list[str]]:
+    """
+    Explain each hot query and return the stages of the winning plan, for queries that scan a collection.
+    """
+    scans = {}
+    for name, command in hot_queries().items():
+        explained = await database.command("explain", command, verbosity="queryPlanner")
+        # aggregations that are not pushed down entirely report the query under their first stage
+        planner = explained.get("queryPlanner") or explained["stages"][0]["$cursor"]["queryPlanner"]
+        stages = list(filter(None, plan_stages(planner["winningPlan"])))
+        if "COLLSCAN" in stages:
+            scans[name] = stages
+    return scans
+
+
+async def verify(database: AsyncDatabase = mongo_db) -> int:
+    await ensure_indexes(database)
+    scans = await collection_scans(database)
+    for name, stages in scans.items():
+        print(f"FAILED: {name} scans the collection ({' -> '.join(reversed(stages))})")
+    total = len(hot_queries())
+    print(f"{total - len(scans)}/{total} hot queries use an index")
+    return 1 if scans else 0
+
+
+if __name__ == "__main__":
+    # Query plan check against a local or staging server: python -m db_utility.indexes
+    if os.getenv("MONGODB_CONNECTION_STRING", "").startswith("memory://"):
+        sys.exit("Query plans need a real MongoDB server, MONGODB_CONNECTION_STRING is memory://")
+    sys.exit(asyncio.run(verify()))
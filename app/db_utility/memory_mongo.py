@@ -0,0 +1,572 @@
+import copy, itertools, re, threading, time
+from types import SimpleNamespace
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+
+class InMemoryMongoClient:
+    """
+    In-process stand-in for MongoClient, selected with MONGODB_CONNECTION_STRING=memory://.
+    Covers the subset of the collection API the app uses and reports every call to the
+    command listeners so round trips can be counted like against a real server.
+    """
+
+    def __init__(self, event_listeners=None):
+        self.event_listeners = list(event_listeners or [])
+        self.databases = {}
+        self.lock = threading.Lock()
+        self._request_ids = itertools.count(1)
+
+    def __getitem__(self, name: str) -> "InMemoryDatabase":
+        with self.lock:
+            if name not in self.databases:
+                self.databases[name] = InMemoryDatabase(self, name)
+            return self.databases[name]
+
+    def get_database(self, name: str) -> "InMemoryDatabase":
+        return self[name]
+
+    def _command(self, database_name: str, command_name: str, run):
+        event = SimpleNamespace(command_name=command_name, database_name=database_name,
+                                request_id=next(self._request_ids), duration_micros=0)
+        for listener in self.event_listeners:
+            listener.started(event)
+        started_at = time.perf_counter()
+        result = run()
+        event.duration_micros = int((time.perf_counter() - started_at) * 1_000_000)
+        for listener in self.event_listeners:
+            listener.succeeded(event)
+        return result
+
+    def close(self):
+        pass
+
+
+class InMemoryDatabase:
+    def __init__(self, client: InMemoryMongoClient, name: str):
+        self.client = client
+        self.name = name
+        self.collections = {}
+
+    def __getitem__(self, name: str) -> "InMemoryCollection":
+        with self.client.lock:
+            if name not in self.collections:
+                self.collections[name] = InMemoryCollection(self, name)
+            return self.collections[name]
+
+    def get_collection(self, name: str) -> "InMemoryCollection":
+        return self[name]
+
+
+def _lookup(doc: dict, path: str):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return False, None
+        value = value[part]
+    return True, value
+
+
+def _compare(found, value, arg, op) -> bool:
+    if not found or value is None:
+        return False
+    try:
+        return op(value, arg)
+    except TypeError:
+        return False
+
+
+_OPERATORS = {
+    "$eq": lambda found, value, arg: value == arg,
+    "$ne": lambda found, value, arg: value != arg,
+    "$in": lambda found, value, arg: value in arg or (isinstance(value, list) and any(v in arg for v in value)),
+    "$nin": lambda found, value, arg: value not in arg,
+    "$exists": lambda found, value, arg: found == bool(arg),
+    "$lt": lambda found, value, arg: _compare(found, value, arg, lambda a, b: a < b),
+    "$lte": lambda found, value, arg: _compare(found, value, arg, lambda a, b: a <= b),
+    "$gt": lambda found, value, arg: _compare(found, value, arg, lambda a, b: a > b),
+    "$gte": lambda found, value, arg: _compare(found, value, arg, lambda a, b: a >= b),
+    "$regex": lambda found, value, arg: isinstance(value, str) and re.search(arg, value) is not None,
+}
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, sub_query) for sub_query in condition):
+                return False
+            continue
+        if key == "$and":
+            if not all(matches(doc, sub_query) for sub_query in condition):
+                return False
+            continue
+        found, value = _lookup(doc, key)
+        if isinstance(condition, dict) and condition and all(op.startswith("$") for op in condition):
+            if not all(_OPERATORS[op](found, value, arg) for op, arg in condition.items()):
+                return False
+        elif not (found and (value == condition or (isinstance(value, list) and condition in value))):
+            return False
+    return True
+
+
+def _set_path(doc: dict, path: str, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def _unset_path(doc: dict, path: str):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.get(part, {})
+    doc.pop(last, None)
+
+
+def apply_update(doc: dict, update: dict, inserting: bool = False):
+    for op, fields in update.items():
+        if op == "$setOnInsert" and not inserting:
+            continue
+        for path, arg in fields.items():
+            found, current = _lookup(doc, path)
+            if op in ("$set", "$setOnInsert"):
+                _set_path(doc, path, copy.deepcopy(arg))
+            elif op == "$unset":
+                _unset_path(doc, path)
+            elif op == "$inc":
+                _set_path(doc, path, (current if found else 0) + arg)
+            elif op == "$max":
+                _set_path(doc, path, arg if not found or arg > current else current)
+            elif op == "$min":
+                _set_path(doc, path, arg if not found or arg < current else current)
+            elif op in ("$push", "$addToSet"):
+                items = arg["$each"] if isinstance(arg, dict) and "$each" in arg else [arg]
+                array = current if found else []
+                for item in items:
+                    if op == "$push" or item not in array:
+                        array.append(copy.deepcopy(item))
+                _set_path(doc, path, array)
+            elif op == "$pull":
+                _set_path(doc, path, [item for item in (current if found else []) if item != arg])
+            else:
+                raise NotImplementedError(f"Update operator {op} is not supported in memory")
+
+
+def project(doc: dict, projection) -> dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    included = {field for field, flag in projection.items() if flag and field != "_id"}
+    if included or projection.get("_id") and len(projection) == 1:
+        result = {field: copy.deepcopy(doc[field]) for field in included if field in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    return {field: copy.deepcopy(value) for field, value in doc.items() if projection.get(field, 1)}
+
+
+def _sort_key(value):
+    # missing values sort first, like null in MongoDB
+    return (0, 0) if value is None else (1, value)
+
+
+def evaluate(doc: dict, expression):
+    """
+    Aggregation expressions: field paths, literals, $ifNull, $cond, $in and $eq.
+    """
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _lookup(doc, expression[1:])[1]
+    if isinstance(expression, list):
+        return [evaluate(doc, item) for item in expression]
+    if not isinstance(expression, dict) or not expression:
+        return expression
+    (op, args), = expression.items()
+    if op == "$ifNull":
+        value = evaluate(doc, args[0])
+        return evaluate(doc, args[1]) if value is None else value
+    if op == "$cond":
+        condition, then, otherwise = args if isinstance(args, list) else (args["if"], args["then"], args["else"])
+        return evaluate(doc, then) if evaluate(doc, condition) not in (None, False, 0) else evaluate(doc, otherwise)
+    if op == "$in":
+        return evaluate(doc, args[0]) in evaluate(doc, args[1])
+    if op == "$eq":
+        return evaluate(doc, args[0]) == evaluate(doc, args[1])
+    raise NotImplementedError(f"Expression operator {op} is not supported in memory")
+
+
+def _group(docs: list[dict], spec: dict) -> list[dict]:
+    groups = {}
+    for doc in docs:
+        key = evaluate(doc, spec["_id"])
+        group = groups.setdefault(repr(key), {"_id": key})
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            (op, expression), = accumulator.items()
+            if op != "$sum":
+                raise NotImplementedError(f"Accumulator {op} is not supported in memory")
+            value = evaluate(doc, expression)
+            group[field] = group.get(field, 0) + (value if isinstance(value, (int, float)) else 0)
+    return list(groups.values())
+
+
+def run_pipeline(docs: list[dict], pipeline: list[dict]) -> list[dict]:
+    for stage in pipeline:
+        (op, spec), = stage.items()
+        if op == "$match":
+            docs = [doc for doc in docs if matches(doc, spec)]
+        elif op == "$group":
+            docs = _group(docs, spec)
+        elif op == "$facet":
+            docs = [{name: run_pipeline(docs, sub_pipeline) for name, sub_pipeline in spec.items()}]
+        elif op == "$sort":
+            for key, direction in reversed(list(spec.items())):
+                docs.sort(key=lambda doc: _sort_key(_lookup(doc, key)[1]), reverse=direction < 0)
+        elif op == "$limit":
+            docs = docs[:spec]
+        else:
+            raise NotImplementedError(f"Pipeline stage {op} is not supported in memory")
+    return docs
+
+
+class InMemoryCursor:
+    def __init__(self, collection: "InMemoryCollection", query: dict, projection):
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction: int = 1):
+        self._sort = list(key) if isinstance(key, list) else [(key, direction)]
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def _run(self) -> list[dict]:
+        with self.collection.lock:
+            docs = [doc for doc in self.collection.documents.values() if matches(doc, self.query)]
+            for key, direction in reversed(self._sort):
+                docs.sort(key=lambda doc: _sort_key(_lookup(doc, key)[1]), reverse=direction < 0)
+            docs = docs[self._skip:]
+            if self._limit:
+                docs = docs[:self._limit]
+            return [project(doc, self.projection) for doc in docs]
+
+    def __iter__(self):
+        return iter(self.collection._command("find", self._run))
+
+    def to_list(self, length=None) -> list[dict]:
+        docs = list(self)
+        return docs[:length] if length else docs
+
+
+class InMemoryCollection:
+    def __init__(self, database: InMemoryDatabase, name: str):
+        self.database = database
+        self.name = name
+        self.documents: dict = {}
+        self.indexes: dict = {}
+        self.lock = threading.RLock()
+
+    def _command(self, command_name: str, run):
+        return self.database.client._command(self.database.name, command_name, run)
+
+    def _upsert_document(self, query: dict, update: dict) -> dict:
+        doc = {
+            key: copy.deepcopy(value)
+            for key, value in query.items()
+            if not key.startswith("$") and not (isinstance(value, dict) and any(k.startswith("$") for k in value))
+        }
+        apply_update(doc, update, inserting=True)
+        doc.setdefault("_id", ObjectId())
+        self.documents[doc["_id"]] = doc
+        return doc
+
+    def _first(self, query: dict):
+        return next((doc for doc in self.documents.values() if matches(doc, query)), None)
+
+    def find(self, query: dict = None, projection=None) -> InMemoryCursor:
+        return InMemoryCursor(self, query or {}, projection)
+
+    def find_one(self, query: dict = None, projection=None):
+        def run():
+            with self.lock:
+                doc = self._first(query or {})
+                return project(doc, projection) if doc is not None else None
+        return self._command("find", run)
+
+    def aggregate(self, pipeline: list[dict]) -> list[dict]:
+        def run():
+            with self.lock:
+                return copy.deepcopy(run_pipeline(list(self.documents.values()), pipeline))
+        return self._command("aggregate", run)
+
+    def distinct(self, key: str, query: dict = None) -> list:
+        def run():
+            with self.lock:
+                values = []
+                for doc in self.documents.values():
+                    found, value = _lookup(doc, key)
+                    if found and matches(doc, query or {}) and value not in values:
+                        values.append(value)
+                return values
+        return self._command("distinct", run)
+
+    def count_documents(self, query: dict) -> int:
+        def run():
+            with self.lock:
+                return sum(1 for doc in self.documents.values() if matches(doc, query))
+        return self._command("aggregate", run)
+
+    def insert_one(self, document: dict):
+        def run():
+            with self.lock:
+                document.setdefault("_id", ObjectId())
+                if document["_id"] in self.documents:
+                    raise DuplicateKeyError(f"Duplicate key {document['_id']} in {self.name}")
+                self.documents[document["_id"]] = copy.deepcopy(document)
+                return SimpleNamespace(acknowledged=True, inserted_id=document["_id"])
+        return self._command("insert", run)
+
+    def insert_many(self, documents: list[dict], ordered: bool = True):
+        def run():
+            with self.lock:
+                for document in documents:
+                    document.setdefault("_id", ObjectId())
+                    self.documents[document["_id"]] = copy.deepcopy(document)
+                return SimpleNamespace(acknowledged=True, inserted_ids=[d["_id"] for d in documents])
+        return self._command("insert", run)
+
+    def update_one(self, query: dict, update: dict, upsert: bool = False):
+        def run():
+            with self.lock:
+                doc = self._first(query)
+                if doc is not None:
+                    apply_update(doc, update)
+                    return SimpleNamespace(acknowledged=True, matched_count=1, modified_count=1, upserted_id=None)
+                if upsert:
+                    doc = self._upsert_document(query, update)
+                    return SimpleNamespace(acknowledged=True, matched_count=0, modified_count=0, upserted_id=doc["_id"])
+                return SimpleNamespace(acknowledged=True, matched_count=0, modified_count=0, upserted_id=None)
+        return self._command("update", run)
+
+    def update_many(self, query: dict, update: dict, upsert: bool = False):
+        def run():
+            with self.lock:
+                docs = [doc for doc in self.documents.values() if matches(doc, query)]
+                for doc in docs:
+                    apply_update(doc, update)
+                upserted_id = self._upsert_document(query, update)["_id"] if upsert and not docs else None
+                return SimpleNamespace(acknowledged=True, matched_count=len(docs), modified_count=len(docs),
+                                       upserted_id=upserted_id)
+        return self._command("update", run)
+
+    def replace_one(self, query: dict, replacement: dict, upsert: bool = False):
+        def run():
+            with self.lock:
+                doc = self._first(query)
+                if doc is None and not upsert:
+                    return SimpleNamespace(acknowledged=True, matched_count=0, modified_count=0, upserted_id=None)
+                _id = doc["_id"] if doc is not None else query.get("_id", ObjectId())
+                self.documents[_id] = {**copy.deepcopy(replacement), "_id": _id}
+                return SimpleNamespace(acknowledged=True, matched_count=int(doc is not None),
+                                       modified_count=int(doc is not None), upserted_id=None if doc else _id)
+        return self._command("update", run)
+
+    def find_one_and_update(self, query: dict, update: dict, projection=None, upsert: bool = False,
+                            return_document: bool = False):
+        def run():
+            with self.lock:
+                doc = self._first(query)
+                if doc is None:
+                    if not upsert:
+                        return None
+                    doc = self._upsert_document(query, update)
+                    return project(doc, projection) if return_document else None
+                before = copy.deepcopy(doc)
+                apply_update(doc, update)
+                return project(doc if return_document else before, projection)
+        return self._command("findAndModify", run)
+
+    def delete_one(self, query: dict):
+        def run():
+            with self.lock:
+                doc = self._first(query)
+                if doc is not None:
+                    del self.documents[doc["_id"]]
+                return SimpleNamespace(acknowledged=True, deleted_count=int(doc is not None))
+        return self._command("delete", run)
+
+    def bulk_write(self, requests: list, ordered: bool = True):
+        # UpdateOne requests only, applied one by one under the collection lock
+        def run():
+            with self.lock:
+                upserted, errors, matched = {}, [], 0
+                for index, request in enumerate(requests):
+                    try:
+                        doc = self._first(request._filter)
+                        if doc is not None:
+                            apply_update(doc, request._doc)
+                            matched += 1
+                        elif request._upsert:
+                            upserted[index] = self._upsert_document(request._filter, request._doc)["_id"]
+                    except Exception as e:
+                        errors.append({"index": index, "code": 2, "errmsg": str(e)})
+                        if ordered:
+                            break
+                if errors:
+                    raise BulkWriteError({
+                        "writeErrors": errors, "nMatched": matched, "nModified": matched,
+                        "nUpserted": len(upserted),
+                        "upserted": [{"index": index, "_id": _id} for index, _id in upserted.items()],
+                    })
+                return SimpleNamespace(acknowledged=True, matched_count=matched, modified_count=matched,
+                                       upserted_count=len(upserted), upserted_ids=upserted)
+        return self._command("update", run)
+
+    def create_indexes(self, indexes: list) -> list[str]:
+        # recorded only, queries always scan in memory
+        def run():
+            with self.lock:
+                for index in indexes:
+                    self.indexes[index.document["name"]] = index.document
+                return [index.document["name"] for index in indexes]
+        return self._command("createIndexes", run)
+
+    def delete_many(self, query: dict):
+        def run():
+            with self.lock:
+                ids = [doc["_id"] for doc in self.documents.values() if matches(doc, query)]
+                for _id in ids:
+                    del self.documents[_id]
+                return SimpleNamespace(acknowledged=True, deleted_count=len(ids))
+        return self._command("delete", run)
+
+
+class AsyncInMemoryMongoClient:
+    """
+    Stand-in for AsyncMongoClient over InMemoryMongoClient. Calls complete inline since there is
+    no I/O to wait on, the coroutine interface only matches the real driver.
+    """
+
+    def __init__(self, event_listeners=None):
+        self.sync_client = InMemoryMongoClient(event_listeners=event_listeners)
+
+    def __getitem__(self, name: str) -> "AsyncInMemoryDatabase":
+        return AsyncInMemoryDatabase(self.sync_client[name])
+
+    def get_database(self, name: str) -> "AsyncInMemoryDatabase":
+        return self[name]
+
+    async def close(self):
+        self.sync_client.close()
+
+
+class AsyncInMemoryDatabase:
+    def __init__(self, database: InMemoryDatabase):
+        self.database = database
+        self.name = database.name
+
+    def __getitem__(self, name: str) -> "AsyncInMemoryCollection":
+        return AsyncInMemoryCollection(self.database[name])
+
+    def get_collection(self, name: str) -> "AsyncInMemoryCollection":
+        return self[name]
+
+
+class AsyncInMemoryCursor:
+    def __init__(self, cursor: InMemoryCursor):
+        self.cursor = cursor
+
+    def sort(self, key, direction: int = 1):
+        self.cursor.sort(key, direction)
+        return self
+
+    def skip(self, count: int):
+        self.cursor.skip(count)
+        return self
+
+    def limit(self, count: int):
+        self.cursor.limit(count)
+        return self
+
+    async def __aiter__(self):
+        for doc in self.cursor:
+            yield doc
+
+    async def to_list(self, length=None) -> list[dict]:
+        return self.cursor.to_list(length)
+
+
+class _ResultCursor:
+    def __init__(self, docs: list[dict]):
+        self.docs = docs
+
+    def __iter__(self):
+        return iter(self.docs)
+
+    def to_list(self, length=None) -> list[dict]:
+        return self.docs[:length] if length else list(self.docs)
+
+
+class AsyncInMemoryCollection:
+    def __init__(self, collection: InMemoryCollection):
+        self.collection = collection
+        self.name = collection.name
+
+    def find(self, query: dict = None, projection=None) -> AsyncInMemoryCursor:
+        return AsyncInMemoryCursor(self.collection.find(query, projection))
+
+    async def find_one(self, query: dict = None, projection=None):
+        return self.collection.find_one(query, projection)
+
+    async def aggregate(self, pipeline: list[dict]) -> AsyncInMemoryCursor:
+        # like AsyncCollection.aggregate, awaiting returns a cursor
+        return AsyncInMemoryCursor(_ResultCursor(self.collection.aggregate(pipeline)))
+
+    async def distinct(self, key: str, query: dict = None) -> list:
+        return self.collection.distinct(key, query)
+
+    async def count_documents(self, query: dict) -> int:
+        return self.collection.count_documents(query)
+
+    async def insert_one(self, document: dict):
+        return self.collection.insert_one(document)
+
+    async def insert_many(self, documents: list[dict], ordered: bool = True):
+        return self.collection.insert_many(documents, ordered=ordered)
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        return self.collection.update_one(query, update, upsert=upsert)
+
+    async def update_many(self, query: dict, update: dict, upsert: bool = False):
+        return self.collection.update_many(query, update, upsert=upsert)
+
+    async def replace_one(self, query: dict, replacement: dict, upsert: bool = False):
+        return self.collection.replace_one(query, replacement, upsert=upsert)
+
+    async def find_one_and_update(self, query: dict, update: dict, projection=None, upsert: bool = False,
+                                  return_document: bool = False):
+        return self.collection.find_one_and_update(query, update, projection=projection, upsert=upsert,
+                                                   return_document=return_document)
+
+    async def delete_one(self, query: dict):
+        return self.collection.delete_one(query)
+
+    async def delete_many(self, query: dict):
+        return self.collection.delete_many(query)
+
+    async def bulk_write(self, requests: list, ordered: bool = True):
+        return self.collection.bulk_write(requests, ordered=ordered)
+
+    async def create_indexes(self, indexes: list) -> list[str]:
+        return self.collection.create_indexes(indexes)
@@ -0,0 +1,167 @@
+import asyncio, re
+from pymongo import ReturnDocument
+from pymongo.asynchronous.database import AsyncDatabase
+from db_utility.mongo_db import mongo_db
+
+BUCKET_SIZE = 50
+SESSION_FIELDS = {"message_count": 1, "summary": 1, "summary_message_count": 1}
+
+
+class MessageBucketStore:
+    """
+    Stores a session's messages in fixed-size bucket documents instead of one ever-growing array.
+
+    sessions:                 {_id: session_id, message_count: int, summary: str, summary_message_count: int}
+    session_message_buckets:  {_id: "<session_id>:<bucket>", session_id, bucket, messages: [{seq, ...}]}
+
+    Message number `seq` lives in bucket seq // bucket_size, so any page of messages is read
+    from at most a couple of bucket documents regardless of the conversation length.
+    """
+
+    def __init__(self, database: AsyncDatabase, bucket_size: int = BUCKET_SIZE):
+        self.sessions = database["sessions"]
+        self.buckets = database["session_message_buckets"]
+        self.bucket_size = bucket_size
+
+    @staticmethod
+    def bucket_id(session_id: str, bucket: int) -> str:
+        return f"{session_id}:{bucket:08d}"
+
+    async def count(self, session_id: str) -> int:
+        doc = await self.sessions.find_one({"_id": session_id}, {"message_count": 1})
+        return doc.get("message_count", 0) if doc else 0
+
+    async def get_session(self, session_id: str) -> dict:
+        return await self.sessions.find_one({"_id": session_id}, SESSION_FIELDS) or {}
+
+    async def save_summary(self, session_id: str, summary: str, summary_message_count: int) -> None:
+        """
+        Store the rolling summary covering the first summary_message_count messages,
+        unless a summary covering more messages was already saved or the session was cleared
+        (fewer messages than the summary covers) while it was being written.
+        """
+        await self.sessions.update_one(
+            {
+                "_id": session_id,
+                "message_count": {"$gte": summary_message_count},
+                "$or": [
+                    {"summary_message_count": {"$exists": False}},
+                    {"summary_message_count": {"$lt": summary_message_count}},
+                ],
+            },
+            {"$set": {"summary": summary, "summary_message_count": summary_message_count}},
+        )
+
+    async def append(self, session_id: str, message: dict) -> int:
+        """
+        Append a message and return its sequence number. Creates the session on first write.
+        """
+        session = await self.sessions.find_one_and_update(
+            {"_id": session_id},
+            {"$inc": {"message_count": 1}},
+            projection={"message_count": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        seq = session["message_count"] - 1
+        bucket = seq // self.bucket_size
+        await self.buckets.update_one(
+            {"_id": self.bucket_id(session_id, bucket)},
+            {
+                "$push": {"messages": {**message, "seq": seq}},
+                "$setOnInsert": {"session_id": session_id, "bucket": bucket},
+            },
+            upsert=True,
+        )
+        return seq
+
+    def range_filter(self, session_id: str, start: int, end: int) -> dict:
+        """
+        The buckets holding messages start <= seq < end (end > start).
+        """
+        bucket_ids = [
+            self.bucket_id(session_id, bucket)
+            for bucket in range(start // self.bucket_size, (end - 1) // self.bucket_size + 1)
+        ]
+        return {"_id": {"$in": bucket_ids}}
+
+    async def read_range(self, session_id: str, start: int, end: int) -> list[dict]:
+        """
+        Messages with start <= seq < end, oldest first.
+        """
+        if end <= start:
+            return []
+        docs = await self.buckets.find(self.range_filter(session_id, start, end), {"messages": 1}).to_list()
+        messages = [
+            message
+            for doc in docs
+            for message in doc.get("messages", [])
+            if start <= message.get("seq", -1) < end
+        ]
+        # concurrent appends may land in a bucket out of order
+        messages.sort(key=lambda m: m["seq"])
+        for message in messages:
+            message.pop("seq", None)
+        return messages
+
+    async def read_recent(self, session_id: str, limit: int, total: int | None = None) -> list[dict]:
+        if total is None:
+            total = await self.count(session_id)
+        return await self.read_range(session_id, max(total - limit, 0), total)
+
+    async def read_page(self, session_id: str, limit: int, offset: int) -> tuple[list[dict], int]:
+        """
+        A page counted back from the newest message, returned oldest first with the total count.
+        """
+        total = await self.count(session_id)
+        end = max(total - offset, 0)
+        return await self.read_range(session_id, max(end - limit, 0), end), total
+
+    async def clear(self, session_id: str) -> None:
+        await self.buckets.delete_many({"_id": {"$regex": f"^{re.escape(session_id)}:"}})
+        # the rolling summary describes the deleted messages, it goes with them
+        await self.sessions.update_one(
+            {"_id": session_id},
+            {"$set": {"message_count": 0}, "$unset": {"summary": "", "summary_message_count": ""}},
+        )
+
+    async def migrate_session(self, session_doc: dict) -> int:
+        """
+        Move a legacy session document's `messages` array into buckets. Safe to re-run.
+        """
+        session_id = session_doc["_id"]
+        messages = session_doc.get("messages", [])
+        for bucket, start in enumerate(range(0, len(messages), self.bucket_size)):
+            chunk = [{**message, "seq": start + i} for i, message in enumerate(messages[start:start + self.bucket_size])]
+            await self.buckets.replace_one(
+                {"_id": self.bucket_id(session_id, bucket)},
+                {"session_id": session_id, "bucket": bucket, "messages": chunk},
+                upsert=True,
+            )
+        await self.sessions.update_one(
+            {"_id": session_id},
+            {"$set": {"message_count": len(messages)}, "$unset": {"messages": ""}},
+        )
+        return len(messages)
+
+    async def migrate_all(self) -> tuple[int, int]:
+        """
+        Migrate every legacy session. Run while tutor writes are stopped, a legacy session
+        that receives an append before it is migrated would reuse sequence numbers.
+        """
+        sessions_migrated, messages_migrated = 0, 0
+        async for session_doc in self.sessions.find({"messages": {"$exists": True}}):
+            messages_migrated += await self.migrate_session(session_doc)
+            sessions_migrated += 1
+            if sessions_migrated % 100 == 0:
+                print(f"Migrated {sessions_migrated} sessions, {messages_migrated} messages")
+        return sessions_migrated, messages_migrated
+
+
+message_bucket_store = MessageBucketStore(mongo_db)
+
+
+if __name__ == "__main__":
+    # One-off migration of legacy sessions: python -m db_utility.message_buckets
+    sessions_migrated, messages_migrated = asyncio.run(message_bucket_store.migrate_all())
+    print(f"Done, migrated {sessions_migrated} sessions and {messages_migrated} messages into buckets")
@@ -1,9 +1,15 @@
-from pymongo import MongoClient
-from pymongo.collection import Collection
-from pymongo.database import Database
+from pymongo import AsyncMongoClient, monitoring
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
 from typing import TypedDict, Optional
 from datetime import datetime
-import os
+from collections import Counter
+import os, threading
+from db_utility.memory_mongo import AsyncInMemoryMongoClient
+from utility.metrics import mongo_command_seconds
+
+# Connections per server in the shared pool, across all routers and the chat history store
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
 
 
 class idInfo(TypedDict):
@@ -34,26 +40,64 @@ class QuizSchema(TypedDict):
     answer_explanation: str
     created_at: datetime
 
+class MongoCommandCounter(monitoring.CommandListener):
+    """
+    Counts the commands (server round trips) sent by the shared client, by command name,
+    and records their durations.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    def started(self, event):
+        with self.lock:
+            self.counts[event.command_name] += 1
+
+    def succeeded(self, event):
+        mongo_command_seconds.labels(event.command_name, "succeeded").observe(event.duration_micros / 1_000_000)
+
+    def failed(self, event):
+        mongo_command_seconds.labels(event.command_name, "failed").observe(event.duration_micros / 1_000_000)
+
+    def snapshot(self) -> dict[str, int]:
+        with self.lock:
+            return dict(self.counts)
+
+    def total(self) -> int:
+        with self.lock:
+            return sum(self.counts.values())
+
+
+mongo_command_counter = MongoCommandCounter()
+
 class MongoDBClient:
     """
-    A class to interact with MongoDB.
+    A class to interact with MongoDB through the async driver, so round trips never block the event loop.
+    The client binds to the event loop that first uses it.
     """
 
     def __init__(self, database_name: str):
         self.connection_string = os.getenv("MONGODB_CONNECTION_STRING")
         if not self.connection_string:
             raise ValueError("MONGODB_CONNECTION_STRING environment variable is not set.")
-        self.client = MongoClient(self.connection_string)
-        self.database: Database = self.client[database_name]
+        if self.connection_string.startswith("memory://"):
+            # in-process stand-in for load tests and CI
+            self.client = AsyncInMemoryMongoClient(event_listeners=[mongo_command_counter])
+        else:
+            # single pooled client for the whole process
+            self.client = AsyncMongoClient(self.connection_string, maxPoolSize=MONGO_MAX_POOL_SIZE,
+                                           event_listeners=[mongo_command_counter])
+        self.database: AsyncDatabase = self.client[database_name]
         # self.user_collection: Collection = self.database["users"]
         # self.session_collection: Collection = self.database["sessions"]
         # self.quiz_collection: Collection = self.database["quizzes"]
 
-    def get_collection(self, collection_name: str) -> Collection:
+    def get_collection(self, collection_name: str) -> AsyncCollection:
         return self.database[collection_name]
 
-    def close(self):
-        self.client.close()
+    async def close(self):
+        await self.client.close()
 
 mongo_db = MongoDBClient(database_name="neurosattva").database
     
\ No newline at end of file
@@ -1,28 +1,80 @@
 # using milvus vector db
-import os
-from pymilvus import MilvusClient
+import os, hashlib, math, re
 from google import genai
 from google.genai import types
-
-embedding_client = genai.Client()
+from utility.cassette import cassette
+from utility.metrics import timed_dependency
+from utility.tracing import traced
 
 MILVUS_URI = os.getenv('MILVUS_URI')
 MILVUS_TOKEN = os.getenv('MILVUS_TOKEN')
 COLLECTION_NAME = os.getenv('MILVUS_COLLECTION_NAME')
 VECTOR_DIMENSION = int(os.getenv('MILVUS_VECTOR_DIMENSION', 768))
+# memory:// runs retrieval and embeddings in-process, for load tests and CI
+OFFLINE_VECTOR_STORE = (MILVUS_URI or "").startswith("memory://")
+
+embedding_client = None if OFFLINE_VECTOR_STORE or cassette.replaying else genai.Client()
+
+OFFLINE_DOCUMENTS = [
+    {"board": "CBSE", "grade": "10th", "subject": "Science", "chapter": "Life Processes", "subheading": "Photosynthesis",
+     "content": "Photosynthesis is the process by which green plants make food from carbon dioxide and water using sunlight."},
+    {"board": "CBSE", "grade": "10th", "subject": "Science", "chapter": "Light", "subheading": "Reflection of light",
+     "content": "Light reflects from a smooth surface so that the angle of incidence equals the angle of reflection."},
+    {"board": "CBSE", "grade": "9th", "subject": "Science", "chapter": "Force and Laws of Motion", "subheading": "Newton's third law",
+     "content": "For every action there is an equal and opposite reaction, the two forces act on different bodies."},
+    {"board": "CBSE", "grade": "9th", "subject": "Science", "chapter": "Matter in Our Surroundings", "subheading": "States of matter",
+     "content": "Matter exists as solid, liquid and gas, and changes state when heat is added or removed."},
+]
+
+
+class InMemoryMilvusClient:
+    """
+    In-process stand-in for MilvusClient.search over a handful of sample syllabus chunks.
+    """
+
+    def __init__(self, documents: list[dict] = OFFLINE_DOCUMENTS):
+        self.rows = [
+            {"embedding": offline_embedding(doc["content"], VECTOR_DIMENSION), "metadata_json": doc}
+            for doc in documents
+        ]
+
+    def search(self, collection_name, anns_field, data, search_params=None, limit=3, output_fields=None):
+        results = []
+        for query in data:
+            scored = sorted(
+                ((sum(a * b for a, b in zip(query, row["embedding"])), row) for row in self.rows),
+                key=lambda scored_row: scored_row[0], reverse=True,
+            )
+            results.append([
+                {"distance": score, "entity": {"metadata_json": row["metadata_json"]}}
+                for score, row in scored[:limit]
+            ])
+        return results
+
 
 class VectorDB:
     def __init__(self):
-        self.client = MilvusClient(uri=MILVUS_URI, token=MILVUS_TOKEN)
+        if OFFLINE_VECTOR_STORE:
+            self.client = InMemoryMilvusClient()
+        else:
+            # imported here: pymilvus parses MILVUS_URI on import and rejects memory://
+            from pymilvus import MilvusClient
+            self.client = MilvusClient(uri=MILVUS_URI, token=MILVUS_TOKEN)
         self.similarity_score_threshold = 0.8  # Example threshold for similarity score
 
+    @traced("milvus_search")
+    @timed_dependency("milvus_search")
+    def _search(self, **kwargs):
+        return self.client.search(**kwargs)
+
+    @traced("vector_db.get_similar_documents")
     def get_similar_documents(self, text, top_k=3):
         """
         Retrieves similar documents from the Milvus vector database.
         """
         try:
             query_embedding = generate_embedding(text, vector_dimension=VECTOR_DIMENSION)
-            results = self.client.search(
+            results = self._search(
             collection_name=COLLECTION_NAME,
             anns_field="embedding",
             data=[query_embedding],
@@ -47,10 +99,30 @@ class VectorDB:
 
 
 
+def offline_embedding(text, vector_dimension=768):
+    """
+    Deterministic hashed bag-of-words embedding, texts sharing words get similar vectors.
+    """
+    vector = [0.0] * vector_dimension
+    for word in re.findall(r"\w+", text.lower()):
+        vector[int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % vector_dimension] += 1.0
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector] if norm else vector
+
+
+@traced("embedding")
+@timed_dependency("embedding")
 def generate_embedding(text, vector_dimension=768):
     """
     Generates an embedding for the given text using Google GenAI.
     """
+    return cassette.call("embedding", {"text": text, "vector_dimension": vector_dimension},
+                         lambda: _embed_content(text, vector_dimension))
+
+
+def _embed_content(text, vector_dimension):
+    if OFFLINE_VECTOR_STORE:
+        return offline_embedding(text, vector_dimension)
     try:
         response = embedding_client.models.embed_content(
             model="gemini-embedding-001",
@@ -1,18 +1,44 @@
 # from langchain_ollama import ChatOllama
 from langchain_google_genai import ChatGoogleGenerativeAI
+from utility.fake_llm import FakeChatModel
+from utility.cassette import cassette, CassetteChatModel
+import os
+
+# "fake" swaps in the offline stand-in model for load tests and CI
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
 
 class LLM:
 
     def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash-lite",
-            temperature=1,
-            max_output_tokens=8192,
-            timeout=30,
-            max_retries=2,)
+        if LLM_PROVIDER == "fake":
+            self.llm = FakeChatModel.from_profile(os.getenv("FAKE_LLM_PROFILE", "fast"))
+        elif cassette.replaying:
+            # replays never reach the provider
+            self.llm = None
+        else:
+            self.llm = ChatGoogleGenerativeAI(
+                model="gemini-2.0-flash-lite",
+                temperature=1,
+                max_output_tokens=8192,
+                timeout=30,
+                # retried by the LLM scheduler, which rate limits every attempt
+                max_retries=0,)
+        if cassette.mode != "off":
+            self.llm = CassetteChatModel(inner=self.llm, cassette=cassette,
+                                         model=getattr(self.llm, "model", None) or "cassette")
         # self.llm = ChatOllama(base_url="http://localhost:11434",
         #           model="llama3.2:latest",
         #           temperature=0)
 
     def get_llm(self):
-        return self.llm
\ No newline at end of file
+        return self.llm
+
+    def get_settings(self) -> dict:
+        """
+        Model settings that change the output of a prompt, used for cache keys.
+        """
+        return {
+            "model": getattr(self.llm, "model", None),
+            "temperature": getattr(self.llm, "temperature", None),
+            "max_output_tokens": getattr(self.llm, "max_output_tokens", None),
+        }
\ No newline at end of file
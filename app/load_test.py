@@ -0,0 +1,213 @@
+"""
+Offline load test for the /ws/ai-tutor pipeline.
+
+Runs the chat router in-process on uvicorn with the fake LLM, in-memory Mongo, Firestore and
+Milvus, opens N concurrent WebSocket sessions and reports time to first token, tokens/sec,
+turn latency percentiles and Mongo ops per turn. Exits with status 1 when a threshold is exceeded.
+With --replay, calls recorded with CASSETTE_MODE=record are replayed at their original pacing.
+
+    cd app && python load_test.py --sessions 50 --turns 4 --profile gemini --max-p95-ttft 2.5
+"""
+import argparse, asyncio, json, math, os, sys, time
+from uuid import uuid4
+
+# offline stand-ins, set before any app module reads its configuration
+OFFLINE_ENVIRONMENT = {
+    "LLM_PROVIDER": "fake",
+    "MONGODB_CONNECTION_STRING": "memory://",
+    "FIRESTORE_BACKEND": "memory",
+    "MILVUS_URI": "memory://",
+    "MILVUS_COLLECTION_NAME": "load_test",
+    # every simulated session is its own user, the harness paces itself
+    "TUTOR_TURNS_PER_MINUTE": "100000",
+    "TUTOR_TURN_BURST": "100000",
+}
+
+QUESTIONS = [
+    "Explain how photosynthesis works in plants",
+    "What is Newton's third law of motion?",
+    "Why is the sky blue?",
+    "How does the water cycle work?",
+    "Explain reflection of light with an example",
+    "What are the three states of matter?",
+    "Quiz me on what we just discussed",
+    "How do magnets attract iron?",
+    "What is the difference between speed and velocity?",
+    "Explain how the human heart pumps blood",
+    "Give me a quiz question on this topic",
+    "What causes day and night on Earth?",
+]
+
+# messages that close a turn, anything else is progress within it
+TURN_END_AGENTS = {"media_generator", "quiz_generator", "admission_control"}
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(math.ceil(q / 100 * len(ordered)) - 1, 0))]
+
+
+def summarize(values: list[float]) -> dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values, default=0.0),
+    }
+
+
+async def run_session(url: str, index: int, turns: int, personalized: bool, turn_timeout: float, results: list):
+    import websockets
+    from utility.context_packer import estimate_tokens
+
+    query = f"user_id=load-user-{index}&conversation_id=load-{index}-{uuid4()}"
+    async with websockets.connect(f"{url}?{query}", max_size=None) as websocket:
+        for turn in range(turns):
+            question = QUESTIONS[(index + turn) % len(QUESTIONS)]
+            result = {"session": index, "question": question, "error": None, "ttft": None, "tokens": 0}
+            sent_at = time.perf_counter()
+            await websocket.send(json.dumps({"payload": question, "personalized_response": personalized}))
+            first_token_at = last_token_at = None
+            ended_at = None
+            streamed = ""
+            try:
+                while True:
+                    message = json.loads(await asyncio.wait_for(websocket.recv(), turn_timeout))
+                    now = time.perf_counter()
+                    if message.get("type") == "stream":
+                        first_token_at = first_token_at or now
+                        last_token_at = now
+                        streamed += message["text"]
+                    if message.get("from_agent") == "admission_control" and message.get("type") in ("rate_limited", "busy"):
+                        result["error"] = message["type"]
+                    if message.get("from_agent") in TURN_END_AGENTS and message.get("type") != "queued":
+                        ended_at = now
+                        break
+            except asyncio.TimeoutError:
+                # fallback answers have no closing message, a quiet socket after the stream ends them
+                if not streamed:
+                    result["error"] = "timeout"
+                ended_at = last_token_at
+            result["latency"] = (ended_at or time.perf_counter()) - sent_at
+            if first_token_at:
+                result["ttft"] = first_token_at - sent_at
+                result["tokens"] = estimate_tokens(streamed)
+                stream_seconds = last_token_at - first_token_at
+                result["tokens_per_second"] = result["tokens"] / stream_seconds if stream_seconds > 0 else None
+            results.append(result)
+
+
+async def run_load_test(args) -> dict:
+    import uvicorn
+    from fastapi import FastAPI
+    from utility.chat import chat_router
+    from db_utility.mongo_db import mongo_command_counter
+    from utility.llm_scheduler import llm_scheduler
+    from utility.admission import get_admission_stats
+    from utility.cassette import cassette
+
+    app = FastAPI()
+    app.include_router(chat_router, prefix="/api/v1/chat")
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning", ws_max_size=2 ** 24))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    url = f"ws://127.0.0.1:{port}/api/v1/chat/ws/ai-tutor"
+
+    results = []
+    mongo_ops_before = mongo_command_counter.snapshot()
+    started_at = time.perf_counter()
+    sessions = [
+        asyncio.create_task(run_session(url, index, args.turns, args.personalized, args.turn_timeout, results))
+        for index in range(args.sessions)
+    ]
+    session_errors = [error for error in await asyncio.gather(*sessions, return_exceptions=True) if error]
+    elapsed = time.perf_counter() - started_at
+    mongo_ops_after = mongo_command_counter.snapshot()
+
+    server.should_exit = True
+    await server_task
+
+    completed = [result for result in results if result["error"] is None]
+    mongo_ops = {name: count - mongo_ops_before.get(name, 0) for name, count in mongo_ops_after.items()}
+    total_mongo_ops = sum(mongo_ops.values())
+    return {
+        "sessions": args.sessions,
+        "turns_per_session": args.turns,
+        "profile": os.getenv("FAKE_LLM_PROFILE", "fast"),
+        "elapsed_seconds": elapsed,
+        "turns_completed": len(completed),
+        "turns_failed": len(results) - len(completed) + len(session_errors),
+        "session_errors": [repr(error) for error in session_errors],
+        "turns_per_second": len(completed) / elapsed if elapsed else 0.0,
+        "ttft_seconds": summarize([r["ttft"] for r in completed if r["ttft"] is not None]),
+        "latency_seconds": summarize([r["latency"] for r in completed]),
+        "tokens_per_second": summarize([r["tokens_per_second"] for r in completed if r.get("tokens_per_second")]),
+        "mongo_ops_per_turn": total_mongo_ops / len(completed) if completed else 0.0,
+        "mongo_ops": mongo_ops,
+        "llm_scheduler": llm_scheduler.stats(),
+        "admission": get_admission_stats(),
+        "cassette": cassette.stats(),
+    }
+
+
+def check_thresholds(report: dict, args) -> list[str]:
+    failures = []
+    if args.max_p95_ttft is not None and report["ttft_seconds"]["p95"] > args.max_p95_ttft:
+        failures.append(f"p95 TTFT {report['ttft_seconds']['p95']:.3f}s > {args.max_p95_ttft}s")
+    if args.max_p95_latency is not None and report["latency_seconds"]["p95"] > args.max_p95_latency:
+        failures.append(f"p95 turn latency {report['latency_seconds']['p95']:.3f}s > {args.max_p95_latency}s")
+    if args.min_tokens_per_second is not None and report["tokens_per_second"]["p50"] < args.min_tokens_per_second:
+        failures.append(f"median tokens/sec {report['tokens_per_second']['p50']:.1f} < {args.min_tokens_per_second}")
+    if args.max_mongo_ops_per_turn is not None and report["mongo_ops_per_turn"] > args.max_mongo_ops_per_turn:
+        failures.append(f"Mongo ops per turn {report['mongo_ops_per_turn']:.1f} > {args.max_mongo_ops_per_turn}")
+    total_turns = report["turns_completed"] + report["turns_failed"]
+    error_rate = report["turns_failed"] / total_turns if total_turns else 1.0
+    if error_rate > args.max_error_rate:
+        failures.append(f"error rate {error_rate:.2%} > {args.max_error_rate:.2%}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the AI tutor WebSocket")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--profile", default=None, help="fake LLM profile: instant, fast, gemini or slow")
+    parser.add_argument("--personalized", action="store_true", help="exercise the vector search path")
+    parser.add_argument("--replay", metavar="CASSETTE", help="replay recorded LLM, embedding and image search calls")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--turn-timeout", type=float, default=30.0)
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    parser.add_argument("--max-p95-ttft", type=float)
+    parser.add_argument("--max-p95-latency", type=float)
+    parser.add_argument("--min-tokens-per-second", type=float)
+    parser.add_argument("--max-mongo-ops-per-turn", type=float)
+    parser.add_argument("--max-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    for name, value in OFFLINE_ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    if args.profile:
+        os.environ["FAKE_LLM_PROFILE"] = args.profile
+    if args.replay:
+        os.environ["CASSETTE_MODE"] = "replay"
+        os.environ["CASSETTE_PATH"] = args.replay
+
+    report = asyncio.run(run_load_test(args))
+    print(json.dumps(report, indent=2, default=str))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+
+    failures = check_thresholds(report, args)
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,26 @@
 import requests, os
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 import firebase_admin
 from firebase_admin import credentials
-from utility.auth import auth_router
+from utility.auth import auth_router, user_profile_cache
 from utility.chat import chat_router
 from utility.quizzes import quiz_router
 from utility.image_utility import image_router
-from analytics.user_performance_metrics import analytics_router
+from analytics.user_performance_metrics import analytics_router, metrics_publish_queue, student_metrics_cache
+from utility.admin import admin_router
+from core_agents import get_agent, prompt_cache
+from utility.metrics import register_stats, render_metrics
+from utility.llm_scheduler import llm_scheduler
+from utility.admission import get_admission_stats
+from utility.intent_classifier import intent_classifier
+from utility.answer_cache import answer_cache
+from utility.speculation import get_speculation_stats
+from utility.context_packer import get_packing_stats
+from utility.tracing import tracer
+from utility.profiling import stall_watchdog
+from db_utility.indexes import ensure_indexes
+import asyncio
 
 app = FastAPI()
 
@@ -28,6 +41,50 @@ app.include_router(chat_router, prefix="/api/v1/chat", tags=["chat"])
 app.include_router(quiz_router, prefix="/api/v1/quiz", tags=["quiz"])
 app.include_router(analytics_router, prefix="/api/v1/analytics", tags=["analytics"])
 app.include_router(image_router, prefix="/api/v1/image", tags=["image"])
+app.include_router(admin_router, prefix="/api/v1/admin", tags=["admin"])
+
+@app.on_event("startup")
+async def warm_up_agent():
+    # compile the tutor graph before the first WebSocket connects
+    get_agent()
+
+@app.on_event("startup")
+async def create_mongo_indexes():
+    await ensure_indexes()
+
+@app.on_event("startup")
+async def start_loop_stall_watchdog():
+    stall_watchdog.start(asyncio.get_running_loop())
+
+@app.on_event("startup")
+async def start_background_workers():
+    metrics_publish_queue.start()
+
+@app.on_event("shutdown")
+async def drain_background_workers():
+    # publish the metrics of submissions already accepted
+    await metrics_publish_queue.drain(timeout=10)
+
+# existing in-process stats, exported as gauges and counters when /metrics is scraped
+register_stats({
+    "llm_scheduler": llm_scheduler.stats,
+    "admission": get_admission_stats,
+    "intent_classifier": intent_classifier.stats,
+    "answer_cache": answer_cache.stats,
+    "prompt_cache": prompt_cache.stats,
+    "speculation": get_speculation_stats,
+    "prompt_packing": get_packing_stats,
+    "tracing": tracer.stats,
+    "loop_stalls": stall_watchdog.stats,
+    "metrics_queue": metrics_publish_queue.stats,
+    "profile_cache": user_profile_cache.stats,
+    "student_metrics_cache": student_metrics_cache.stats,
+})
+
+@app.get("/metrics")
+async def metrics():
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
 
 @app.get("/")
 async def root():
@@ -0,0 +1,102 @@
+"""
+Cost of updating a student's metrics after one quiz submission: the full rescan and re-aggregation
+of every submission in Python (how updateStudentBasicMetricInDB worked), the same rescan as a server-side
+aggregation pipeline, and the incremental counter update.
+
+Seeds one user with --submissions answers in a scratch database, then times --updates re-answers
+each way and checks that the incremental counters still match a full rescan. Firestore writes are
+excluded, they cost the same either way. Uses in-memory Mongo unless MONGODB_CONNECTION_STRING is set.
+
+    cd app && python metrics_benchmark.py --submissions 10000 --updates 200
+"""
+import argparse, asyncio, json, os, random, time
+from datetime import datetime
+from load_test import summarize
+
+SUBJECTS = ["Physics", "Chemistry", "Biology", "Mathematics", "History", "Geography"]
+DIFFICULTY_SCORES = {"easy": 10, "medium": 20, "hard": 30}
+
+
+def random_answer() -> dict:
+    difficulty = random.choice(list(DIFFICULTY_SCORES))
+    is_correct = random.random() < 0.6
+    return {
+        "is_correct": is_correct,
+        "selected_option": random.choice("ABCD"),
+        "score": DIFFICULTY_SCORES[difficulty] if is_correct else 0,
+        "difficulty": difficulty,
+        "subject": random.choice(SUBJECTS),
+        "responded_at": datetime.now(),
+    }
+
+
+async def run_benchmark(args) -> dict:
+    from db_utility.mongo_db import MongoDBClient
+    from analytics.metric_counters import StudentMetricCounters, counters_from_submissions, normalized_counters
+
+    client = MongoDBClient(database_name=args.database)
+    store = StudentMetricCounters(client.database)
+    user_id, quiz_ids = "bench-user", [f"bench-quiz-{i}" for i in range(args.submissions)]
+    await store.submissions.delete_many({"user_id": user_id})
+    await store.counters.delete_many({"_id": user_id})
+    await store.submissions.insert_many([
+        {"user_id": user_id, "quiz_id": quiz_id, "created_at": datetime.now(), **random_answer()}
+        for quiz_id in quiz_ids
+    ])
+    await store.rebuild(user_id)
+
+    rescan, pipeline, incremental = [], [], []
+    try:
+        for _ in range(args.updates):
+            quiz_id, answer = random.choice(quiz_ids), random_answer()
+
+            started_at = time.perf_counter()
+            await store.record_submission(user_id, quiz_id, answer)
+            incremental.append(time.perf_counter() - started_at)
+
+            # the same upsert again (a no-op now, so the counters stay exact) followed by the old full rescan
+            started_at = time.perf_counter()
+            await store.submissions.update_one({"user_id": user_id, "quiz_id": quiz_id}, {"$set": answer})
+            counters_from_submissions(await store.submissions.find({"user_id": user_id}, {"_id": 0}).to_list())
+            rescan.append(time.perf_counter() - started_at)
+
+            started_at = time.perf_counter()
+            await store.scan(user_id)
+            pipeline.append(time.perf_counter() - started_at)
+
+        consistent = normalized_counters(await store.get(user_id)) == normalized_counters(await store.scan(user_id))
+    finally:
+        await store.submissions.delete_many({"user_id": user_id})
+        await store.counters.delete_many({"_id": user_id})
+        await client.close()
+
+    rescan_summary, incremental_summary = summarize(rescan), summarize(incremental)
+    return {
+        "submissions": args.submissions,
+        "updates": args.updates,
+        "full_rescan": rescan_summary,
+        "pipeline_rescan": summarize(pipeline),
+        "incremental": incremental_summary,
+        "p50_speedup": rescan_summary["p50"] / incremental_summary["p50"] if incremental_summary["p50"] else None,
+        "counters_match_rescan": consistent,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark full rescan against incremental student metrics")
+    parser.add_argument("--submissions", type=int, default=10_000)
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--database", default="metrics_benchmark")
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    os.environ.setdefault("MONGODB_CONNECTION_STRING", "memory://")
+    report = asyncio.run(run_benchmark(args))
+    print(json.dumps(report, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Before/after microbenchmarks for the tutor turn pipeline. Runs offline with the same stand-ins as
+load_test.py (fake LLM, in-memory Mongo, Firestore and Milvus) and drives run_tutor_turn in-process
+against a recording websocket, so each number isolates one change. Only explanation questions are
+asked, the answer cache is off and the LLM rate limit is lifted, so every turn streams a fresh answer
+without waiting on the scheduler:
+
+    graph        connect-to-first-token with the graph compiled on every connect (before) or shared (now)
+    concurrency  N sessions streaming answers at once, with the model called through its blocking API
+                 on the event loop (how the sync pipeline ran) or its async API (now)
+
+    history      Mongo round trips per turn with a history store per node that opened its own client and
+                 checked for its session first (before), one per node on the shared client (the shared
+                 client change) and one per connection (now)
+
+    cd app && python pipeline_benchmark.py graph --connects 50
+    cd app && python pipeline_benchmark.py concurrency --sessions 10 --turns 2 --profile fast
+    cd app && python pipeline_benchmark.py history --sessions 10 --turns 4
+"""
+import argparse, asyncio, json, os, time
+from uuid import uuid4
+from load_test import OFFLINE_ENVIRONMENT, QUESTIONS, summarize
+
+EXPLANATION_QUESTIONS = [question for question in QUESTIONS if "quiz" not in question.lower()]
+BENCHMARK_ENVIRONMENT = {
+    **OFFLINE_ENVIRONMENT,
+    "ANSWER_CACHE_ENABLED": "false",
+    "LLM_REQUESTS_PER_SECOND": "100000",
+    "LLM_BURST": "100000",
+}
+
+
+class RecordingWebSocket:
+    """
+    Collects what a turn sends and when the first streamed token went out.
+    """
+
+    def __init__(self):
+        self.sent = []
+        self.first_token_at = None
+
+    async def send_json(self, message: dict):
+        if message.get("type") == "stream" and self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.sent.append(message)
+
+
+def compare(before: dict, after: dict) -> dict:
+    return {
+        "before": before,
+        "after": after,
+        "p50_speedup": before["p50"] / after["p50"] if after["p50"] else None,
+    }
+
+
+async def connect_to_first_token(get_graph, question: str) -> float:
+    from utility.chat import run_tutor_turn
+    from utility.custom_libs import load_session_history
+
+    websocket = RecordingWebSocket()
+    connected_at = time.perf_counter()
+    # what the websocket handler does between accept() and the first streamed token
+    agent = get_graph()
+    chat_history = await load_session_history(f"bench-{uuid4()}")
+    config = {"configurable": {"session_id": chat_history.session_id, "chat_history": chat_history}}
+    await run_tutor_turn(websocket, agent, config, chat_history, {"payload": question}, connected_at)
+    return websocket.first_token_at - connected_at
+
+
+async def benchmark_graph(args) -> dict:
+    from core_agents import build_agent, get_agent
+
+    get_agent()  # main.py warms the shared graph on startup
+    results = {}
+    for mode, get_graph in (("compiled_per_connect", build_agent), ("shared", get_agent)):
+        results[mode] = summarize([
+            await connect_to_first_token(get_graph, EXPLANATION_QUESTIONS[index % len(EXPLANATION_QUESTIONS)])
+            for index in range(args.connects)
+        ])
+    return {"connects": args.connects, "connect_to_first_token_seconds": compare(results["compiled_per_connect"], results["shared"])}
+
+
+async def stream_answers(chat_model, question: str, turns: int, blocking: bool, started_at: float, ttfts: list):
+    from prompts import AI_TUTOR_PROMPT
+
+    prompt = AI_TUTOR_PROMPT.invoke({"history": [], "query": question})
+    # every session sends its first question at started_at and the next one as soon as an answer ends,
+    # so time spent waiting for the event loop counts towards the session's time to first token
+    for _ in range(turns):
+        first_token_at = None
+        if blocking:
+            for _chunk in chat_model.stream(prompt):
+                first_token_at = first_token_at or time.perf_counter()
+        else:
+            async for _chunk in chat_model.astream(prompt):
+                first_token_at = first_token_at or time.perf_counter()
+        ttfts.append(first_token_at - started_at)
+        started_at = time.perf_counter()
+        await asyncio.sleep(0)
+
+
+async def benchmark_concurrency(args) -> dict:
+    from llm import LLM
+    from profile_read_benchmark import measure_loop_lag
+
+    chat_model = LLM().get_llm()
+    report = {"sessions": args.sessions, "turns_per_session": args.turns}
+    for mode, blocking in (("blocking", True), ("async", False)):
+        ttfts, lags = [], []
+        heartbeat = asyncio.create_task(measure_loop_lag(0.005, lags))
+        started_at = time.perf_counter()
+        await asyncio.gather(*(
+            stream_answers(chat_model, EXPLANATION_QUESTIONS[index % len(EXPLANATION_QUESTIONS)], args.turns, blocking,
+                           started_at, ttfts)
+            for index in range(args.sessions)
+        ))
+        elapsed = time.perf_counter() - started_at
+        heartbeat.cancel()
+        report[mode] = {
+            "seconds": elapsed,
+            "turns_per_second": len(ttfts) / elapsed if elapsed else 0.0,
+            "ttft_seconds": summarize(ttfts),
+            "max_loop_lag": max(lags, default=0.0),
+        }
+    report["ttft_p95_speedup"] = report["blocking"]["ttft_seconds"]["p95"] / report["async"]["ttft_seconds"]["p95"]
+    report["throughput_speedup"] = report["async"]["turns_per_second"] / report["blocking"]["turns_per_second"]
+    return report
+
+
+def existence_checked_history(opened_clients: list):
+    """
+    History stores as they were before the shared client: each one opened its own MongoClient
+    (counted, in-memory Mongo has no connections) and ran find_one + insert_one on its session first.
+    """
+    from utility.custom_libs import CustomMongoDBChatMessageHistory, message_bucket_store
+
+    class ExistenceCheckedHistory(CustomMongoDBChatMessageHistory):
+        checked = False
+
+        async def _ensure_session(self):
+            if not self.checked:
+                self.checked = True
+                if await self.store.sessions.find_one({"_id": self.session_id}) is None:
+                    await self.store.sessions.insert_one({"_id": self.session_id, "messages": []})
+
+        async def get_messages(self):
+            await self._ensure_session()
+            return await super().get_messages()
+
+        async def _append_message(self, message, sources=None, image_links=None):
+            await self._ensure_session()
+            return await super()._append_message(message, sources=sources, image_links=image_links)
+
+    def get_chat_history(session_id: str, max_recent_messages: int = 100):
+        opened_clients.append(session_id)
+        return ExistenceCheckedHistory(session_id, message_bucket_store, max_recent_messages)
+    return get_chat_history
+
+
+async def run_history_turns(mode: str, session_index: int, turns: int):
+    import core_agents
+    from utility.chat import run_tutor_turn
+    from utility.custom_libs import load_session_history
+
+    session_id = f"bench-{uuid4()}"
+    if mode == "per_connection":
+        chat_history = await load_session_history(session_id)
+        config = {"configurable": {"session_id": session_id, "chat_history": chat_history}}
+    for turn in range(turns):
+        if mode != "per_connection":
+            # the handler built a store per turn and every node loaded the history through its own
+            chat_history = core_agents.get_chat_history(session_id)
+            config = {"configurable": {"session_id": session_id}}
+        question = EXPLANATION_QUESTIONS[(session_index + turn) % len(EXPLANATION_QUESTIONS)]
+        await run_tutor_turn(RecordingWebSocket(), core_agents.get_agent(), config, chat_history,
+                             {"payload": question}, time.perf_counter())
+
+
+async def benchmark_history(args) -> dict:
+    import core_agents
+    from db_utility.mongo_db import mongo_command_counter
+
+    shared_get_chat_history = core_agents.get_chat_history
+    opened_clients = []
+    report = {"sessions": args.sessions, "turns_per_session": args.turns}
+    for mode in ("per_node_own_client", "per_node_shared_client", "per_connection"):
+        opened_clients.clear()
+        if mode == "per_node_own_client":
+            core_agents.get_chat_history = existence_checked_history(opened_clients)
+        before = mongo_command_counter.snapshot()
+        try:
+            for index in range(args.sessions):
+                await run_history_turns(mode, index, args.turns)
+        finally:
+            core_agents.get_chat_history = shared_get_chat_history
+        after = mongo_command_counter.snapshot()
+        ops = {name: count - before.get(name, 0) for name, count in after.items() if count - before.get(name, 0)}
+        turns = args.sessions * args.turns
+        report[mode] = {
+            "mongo_ops_per_turn": sum(ops.values()) / turns,
+            "clients_opened_per_turn": len(opened_clients) / turns,
+            "mongo_ops": ops,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Before/after benchmarks for the tutor turn pipeline")
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    benchmarks = parser.add_subparsers(dest="benchmark", required=True)
+    graph = benchmarks.add_parser("graph", help="graph compiled per connect against the shared graph")
+    graph.add_argument("--connects", type=int, default=50)
+    graph.add_argument("--profile", default="instant", help="fake LLM profile: instant, fast, gemini or slow")
+    concurrency = benchmarks.add_parser("concurrency", help="blocking against async model calls on one event loop")
+    concurrency.add_argument("--sessions", type=int, default=10)
+    concurrency.add_argument("--turns", type=int, default=2)
+    concurrency.add_argument("--profile", default="fast", help="fake LLM profile: instant, fast, gemini or slow")
+    history = benchmarks.add_parser("history", help="Mongo round trips per turn for each way of loading history")
+    history.add_argument("--sessions", type=int, default=10)
+    history.add_argument("--turns", type=int, default=4)
+    history.add_argument("--profile", default="instant", help="fake LLM profile: instant, fast, gemini or slow")
+    args = parser.parse_args()
+
+    for name, value in BENCHMARK_ENVIRONMENT.items():
+        os.environ[name] = value
+    os.environ["FAKE_LLM_PROFILE"] = args.profile
+    run = {"graph": benchmark_graph, "concurrency": benchmark_concurrency, "history": benchmark_history}[args.benchmark]
+    report = {"benchmark": args.benchmark, "profile": args.profile, **asyncio.run(run(args))}
+    print(json.dumps(report, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Concurrent profile reads on one worker: the blocking driver called from the event loop (how the
+routers read Mongo before) against the async driver with its shared pool (how they read it now).
+
+Seeds profile documents into a scratch database, then runs --concurrency coroutines on a single event
+loop, each reading random profiles with the projection of GET /auth/user/{userId}. Reports reads/sec,
+read latency percentiles and the worst event loop lag seen by a heartbeat task. Needs a real server,
+in-memory Mongo never waits on I/O.
+
+    cd app && python profile_read_benchmark.py --concurrency 100 --reads 50
+"""
+import argparse, asyncio, json, os, random, time
+from datetime import datetime
+from load_test import summarize
+
+PROFILE_PROJECTION = {"quiz_ids": 0, "conversation_ids": 0}
+
+
+async def measure_loop_lag(interval: float, lags: list):
+    while True:
+        started_at = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started_at - interval)
+
+
+async def run_readers(read_profile, user_ids: list[str], concurrency: int, reads: int) -> dict:
+    latencies, lags = [], []
+    heartbeat = asyncio.create_task(measure_loop_lag(0.005, lags))
+
+    async def reader():
+        for _ in range(reads):
+            started_at = time.perf_counter()
+            await read_profile(random.choice(user_ids))
+            latencies.append(time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(reader() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started_at
+    heartbeat.cancel()
+    return {
+        "reads": len(latencies),
+        "seconds": elapsed,
+        "reads_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "latency": summarize(latencies),
+        "max_loop_lag": max(lags, default=0.0),
+    }
+
+
+async def run_benchmark(args) -> dict:
+    from pymongo import MongoClient
+    from db_utility.mongo_db import MongoDBClient
+
+    connection_string = os.getenv("MONGODB_CONNECTION_STRING", "")
+    if connection_string.startswith("memory://"):
+        print("Warning: in-memory Mongo has no I/O, both modes will look the same")
+
+    async_client = MongoDBClient(database_name=args.database)
+    users = async_client.get_collection("users")
+    user_ids = [f"bench-user-{i}" for i in range(args.users)]
+    await users.delete_many({"_id": {"$regex": "^bench-user-"}})
+    await users.insert_many([
+        {"_id": user_id, "name": f"User {i}", "email": f"{user_id}@example.com", "photo_url": "",
+         "created_at": datetime.now(), "conversation_ids": [], "quiz_ids": []}
+        for i, user_id in enumerate(user_ids)
+    ])
+
+    report = {"concurrency": args.concurrency, "reads_per_coroutine": args.reads, "users": args.users}
+    try:
+        if not connection_string.startswith("memory://"):
+            blocking_users = MongoClient(connection_string)[args.database]["users"]
+
+            async def read_blocking(user_id: str):
+                return blocking_users.find_one({"_id": user_id}, PROFILE_PROJECTION)
+
+            report["blocking"] = await run_readers(read_blocking, user_ids, args.concurrency, args.reads)
+            blocking_users.database.client.close()
+
+        async def read_async(user_id: str):
+            return await users.find_one({"_id": user_id}, PROFILE_PROJECTION)
+
+        report["async"] = await run_readers(read_async, user_ids, args.concurrency, args.reads)
+        if "blocking" in report:
+            report["speedup"] = report["async"]["reads_per_second"] / report["blocking"]["reads_per_second"]
+    finally:
+        await users.delete_many({"_id": {"$regex": "^bench-user-"}})
+        await async_client.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent profile reads per worker")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--reads", type=int, default=50, help="reads per coroutine")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--database", default="profile_read_benchmark")
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(args))
+    print(json.dumps(report, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -178,6 +178,18 @@ SUMMARIZE_HISTORY_PROMPT = ChatPromptTemplate.from_messages([
 ])
 
 
+ROLLING_SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system",
+     "You maintain a running summary of an educational conversation between a student and an AI tutor. "
+     "Update the existing summary with the new messages. Keep the topics covered, key definitions, facts and "
+     "concepts explained, and anything the student struggled with or asked to revisit. "
+     "Ignore small talk and greetings.\n\n"
+     "Output a single concise paragraph of at most 200 words in the language of the conversation."),
+
+    ("human", "Existing summary:\n{summary}\n\nNew messages:\n{history}"),
+])
+
+
 GRADER_PROMPT = ChatPromptTemplate.from_messages([
     ("system", "You are a grading generator. Your task is to grade the student's answer based on the provided question and answer.\
      Provide feedback on the student's answer and indicate whether it is correct or not.\
@@ -0,0 +1,57 @@
+from fastapi import APIRouter, HTTPException, Depends, status, Query
+from fastapi.responses import PlainTextResponse
+from utility.auth import get_current_user_from_firebase_token
+from utility.profiling import sampling_profiler, stall_watchdog
+from utility.tracing import memory_exporter
+import os, asyncio, threading
+
+ADMIN_USER_IDS = {uid.strip() for uid in os.getenv("ADMIN_USER_IDS", "").split(",") if uid.strip()}
+
+admin_router = APIRouter(
+    responses={404: {"description": "Not found"}},
+)
+
+
+async def require_admin(current_user: dict = Depends(get_current_user_from_firebase_token)):
+    """
+    Admins are listed in ADMIN_USER_IDS or carry the `admin` custom claim on their Firebase token.
+    """
+    if current_user.get("uid") in ADMIN_USER_IDS or current_user.get("admin") is True:
+        return current_user
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+
+
+@admin_router.post("/profile")
+async def run_profile(seconds: float = Query(10, gt=0, le=120),
+                      interval_ms: float = Query(10, ge=1, le=1000),
+                      loop_only: bool = Query(False),
+                      format: str = Query("folded", pattern="^(folded|json)$"),
+                      admin: dict = Depends(require_admin)):
+    """
+    Sample thread stacks for `seconds` and return collapsed stacks for a flame graph
+    (flamegraph.pl or speedscope). loop_only restricts sampling to the event loop thread.
+    """
+    thread_ids = {threading.get_ident()} if loop_only else None
+    try:
+        result = await asyncio.to_thread(sampling_profiler.profile, seconds, interval_ms / 1000, thread_ids)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    if format == "json":
+        return {**result, "stacks": dict(result["stacks"].most_common())}
+    return PlainTextResponse(sampling_profiler.folded(result))
+
+
+@admin_router.get("/loop-stalls")
+async def get_loop_stalls(admin: dict = Depends(require_admin)):
+    """
+    Event loop stalls detected by the watchdog, counted per call site, with the most recent stacks.
+    """
+    return stall_watchdog.report()
+
+
+@admin_router.get("/traces")
+async def get_traces(limit: int = Query(20, ge=1, le=200), admin: dict = Depends(require_admin)):
+    """
+    Most recent sampled tutor turn traces kept in memory.
+    """
+    return {"traces": memory_exporter.recent(limit)}
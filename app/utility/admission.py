@@ -0,0 +1,211 @@
+import asyncio, os, time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from cachetools import TTLCache
+from utility.llm_scheduler import TokenBucket
+
+# Per-user admission: sustained turns per minute plus a short burst
+TURNS_PER_MINUTE = float(os.getenv("TUTOR_TURNS_PER_MINUTE", 12))
+TURN_BURST = int(os.getenv("TUTOR_TURN_BURST", 5))
+# Turns a single connection may have running or waiting at once
+MAX_PENDING_TURNS = int(os.getenv("TUTOR_MAX_PENDING_TURNS", 2))
+# Turns running at once on this worker, across all users
+MAX_ACTIVE_TURNS = int(os.getenv("TUTOR_MAX_ACTIVE_TURNS", 16))
+
+admission_stats = {
+    "admitted": 0,
+    "rate_limited": 0,
+    "pending_full": 0,
+}
+
+
+def admission_notice(text: str, notice_type: str) -> dict:
+    return {"sender": "ai", "text": text, "type": notice_type, "from_agent": "admission_control"}
+
+
+class UserRateLimiter:
+    """
+    One token bucket per user, shared by all of the user's connections.
+    Idle buckets are dropped once they would have refilled anyway.
+    """
+
+    def __init__(self, turns_per_minute: float, burst: int, max_users: int = 100_000):
+        self.rate = turns_per_minute / 60
+        self.burst = burst
+        self.buckets = TTLCache(maxsize=max_users, ttl=burst / self.rate)
+
+    def allow(self, user_id: str) -> bool:
+        bucket = self.buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+        # re-insert so the idle timer restarts on every attempt
+        self.buckets[user_id] = bucket
+        return bucket.try_acquire()
+
+
+class ConnectionTurnQueue:
+    """
+    Turns received on one websocket, processed one at a time. At most max_in_flight turns
+    (the running one included) are accepted, further messages are rejected.
+    Turns are queued with the time they were received. Closing the queue (the client left)
+    drops the waiting turns and cancels the running one.
+    """
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.queue = asyncio.Queue()
+        self.running: asyncio.Task | None = None
+
+    def full(self) -> bool:
+        return self.in_flight >= self.max_in_flight
+
+    def offer(self, data: dict) -> bool:
+        if self.full():
+            return False
+        self.in_flight += 1
+        self.queue.put_nowait((data, time.perf_counter()))
+        return True
+
+    def start(self, turn) -> asyncio.Task:
+        self.running = asyncio.create_task(turn)
+        return self.running
+
+    def close(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self.in_flight -= 1
+        self.queue.put_nowait(None)
+        if self.running is not None and not self.running.done():
+            self.running.cancel()
+
+    async def next(self) -> tuple[dict, float] | None:
+        return await self.queue.get()
+
+    def done(self):
+        self.in_flight -= 1
+
+
+class SerializedWebSocket:
+    """
+    A websocket shared by the connection's receiver and its running turn, sending one message
+    at a time so concurrent sends do not interleave. Everything else goes to the websocket.
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.send_lock = asyncio.Lock()
+
+    async def send_json(self, message: dict):
+        async with self.send_lock:
+            await self.websocket.send_json(message)
+
+    def __getattr__(self, name: str):
+        return getattr(self.websocket, name)
+
+
+class FairTurnScheduler:
+    """
+    Caps the number of tutor turns running at once. When saturated, freed slots go to
+    waiting users in round-robin order so one busy user cannot starve the others.
+    """
+
+    def __init__(self, max_active_turns: int):
+        self.max_active_turns = max_active_turns
+        self.active = 0
+        self._waiting: OrderedDict[str, deque] = OrderedDict()
+        self.counters = {"turns": 0, "waited": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+
+    def saturated(self) -> bool:
+        return self.active >= self.max_active_turns or bool(self._waiting)
+
+    async def _acquire(self, user_id: str):
+        if not self.saturated():
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(user_id, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        while self._waiting:
+            user_id, waiters = next(iter(self._waiting.items()))
+            future = waiters.popleft()
+            if waiters:
+                self._waiting.move_to_end(user_id)  # the user's next turn waits for everyone else
+            else:
+                del self._waiting[user_id]
+            if not future.done():
+                future.set_result(None)  # the slot moves to the waiter, active is unchanged
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def turn(self, user_id: str):
+        enqueued_at = time.monotonic()
+        waited = self.saturated()
+        await self._acquire(user_id)
+        try:
+            wait_seconds = time.monotonic() - enqueued_at
+            self.counters["turns"] += 1
+            self.counters["waited"] += int(waited)
+            self.counters["wait_seconds_total"] += wait_seconds
+            self.counters["wait_seconds_max"] = max(self.counters["wait_seconds_max"], wait_seconds)
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "active": self.active,
+            "max_active_turns": self.max_active_turns,
+            "waiting_users": len(self._waiting),
+            "waiting_turns": sum(len(waiters) for waiters in self._waiting.values()),
+        }
+
+
+user_rate_limiter = UserRateLimiter(TURNS_PER_MINUTE, TURN_BURST)
+turn_scheduler = FairTurnScheduler(MAX_ACTIVE_TURNS)
+
+
+async def receive_turns(websocket, user_id: str, turns: ConnectionTurnQueue):
+    """
+    Read client messages as they arrive and admit them into the connection's turn queue.
+    Rejections are sent back right away: "busy" when the connection already has max_in_flight turns,
+    "rate_limited" when the user is over their turn rate. A busy rejection does not use up the
+    user's rate budget. The queue is closed when the client disconnects, which also cancels the
+    running turn. The websocket is shared with the running turn, so it should be a SerializedWebSocket.
+    """
+    try:
+        while True:
+            data = await websocket.receive_json()
+            if turns.full():
+                admission_stats["pending_full"] += 1
+                await websocket.send_json(admission_notice(
+                    "Still working on your previous questions. Please wait for them to finish.", "busy"))
+                continue
+            if not user_rate_limiter.allow(user_id):
+                admission_stats["rate_limited"] += 1
+                await websocket.send_json(admission_notice(
+                    "You're sending messages too quickly. Please wait a moment and try again.", "rate_limited"))
+                continue
+            busy = turns.in_flight > 0
+            turns.offer(data)
+            admission_stats["admitted"] += 1
+            if busy:
+                await websocket.send_json(admission_notice(
+                    "Your question is queued and will be answered next.", "queued"))
+    except Exception as e:
+        print(f"Websocket receive ended: {e}")
+    finally:
+        turns.close()
+
+
+def get_admission_stats() -> dict:
+    return {**admission_stats, "scheduler": turn_scheduler.stats()}
@@ -0,0 +1,166 @@
+import os, re, threading, time
+from collections import OrderedDict
+from uuid import uuid4
+import numpy as np
+from db_utility.vector_db import generate_embedding, VECTOR_DIMENSION
+
+
+class CachedAnswer:
+    __slots__ = ("scope", "text_key", "row", "answer")
+
+    def __init__(self, scope: tuple, text_key: str, row: int, answer: str):
+        self.scope = scope
+        self.text_key = text_key
+        self.row = row
+        self.answer = answer
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.split()).casefold()
+
+
+class SemanticAnswerCache:
+    """
+    Caches tutor explanations by question meaning within a (grade, board, personalized) scope.
+    Entries expire after ttl_seconds and the least recently used ones are evicted past max_entries.
+
+    Embeddings live in one preallocated (max_entries, dimension) matrix, a row per entry, so a lookup
+    is a single matrix-vector product with other scopes and expired rows masked out. A question asked
+    again verbatim is answered from an exact-text index before it is embedded.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.92, ttl_seconds: int = 86400,
+                 max_entries: int = 2000, max_history_messages: int = 2, enabled: bool = True,
+                 dimension: int = VECTOR_DIMENSION):
+        self.enabled = enabled
+        self.similarity_threshold = similarity_threshold
+        self.max_history_messages = max_history_messages
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, CachedAnswer] = OrderedDict()  # least recently used first
+        self.by_text: dict[tuple, str] = {}  # (scope, normalized question) -> entry key
+        self.matrix = np.zeros((max_entries, dimension), dtype=np.float32)
+        self.row_scopes = np.full(max_entries, -1, dtype=np.int32)  # scope id per row, -1 when free
+        self.row_expires_at = np.zeros(max_entries, dtype=np.float64)
+        self.row_keys: list[str | None] = [None] * max_entries
+        self.free_rows = list(range(max_entries - 1, -1, -1))
+        self.scope_ids: dict[tuple, int] = {}
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "exact_hits": 0, "misses": 0, "embedding_errors": 0, "bypassed": 0, "stored": 0}
+
+    @staticmethod
+    def scope(state: dict) -> tuple:
+        return (
+            (state.get("grade") or "").strip().lower(),
+            (state.get("board") or "").strip().lower(),
+            bool(state.get("personalized_response", False)),
+        )
+
+    def should_bypass(self, history: list) -> bool:
+        # answers that build on earlier turns are not reusable across students
+        if not self.enabled:
+            return True
+        if len(history) > self.max_history_messages:
+            self.counters["bypassed"] += 1
+            return True
+        return False
+
+    def embed(self, question: str):
+        vector = generate_embedding(question, vector_dimension=VECTOR_DIMENSION)
+        if vector is None:
+            return None
+        embedding = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else None
+
+    def record_embedding_error(self):
+        """
+        A cacheable question that could not be embedded: a miss, also counted on its own.
+        """
+        with self.lock:
+            self.counters["embedding_errors"] += 1
+            self.counters["misses"] += 1
+
+    def _remove(self, key: str):
+        entry = self.entries.pop(key)
+        self.by_text.pop((entry.scope, entry.text_key), None)
+        self.row_scopes[entry.row] = -1
+        self.row_keys[entry.row] = None
+        self.free_rows.append(entry.row)
+
+    def _expire(self, now: float):
+        for row in np.flatnonzero((self.row_scopes >= 0) & (self.row_expires_at <= now)):
+            self._remove(self.row_keys[row])
+
+    def _hit(self, key: str) -> str:
+        self.entries.move_to_end(key)
+        self.counters["hits"] += 1
+        return self.entries[key].answer
+
+    def lookup_text(self, scope: tuple, question: str) -> str | None:
+        """
+        Answer to the same question asked verbatim in the scope, None otherwise (not counted as a miss,
+        the semantic lookup follows).
+        """
+        with self.lock:
+            key = self.by_text.get((scope, normalize_question(question)))
+            if key is None or self.row_expires_at[self.entries[key].row] <= time.monotonic():
+                return None
+            self.counters["exact_hits"] += 1
+            return self._hit(key)
+
+    def lookup(self, scope: tuple, embedding: np.ndarray) -> str | None:
+        with self.lock:
+            self._expire(time.monotonic())
+            scope_id = self.scope_ids.get(scope)
+            if scope_id is not None:
+                similarities = np.where(self.row_scopes == scope_id, self.matrix @ embedding, -np.inf)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    return self._hit(self.row_keys[best])
+            self.counters["misses"] += 1
+            return None
+
+    def store(self, scope: tuple, question: str, embedding: np.ndarray, answer: str) -> None:
+        if not answer:
+            return
+        with self.lock:
+            text_key = normalize_question(question)
+            previous = self.by_text.get((scope, text_key))
+            if previous is not None:
+                self._remove(previous)
+            if not self.free_rows:
+                self._remove(next(iter(self.entries)))
+            row, key = self.free_rows.pop(), uuid4().hex
+            self.matrix[row] = embedding
+            self.row_scopes[row] = self.scope_ids.setdefault(scope, len(self.scope_ids))
+            self.row_expires_at[row] = time.monotonic() + self.ttl_seconds
+            self.row_keys[row] = key
+            self.entries[key] = CachedAnswer(scope, text_key, row, answer)
+            self.by_text[(scope, text_key)] = key
+            self.counters["stored"] += 1
+
+    def stats(self) -> dict:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "size": len(self.entries),
+            "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+        }
+
+
+def split_into_chunks(text: str, words_per_chunk: int = 6) -> list[str]:
+    """
+    Split a cached answer into stream sized pieces, keeping the original whitespace.
+    """
+    words = re.findall(r"\S+\s*|\s+", text)
+    return ["".join(words[i:i + words_per_chunk]) for i in range(0, len(words), words_per_chunk)]
+
+
+answer_cache = SemanticAnswerCache(
+    similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", 0.92)),
+    ttl_seconds=int(os.getenv("ANSWER_CACHE_TTL_SECONDS", 86400)),
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 2000)),
+    max_history_messages=int(os.getenv("ANSWER_CACHE_MAX_HISTORY_MESSAGES", 2)),
+    enabled=os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true",
+)
@@ -5,6 +5,9 @@ from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
 from db_utility.mongo_db import mongo_db
+from pymongo import ReturnDocument
+from utility.read_cache import ReadThroughCache
+import os
 
 class UserLoginPayload(BaseModel):
     userId: str
@@ -27,6 +30,13 @@ class UserProfileUpdate(BaseModel):
 
 mongodb_user_collection = mongo_db["users"]
 
+PROFILE_PROJECTION = {"quiz_ids": 0, "conversation_ids": 0}
+# Profiles polled by dashboards, refreshed on every update through this worker
+user_profile_cache = ReadThroughCache(
+    maxsize=int(os.getenv("PROFILE_CACHE_SIZE", 10_000)),
+    ttl=float(os.getenv("PROFILE_CACHE_TTL_SECONDS", 30)),
+)
+
 auth_router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
@@ -81,7 +91,7 @@ async def create_user(user: UserProfileCreate,
     )
 
     try:
-        mongodb_user_collection.insert_one(user_data)
+        await mongodb_user_collection.insert_one(user_data)
         return {
             "message": "User created successfully",
             "userId" : user.userId
@@ -105,7 +115,7 @@ async def login(
             status_code=status.HTTP_403_FORBIDDEN, 
             detail="User ID does not match the authenticated user",
         )
-    user_doc = mongodb_user_collection.find_one(
+    user_doc = await mongodb_user_collection.find_one(
         {"_id": payload.userId},
         {"quiz_ids": 0}  # Exclude quiz_ids from response
         )
@@ -144,7 +154,7 @@ async def google_sign_in(
         )
     
     # Check if user exists in Firestore else create a new user profile
-    user_doc = mongodb_user_collection.find_one({"_id": user_id})
+    user_doc = await mongodb_user_collection.find_one({"_id": user_id})
 
     if not user_doc:
         user_doc = UserSchema(
@@ -156,7 +166,7 @@ async def google_sign_in(
         conversation_ids=[],
         quiz_ids=[]
     )
-        mongodb_user_collection.insert_one(user_doc)
+        await mongodb_user_collection.insert_one(user_doc)
     return {
         "message": "User logged in successfully",
         "userId": user_id
@@ -195,10 +205,10 @@ async def get_user_profile(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user_doc = mongodb_user_collection.find_one(
+    user_doc = await user_profile_cache.get_or_load(userId, lambda: mongodb_user_collection.find_one(
         {"_id": userId},
-        {"quiz_ids": 0, "conversation_ids": 0}  # Exclude quiz_ids and conversation_ids from response
-    )
+        PROFILE_PROJECTION  # Exclude quiz_ids and conversation_ids from response
+    ))
 
     if not user_doc:
         raise HTTPException(
@@ -232,22 +242,25 @@ async def update_user_profile(
     
     update_data = user.model_dump(exclude_none=True)
     
-    result = mongodb_user_collection.update_one(
+    # one round trip: the update returns the updated profile
+    user_doc = await mongodb_user_collection.find_one_and_update(
         {"_id": userId},
-        {"$set": update_data}
+        {"$set": update_data},
+        projection=PROFILE_PROJECTION,  # Exclude quiz_ids and conversation_ids from response
+        return_document=ReturnDocument.AFTER,
     )
-    user_doc = mongodb_user_collection.find_one({"_id": userId}, {"quiz_ids": 0, "conversation_ids": 0})  # Exclude quiz_ids and conversation_ids from response
 
-    response = {
-        "message": "User profile updated successfully",
-        "user": user_doc
-    }
-    
-    if result.matched_count == 0:
+    if user_doc is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
             detail="User not found",
         )
+    user_profile_cache.set(userId, user_doc)
+
+    response = {
+        "message": "User profile updated successfully",
+        "user": user_doc
+    }
 
     return response
 
@@ -0,0 +1,96 @@
+import asyncio, time
+from utility.metrics import background_job_lag_seconds, background_job_seconds
+
+
+class CoalescingQueue:
+    """
+    Background jobs keyed by id (e.g. a user), run off the request path by a fixed number of workers.
+    A key enqueued again before its job starts is coalesced into the waiting job, so a burst of
+    requests for one user costs a single run. A key enqueued while its job is running runs once more
+    afterwards, never concurrently with itself.
+    Lag is the time from the first enqueue of a job to its start.
+    """
+
+    def __init__(self, name: str, handler, concurrency: int):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.queue = asyncio.Queue()
+        self.pending: dict[str, float] = {}  # key -> first enqueued at
+        self.deferred: dict[str, float] = {}
+        self.running: set[str] = set()
+        self.workers: list[asyncio.Task] = []
+        self.lag = background_job_lag_seconds.labels(name)
+        self.counters = {"enqueued": 0, "coalesced": 0, "processed": 0, "errors": 0,
+                         "lag_seconds_total": 0.0, "lag_seconds_max": 0.0}
+
+    def enqueue(self, key: str):
+        self.counters["enqueued"] += 1
+        if key in self.pending:
+            self.counters["coalesced"] += 1
+            return
+        self.pending[key] = time.monotonic()
+        self.queue.put_nowait(key)
+
+    def start(self):
+        if self.workers:
+            return
+        self.workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+        print(f"Started {self.concurrency} {self.name} workers")
+
+    async def _work(self):
+        while True:
+            key = await self.queue.get()
+            enqueued_at = self.pending.pop(key)
+            try:
+                if key in self.running:
+                    self.deferred[key] = min(enqueued_at, self.deferred.get(key, enqueued_at))
+                    continue
+                await self._run(key, enqueued_at)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, key: str, enqueued_at: float):
+        lag = time.monotonic() - enqueued_at
+        self.lag.observe(lag)
+        self.counters["lag_seconds_total"] += lag
+        self.counters["lag_seconds_max"] = max(self.counters["lag_seconds_max"], lag)
+        self.running.add(key)
+        outcome = "succeeded"
+        started_at = time.perf_counter()
+        try:
+            await self.handler(key)
+        except Exception as e:
+            outcome = "failed"
+            self.counters["errors"] += 1
+            print(f"Error in {self.name} job for {key}: {e}")
+        finally:
+            background_job_seconds.labels(self.name, outcome).observe(time.perf_counter() - started_at)
+            self.running.discard(key)
+            self.counters["processed"] += 1
+            deferred_at = self.deferred.pop(key, None)
+            if deferred_at is not None and key not in self.pending:
+                self.pending[key] = deferred_at
+                self.queue.put_nowait(key)
+
+    async def drain(self, timeout: float):
+        """
+        Wait for the queued jobs to finish, then stop the workers. Used on shutdown.
+        """
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"{self.name}: {len(self.pending)} jobs still queued at shutdown")
+        for worker in self.workers:
+            worker.cancel()
+        self.workers = []
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            **self.counters,
+            "pending": len(self.pending),
+            "running": len(self.running),
+            "oldest_pending_seconds": max((now - at for at in self.pending.values()), default=0.0),
+            "concurrency": self.concurrency,
+        }
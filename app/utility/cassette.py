@@ -0,0 +1,186 @@
+import asyncio, hashlib, json, os, threading, time
+from collections import defaultdict, deque
+from typing import Any
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class CassetteMissError(Exception):
+    """
+    Raised in replay mode when a call has no recorded response.
+    """
+
+
+class Cassette:
+    """
+    Records external calls (LLM, embeddings, image search) to a JSONL file and replays them.
+
+    Each line is one call: {"kind", "fingerprint", "request", "response", "chunks", "timing"}.
+    The fingerprint is a hash of the kind and the request, identical requests are replayed in
+    the order they were recorded. Timing holds the call duration and, for streams, the offset of
+    every chunk from the start of the call so replays keep the original pacing.
+    """
+
+    def __init__(self, path: str, mode: str = "off", speed: float = 1.0):
+        if mode not in ("off", "record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.lock = threading.Lock()
+        self.entries = defaultdict(deque)
+        self.counters = {"recorded": 0, "replayed": 0, "misses": 0}
+        if mode == "replay":
+            self.load()
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @staticmethod
+    def fingerprint(kind: str, request: Any) -> str:
+        payload = json.dumps({"kind": kind, "request": request}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def load(self):
+        with open(self.path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.entries[entry["fingerprint"]].append(entry)
+        print(f"Loaded {sum(len(e) for e in self.entries.values())} cassette entries from {self.path}")
+
+    def record(self, kind: str, request: Any, response: Any, duration: float, chunks: list | None = None,
+               chunk_offsets: list[float] | None = None):
+        entry = {
+            "kind": kind,
+            "fingerprint": self.fingerprint(kind, request),
+            "request": request,
+            "response": response,
+            "chunks": chunks,
+            "timing": {"duration_seconds": duration, "chunk_offsets": chunk_offsets},
+            "recorded_at": time.time(),
+        }
+        line = json.dumps(entry, default=str)
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+            self.counters["recorded"] += 1
+
+    def take(self, kind: str, request: Any) -> dict:
+        """
+        Next recorded entry for this request. The last one is reused once the recordings run out.
+        """
+        fingerprint = self.fingerprint(kind, request)
+        with self.lock:
+            entries = self.entries.get(fingerprint)
+            if not entries:
+                self.counters["misses"] += 1
+                raise CassetteMissError(f"No recorded {kind} call for fingerprint {fingerprint[:12]}")
+            entry = entries.popleft() if len(entries) > 1 else entries[0]
+            self.counters["replayed"] += 1
+        return entry
+
+    def delay(self, seconds: float) -> float:
+        return seconds / self.speed if self.speed else 0.0
+
+    def call(self, kind: str, request: Any, fn):
+        """
+        Run a blocking call through the cassette: record its result, replay it, or just run it.
+        """
+        if self.replaying:
+            entry = self.take(kind, request)
+            time.sleep(self.delay(entry["timing"]["duration_seconds"]))
+            return entry["response"]
+        started_at = time.perf_counter()
+        response = fn()
+        if self.recording:
+            self.record(kind, request, response, time.perf_counter() - started_at)
+        return response
+
+    def stats(self) -> dict:
+        return {"mode": self.mode, "path": self.path, **self.counters}
+
+
+# the wrapped model runs without callbacks so its tokens are not streamed twice
+_INNER_CONFIG = {"callbacks": []}
+
+
+class CassetteChatModel(BaseChatModel):
+    """
+    Chat model that records the calls made to the wrapped model, or replays them without it.
+    Streams are replayed chunk by chunk at the recorded offsets.
+    """
+
+    inner: Any = None
+    cassette: Any = None
+    model: str = "cassette"
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette"
+
+    @staticmethod
+    def _request(messages) -> dict:
+        return {"messages": [[message.type, message.content] for message in messages]}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        request = self._request(messages)
+        text = self.cassette.call("llm", request, lambda: self.inner.invoke(messages, _INNER_CONFIG).content)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        request = self._request(messages)
+        if self.cassette.replaying:
+            entry = self.cassette.take("llm", request)
+            await asyncio.sleep(self.cassette.delay(entry["timing"]["duration_seconds"]))
+            text = entry["response"]
+        else:
+            started_at = time.perf_counter()
+            text = (await self.inner.ainvoke(messages, _INNER_CONFIG)).content
+            if self.cassette.recording:
+                await asyncio.to_thread(self.cassette.record, "llm", request, text, time.perf_counter() - started_at)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        request = self._request(messages)
+        if self.cassette.replaying:
+            entry = self.cassette.take("llm", request)
+            # a call recorded with ainvoke replays as one chunk at the end of its duration
+            chunks = entry["chunks"] or [entry["response"]]
+            offsets = entry["timing"]["chunk_offsets"] or [entry["timing"]["duration_seconds"]]
+            elapsed = 0.0
+            for text, offset in zip(chunks, offsets):
+                await asyncio.sleep(self.cassette.delay(max(offset - elapsed, 0.0)))
+                elapsed = offset
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
+                if run_manager:
+                    await run_manager.on_llm_new_token(text, chunk=chunk)
+                yield chunk
+            return
+
+        started_at = time.perf_counter()
+        chunks, offsets = [], []
+        async for inner_chunk in self.inner.astream(messages, _INNER_CONFIG):
+            chunks.append(inner_chunk.content)
+            offsets.append(time.perf_counter() - started_at)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=inner_chunk.content))
+            if run_manager:
+                await run_manager.on_llm_new_token(inner_chunk.content, chunk=chunk)
+            yield chunk
+        if self.cassette.recording:
+            await asyncio.to_thread(self.cassette.record, "llm", request, "".join(chunks),
+                                    time.perf_counter() - started_at, chunks, offsets)
+
+
+cassette = Cassette(
+    path=os.getenv("CASSETTE_PATH", "cassettes/tutor.jsonl"),
+    mode=os.getenv("CASSETTE_MODE", "off"),
+    speed=float(os.getenv("CASSETTE_REPLAY_SPEED", 1.0)),
+)
@@ -4,14 +4,19 @@ from pydantic import BaseModel
 from utility.auth import get_current_user_from_firebase_token
 from uuid import uuid4
 from db_utility.mongo_db import mongo_db
-from core_agents import build_agent, AgentState, generate_topic, get_image_urls
+from db_utility.message_buckets import message_bucket_store
+from core_agents import get_agent, AgentState, generate_topic, get_image_urls, schedule_summary_update
 from langchain_core.messages import AIMessageChunk
 from utility.preprocessing import extract_mcq
 from fastapi import WebSocket
 from utility.quizzes import save_quiz
 from db_utility.vector_db import VectorDB
-from utility.custom_libs import CustomMongoDBChatMessageHistory
-import os, json
+from utility.custom_libs import load_session_history
+from utility.admission import (ConnectionTurnQueue, MAX_PENDING_TURNS, SerializedWebSocket, admission_notice,
+                                receive_turns, turn_scheduler)
+from utility.metrics import time_to_first_token_seconds, turn_seconds
+from utility.tracing import tracer
+import os, json, asyncio, time
 
 vector_db = VectorDB()
 
@@ -23,32 +28,31 @@ mongodb_session_collection = mongo_db["sessions"]
 mongodb_quiz_collection = mongo_db["quizzes"]
 mongodb_conversations_collection = mongo_db["conversations"]
 
+# GET /conversations, newest first (explained by db_utility.indexes)
+CONVERSATION_LIST_PROJECTION = {"_id": 1, "topic": 1, "created_at": 1}
+CONVERSATION_LIST_SORT = [("created_at", -1)]
+
+
+def conversations_query(user_id: str) -> dict:
+    return {"user_id": user_id}
+
 chat_router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-def get_chat_history(session_id: str):
-    return CustomMongoDBChatMessageHistory(
-        session_id=session_id,
-        connection_string=os.getenv("MONGODB_CONNECTION_STRING"),
-        database_name="neurosattva",
-        collection_name="sessions",
-        max_recent_messages=100
-    )
-
 @chat_router.post("/")
-def chat(message: MessageSchema, current_user: dict = Depends(get_current_user_from_firebase_token)):
+async def chat(message: MessageSchema, current_user: dict = Depends(get_current_user_from_firebase_token)):
 
     try:
         # adding new coversation id to the list of conversation ids for the user
 
         new_conversation_id = str(uuid4())
-        conversation_topic = generate_topic(message.content)
+        conversation_topic = await generate_topic(message.content)
         
 
     
 
-        mongodb_conversations_collection.insert_one({
+        await mongodb_conversations_collection.insert_one({
             "_id": new_conversation_id,
             "user_id": current_user["uid"],
             "topic": conversation_topic,
@@ -66,24 +70,25 @@ def chat(message: MessageSchema, current_user: dict = Depends(get_current_user_f
         )
     
 @chat_router.get("/conversations")
-def get_conversations(limit: int = Query(10, ge=1),
+async def get_conversations(limit: int = Query(10, ge=1),
                     offset: int = Query(0, ge=0),
                        current_user: dict = Depends(get_current_user_from_firebase_token)):
     """
     Get all conversations for the current user.
     """
     try:
-        query = {"user_id": current_user["uid"]}
-        total = mongodb_conversations_collection.count_documents(query)
+        query = conversations_query(current_user["uid"])
+        total = await mongodb_conversations_collection.count_documents(query)
 
-        cursor = mongodb_conversations_collection.find(query, {"_id": 1, "topic": 1, "created_at": 1}).sort("created_at", -1).skip(offset).limit(limit)
+        cursor = mongodb_conversations_collection.find(query, CONVERSATION_LIST_PROJECTION).sort(CONVERSATION_LIST_SORT).skip(offset).limit(limit)
+        docs = await cursor.to_list()
         conversations = [
             {
                 "id": str(doc["_id"]),
                 "topic": doc["topic"],
                 "created_at": doc["created_at"].isoformat()
             }
-            for doc in cursor
+            for doc in docs
         ]
         return {"conversation_ids": conversations, "total": total}
     except Exception as e:
@@ -94,9 +99,8 @@ def get_conversations(limit: int = Query(10, ge=1),
 
 # implementing lazy loading using limit and offset
 @chat_router.get("/conversation/{conversation_id}")
-def get_paginated_conversation(conversation_id: str, limit: int = 10, offset: int = 0, current_user: dict = Depends(get_current_user_from_firebase_token)
+async def get_paginated_conversation(conversation_id: str, limit: int = 10, offset: int = 0, current_user: dict = Depends(get_current_user_from_firebase_token)
                                 ):
-    # Step 1: Get count only
     """
     Example response:
     {
@@ -108,27 +112,9 @@ def get_paginated_conversation(conversation_id: str, limit: int = 10, offset: in
         "total_messages": 100
     }
     """
-    pipeline = [
-        {"$match": {"_id": conversation_id}},
-        {"$project": {"count": {"$size": "$messages"}}}
-    ]
-    result = list(mongodb_session_collection.aggregate(pipeline))
-
-    if result:
-
-        total_messages = result[0]["count"]
-
-        # Step 2: Compute proper slice
-        start = max(total_messages - offset - limit, 0)
-        slice_count = min(limit, total_messages - offset)
-
-        # Step 3: Fetch just the required messages
-        conversation_doc = mongodb_session_collection.find_one(
-            {"_id": conversation_id},
-            {"_id": 1, "messages": {"$slice": [start, slice_count]}}
-        )
+    messages, total_messages = await message_bucket_store.read_page(conversation_id, limit=limit, offset=offset)
 
-        messages = conversation_doc.get("messages", [])
+    if total_messages:
         messages.reverse()  # Reverse to get latest messages first
 
         return {
@@ -138,6 +124,152 @@ def get_paginated_conversation(conversation_id: str, limit: int = 10, offset: in
         }
 
 
+async def run_tutor_turn(websocket: WebSocket, agent, config: dict, chat_history, data: dict, received_at: float) -> str:
+    """
+    Answer one client message: run the tutor graph and stream its output back on the websocket.
+    Returns the kind of turn (explanation, quiz or fallback) for metrics.
+    """
+    turn_span = tracer.current()
+    usr_msg = data.get("payload")
+    personalized_response = data.get("personalized_response", False)
+    source_list = None
+
+    print(f"Received message: {usr_msg}, personalized_response: {personalized_response}")
+
+    if personalized_response:
+        context, source_list = await asyncio.to_thread(vector_db.get_similar_documents, usr_msg, 3)
+        print(f"Context: {context}, Source List: {source_list}")
+
+    state = AgentState(
+        question=usr_msg,
+        context=context if personalized_response else "",
+        grade=data.get("grade", ""),
+        board=data.get("board", ""),
+        personalized_response=personalized_response,
+        full_explanation="",
+        messages=[],
+        stage="start",
+        intent=""
+    )
+
+    generated_quiz = ""
+    full_explanation = ""
+    last_node = None
+    first_token_sent = False
+
+    if personalized_response and source_list:
+        await websocket.send_json({"sender": "ai",
+                                   "text": source_list,
+                                   "from_agent": "response_source"})
+
+    async for mode, payload in agent.astream(state, config=config, stream_mode=["messages", "custom"]):
+
+        if mode == "custom":
+            # chunks generated ahead of time (speculative answers) are released by the node itself
+            current_node, text = payload["node"], payload["content"]
+        else:
+            chunk, metadata = payload
+            if not isinstance(chunk, AIMessageChunk):
+                continue
+            current_node, text = metadata.get("langgraph_node"), chunk.content
+
+        if current_node in ("answering_node", "fallback_node") and text and not first_token_sent:
+            time_to_first_token_seconds.observe(time.perf_counter() - received_at)
+            first_token_sent = True
+            if turn_span:
+                turn_span.set(ttft_ms=(time.perf_counter() - received_at) * 1000)
+
+        if current_node == "answering_node":
+            if last_node != current_node:
+                print("\n--- Answering Node ---\n")
+                last_node = current_node
+            # print(text, end="", flush=True)
+            await websocket.send_json({"sender": "ai",
+                                       "text": text,
+                                       "type": "stream",
+                                       "from_agent": current_node})
+            full_explanation += text
+        elif current_node == "quiz_generation":
+            if last_node != current_node:
+                print("\n--- Quiz Generation Node ---\n")
+                last_node = current_node
+            # print(text, end="", flush=True)
+            generated_quiz += text
+
+        elif current_node == "fallback_node":
+            if last_node != current_node:
+                print("\n--- Fallback Node ---\n")
+                last_node = current_node
+            # print(text, end="", flush=True)
+            await websocket.send_json({"sender": "ai",
+                                       "text": text,
+                                       "type": "stream",
+                                       "from_agent": current_node})
+
+    
+    if full_explanation:
+        images = await get_image_urls(full_explanation)
+        await chat_history.add_user_message(state.get("question"))
+
+        if personalized_response and source_list:
+            await chat_history.add_ai_message(full_explanation, sources=source_list, image_links=images)
+        else:
+            await chat_history.add_ai_message(full_explanation, image_links=images)
+        res = {"sender": "ai",
+                                   "text": images,
+                                   "from_agent": "media_generator"}
+        print(f"Image URLs: {res}")
+        await websocket.send_json({"sender": "ai",
+                                   "text": images,
+                                   "from_agent": "media_generator"})
+        
+    if generated_quiz:
+        print(f"\nGenerated Quiz: {generated_quiz}\n")
+        # extracted_quiz = extract_mcq(generated_quiz)
+        extracted_quiz = await save_quiz(extract_mcq(generated_quiz))
+        print(f"\nExtracted Quiz: {extracted_quiz}\n")
+        extracted_quiz["created_at"] = extracted_quiz["created_at"].isoformat()
+        # print(f"\nQuiz question generated: {extracted_quiz}\n")
+        # to write function here to save the quiz in firestore
+        await websocket.send_json({"sender": "ai",
+                                   "text": extracted_quiz,
+                                   "from_agent": "quiz_generator"})
+
+    # refresh the rolling conversation summary off the turn's critical path
+    schedule_summary_update(chat_history)
+    return "explanation" if full_explanation else "quiz" if generated_quiz else "fallback"
+
+
+async def handle_tutor_turn(websocket: WebSocket, agent, config: dict, chat_history, user_id: str,
+                            conversation_id: str, data: dict, received_at: float) -> bool:
+    """
+    Admit one turn through the fair scheduler and run it, with its trace and metrics.
+    Returns False when the turn failed and the connection should be closed.
+    """
+    outcome = "error"
+    try:
+        with tracer.trace("tutor_turn", user_id=user_id, conversation_id=conversation_id,
+                          personalized_response=bool(data.get("personalized_response"))) as turn_span:
+            if turn_scheduler.saturated():
+                await websocket.send_json(admission_notice(
+                    "The tutor is busy right now, your question will be answered shortly.", "queued"))
+            async with turn_scheduler.turn(user_id):
+                if turn_span:
+                    turn_span.set(admission_wait_ms=(time.perf_counter() - received_at) * 1000)
+                outcome = await run_tutor_turn(websocket, agent, config, chat_history, data, received_at)
+            if turn_span:
+                turn_span.set(outcome=outcome)
+        return True
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    except Exception as e:
+        print(f"Websocket error: {e}")
+        return False
+    finally:
+        turn_seconds.labels(outcome).observe(time.perf_counter() - received_at)
+
+
 @chat_router.websocket("/ws/ai-tutor")
 async def websocket_endpoint(websocket: WebSocket):
 
@@ -150,109 +282,35 @@ async def websocket_endpoint(websocket: WebSocket):
         return
     
     await websocket.accept()
+    # the receiver and the running turn both send on it
+    websocket = SerializedWebSocket(websocket)
 
-    agent = build_agent()
-    config = {"configurable": {"session_id": conversation_id}}
-
-    while True:
-        try:
-            data = await websocket.receive_json()
-            usr_msg = data.get("payload")
-            personalized_response = data.get("personalized_response", False)
-            source_list = None
+    agent = get_agent()
+    # history is read from Mongo once per connection, turns are appended locally and written through
+    chat_history = await load_session_history(conversation_id)
+    config = {"configurable": {"session_id": conversation_id, "chat_history": chat_history}}
 
-            print(f"Received message: {usr_msg}, personalized_response: {personalized_response}")
+    # messages are received concurrently so they can be admitted or rejected while a turn is running
+    turns = ConnectionTurnQueue(MAX_PENDING_TURNS)
+    receiver = asyncio.create_task(receive_turns(websocket, user_id, turns))
 
-            if personalized_response:
-                context, source_list = vector_db.get_similar_documents(usr_msg, top_k=3)
-                print(f"Context: {context}, Source List: {source_list}")
-
-            state = AgentState(
-                question=usr_msg,
-                context=context if personalized_response else "",
-                grade=data.get("grade", ""),
-                board=data.get("board", ""),
-                personalized_response=personalized_response,
-                full_explanation="",
-                messages=[],
-                stage="start",
-                intent=""
-            )
-
-            generated_quiz = ""
-            full_explanation = ""
-            last_node = None
-
-            if personalized_response and source_list:
-                await websocket.send_json({"sender": "ai",
-                                           "text": source_list,
-                                           "from_agent": "response_source"})
-
-            for chunk, metadata in agent.stream(state, config=config, stream_mode="messages"):
-                
-                if isinstance(chunk, AIMessageChunk):
-                    current_node = metadata.get("langgraph_node")
-                        
-                    if current_node == "answering_node":
-                        if last_node != current_node:
-                            print("\n--- Answering Node ---\n")
-                            last_node = current_node
-                        # print(chunk.content, end="", flush=True)
-                        await websocket.send_json({"sender": "ai",
-                                                   "text": chunk.content,
-                                                   "type": "stream",
-                                                   "from_agent": current_node})
-                        full_explanation += chunk.content
-                    elif current_node == "quiz_generation":
-                        if last_node != current_node:
-                            print("\n--- Quiz Generation Node ---\n")
-                            last_node = current_node
-                        # print(chunk.content, end="", flush=True)
-                        generated_quiz += chunk.content
-
-                    elif current_node == "fallback_node":
-                        if last_node != current_node:
-                            print("\n--- Fallback Node ---\n")
-                            last_node = current_node
-                        # print(chunk.content, end="", flush=True)
-                        await websocket.send_json({"sender": "ai",
-                                                   "text": chunk.content,
-                                                   "type": "stream",
-                                                   "from_agent": current_node})
-
-            
-            if full_explanation:
-                images = get_image_urls(full_explanation)
-                chat_history = get_chat_history(config["configurable"]["session_id"])
-                chat_history.add_user_message(state.get("question"))
-
-                if personalized_response and source_list:
-                    chat_history.add_ai_message(full_explanation, sources=source_list, image_links=images)
-                else:
-                    chat_history.add_ai_message(full_explanation, image_links=images)
-                res = {"sender": "ai",
-                                           "text": images,
-                                           "from_agent": "media_generator"}
-                print(f"Image URLs: {res}")
-                await websocket.send_json({"sender": "ai",
-                                           "text": images,
-                                           "from_agent": "media_generator"})
-                
-            if generated_quiz:
-                print(f"\nGenerated Quiz: {generated_quiz}\n")
-                # extracted_quiz = extract_mcq(generated_quiz)
-                extracted_quiz = save_quiz(extract_mcq(generated_quiz))
-                print(f"\nExtracted Quiz: {extracted_quiz}\n")
-                extracted_quiz["created_at"] = extracted_quiz["created_at"].isoformat()
-                # print(f"\nQuiz question generated: {extracted_quiz}\n")
-                # to write function here to save the quiz in firestore
-                await websocket.send_json({"sender": "ai",
-                                           "text": extracted_quiz,
-                                           "from_agent": "quiz_generator"})
-                
-        except Exception as e:
-            print(f"Websocket error: {e}")
-            break
+    try:
+        while (turn := await turns.next()) is not None:
+            data, received_at = turn
+            # a child task, so a disconnect cancels the turn instead of letting it run against a dead socket
+            turn_task = turns.start(handle_tutor_turn(websocket, agent, config, chat_history, user_id,
+                                                      conversation_id, data, received_at))
+            await asyncio.wait({turn_task})
+            turns.done()
+            if turn_task.cancelled():
+                print(f"Client left, cancelled the running turn of conversation {conversation_id}")
+                break
+            if not turn_task.result():
+                break
+    finally:
+        receiver.cancel()
+        if turns.running is not None:
+            turns.running.cancel()
 
 
 # a test function to simulate model response
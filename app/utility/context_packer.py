@@ -0,0 +1,146 @@
+import math, os, re
+from typing import TypedDict
+
+# Budget for the variable part of a tutor prompt (question, context, history, summary)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 3000))
+# Retrieved context may use at most this share of the budget so recent turns still fit
+CONTEXT_MAX_SHARE = float(os.getenv("PROMPT_CONTEXT_MAX_SHARE", 0.6))
+# Don't bother adding a truncated message or summary smaller than this
+MIN_PARTIAL_TOKENS = 50
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+packing_stats = {
+    "turns": 0,
+    "prompt_tokens_total": 0,
+    "prompt_tokens_max": 0,
+    "truncated_turns": 0,
+}
+
+
+class PackedContext(TypedDict):
+    question: str
+    context: str
+    history: list[tuple[str, str]]
+    summary: str
+    tokens: dict[str, int]
+    truncated: bool
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Local token estimate: words and punctuation marks, scaled for sub-word splits.
+    """
+    if not text:
+        return 0
+    return math.ceil(len(_TOKEN_RE.findall(text)) * 1.3)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # cut on a piece boundary, keeping the beginning of the text
+    pieces = list(_TOKEN_RE.finditer(text))
+    keep = max(math.floor(max_tokens / 1.3) - 1, 0)  # one piece is left for the ellipsis
+    if keep == 0:
+        return ""
+    return text[:pieces[keep - 1].end()] + " …"
+
+
+def _pack_paragraphs(text: str, max_tokens: int) -> str:
+    """
+    Keep whole paragraphs (retrieved chunks) in order while they fit, then a truncated partial one.
+    """
+    kept, used = [], 0
+    for paragraph in text.split("\n"):
+        cost = estimate_tokens(paragraph)
+        if used + cost <= max_tokens:
+            kept.append(paragraph)
+            used += cost
+            continue
+        if max_tokens - used >= MIN_PARTIAL_TOKENS:
+            kept.append(truncate_to_tokens(paragraph, max_tokens - used))
+        break
+    return "\n".join(kept)
+
+
+def pack_context(question: str = "", context: str = "", history: list[tuple[str, str]] = None,
+                 summary: str = "", budget: int = PROMPT_TOKEN_BUDGET, context_share: float = CONTEXT_MAX_SHARE,
+                 label: str = "prompt") -> PackedContext:
+    """
+    Fill a token budget by priority: current question, retrieved context, recent turns
+    (newest first), then the conversation summary. Lower priority parts are truncated or dropped.
+    """
+    remaining = budget
+    truncated = False
+
+    packed_question = truncate_to_tokens(question, remaining)
+    remaining -= estimate_tokens(packed_question)
+    truncated |= packed_question != question
+
+    packed_context = _pack_paragraphs(context, min(remaining, int(budget * context_share))) if context else ""
+    remaining -= estimate_tokens(packed_context)
+    truncated |= packed_context != context
+
+    packed_history = []
+    for role, content in reversed(history or []):
+        cost = estimate_tokens(content)
+        if cost <= remaining:
+            packed_history.append((role, content))
+            remaining -= cost
+            continue
+        truncated = True
+        if remaining >= MIN_PARTIAL_TOKENS:
+            partial = truncate_to_tokens(content, remaining)
+            packed_history.append((role, partial))
+            remaining -= estimate_tokens(partial)
+        break
+    packed_history.reverse()
+
+    packed_summary = ""
+    if summary:
+        if estimate_tokens(summary) <= remaining:
+            packed_summary = summary
+        elif remaining >= MIN_PARTIAL_TOKENS:
+            packed_summary = truncate_to_tokens(summary, remaining)
+        truncated |= packed_summary != summary
+
+    tokens = {
+        "question": estimate_tokens(packed_question),
+        "context": estimate_tokens(packed_context),
+        "history": sum(estimate_tokens(content) for _, content in packed_history),
+        "summary": estimate_tokens(packed_summary),
+    }
+    tokens["total"] = sum(tokens.values())
+
+    packing_stats["turns"] += 1
+    packing_stats["prompt_tokens_total"] += tokens["total"]
+    packing_stats["prompt_tokens_max"] = max(packing_stats["prompt_tokens_max"], tokens["total"])
+    packing_stats["truncated_turns"] += int(truncated)
+    print(f"Prompt tokens ({label}): {tokens} budget={budget} truncated={truncated}")
+
+    return PackedContext(
+        question=packed_question,
+        context=packed_context,
+        history=packed_history,
+        summary=packed_summary,
+        tokens=tokens,
+        truncated=truncated,
+    )
+
+
+def packed_history_messages(packed: PackedContext) -> list[tuple[str, str]]:
+    """
+    Prompt history for a MessagesPlaceholder: the summary as a system message, then recent turns.
+    """
+    if packed["summary"]:
+        return [("system", f"Summary of the earlier conversation:\n{packed['summary']}")] + packed["history"]
+    return packed["history"]
+
+
+def get_packing_stats() -> dict:
+    stats = dict(packing_stats)
+    stats["prompt_tokens_average"] = stats["prompt_tokens_total"] / stats["turns"] if stats["turns"] else 0.0
+    return stats
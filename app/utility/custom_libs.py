@@ -1,51 +1,58 @@
 from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.messages import AIMessage, HumanMessage, BaseMessage
-from pymongo import MongoClient
 from google.cloud import firestore
 from datetime import datetime
-
-class CustomMongoDBChatMessageHistory(BaseChatMessageHistory):
-    def __init__(self, session_id: str, connection_string: str, database_name: str, collection_name: str, max_recent_messages: int = 100):
+from collections import deque
+from db_utility.message_buckets import MessageBucketStore, message_bucket_store
+from utility.tracing import traced
+
+class CustomMongoDBChatMessageHistory:
+    """
+    A session's messages in the bucketed message store. All access goes through the async driver.
+    Not a LangChain BaseChatMessageHistory: messages are read back as {"role", "content", ...} dicts
+    (the shape the prompts and the conversation API use), not BaseMessage objects.
+    """
+
+    def __init__(self, session_id: str, store: MessageBucketStore, max_recent_messages: int = 100):
+        # the session is created lazily by the first write (upsert)
         self.session_id = session_id
-        self.client = MongoClient(connection_string)
-        self.collection = self.client[database_name][collection_name]
+        self.store = store
         self.max_recent_messages = max_recent_messages
 
-        # Initialize if doesn't exist
-        existing = self.collection.find_one({"_id": session_id})
-        if not existing:
-            self.collection.insert_one({"_id": session_id, "messages": []})
-
-    @property
-    def messages(self) -> list[BaseMessage]:
-        doc = self.collection.find_one({"_id": self.session_id}, {"messages": {"$slice": -self.max_recent_messages}})
-        messages = doc.get("messages", [])
-        
-        # Optional: sort messages by timestamp
-        messages.sort(key=lambda x: x.get("timestamp", ""))
-        
+    async def get_messages(self) -> list[dict]:
+        messages = await self.store.read_recent(self.session_id, self.max_recent_messages)
         return [self._dict_to_message(msg) for msg in messages]
 
-    def add_user_message(self, message: str) -> None:
-        self._append_message(HumanMessage(content=message))
+    async def add_user_message(self, message: str) -> int:
+        return await self._append_message(HumanMessage(content=message))
 
-    def add_ai_message(self, message: str, sources: list[str]=None, image_links: list[dict]=None) -> None:
-        self._append_message(AIMessage(content=message), sources=sources, image_links=image_links)
+    async def add_ai_message(self, message: str, sources: list[str]=None, image_links: list[dict]=None) -> int:
+        return await self._append_message(AIMessage(content=message), sources=sources, image_links=image_links)
 
-    def _append_message(self, message: BaseMessage, sources: list[str] = None, image_links: list[dict] = None) -> None:
+    async def _append_message(self, message: BaseMessage, sources: list[str] = None, image_links: list[dict] = None) -> int:
+        """
+        Append a message and return its sequence number in the session.
+        """
         if message.type == "ai":
-            self.collection.update_one(
-                {"_id": self.session_id},
-                {"$push": {"messages": self._message_to_dict(message, sources=sources, image_links=image_links)}}
-            )
+            return await self.store.append(self.session_id, self._message_to_dict(message, sources=sources, image_links=image_links))
         else:
-            self.collection.update_one(
-                {"_id": self.session_id},
-                {"$push": {"messages": self._message_to_dict(message)}}
-            )
+            return await self.store.append(self.session_id, self._message_to_dict(message))
 
-    def clear(self) -> None:
-        self.collection.update_one({"_id": self.session_id}, {"$set": {"messages": []}})
+    async def clear(self) -> None:
+        await self.store.clear(self.session_id)
+
+    async def get_session(self) -> dict:
+        return await self.store.get_session(self.session_id)
+
+    async def recent_messages(self, limit: int, total: int | None = None) -> list[dict]:
+        messages = await self.store.read_recent(self.session_id, limit, total=total)
+        return [self._dict_to_message(msg) for msg in messages]
+
+    async def messages_between(self, start: int, end: int) -> list[dict]:
+        return [self._dict_to_message(msg) for msg in await self.store.read_range(self.session_id, start, end)]
+
+    async def save_summary(self, summary: str, summary_message_count: int) -> None:
+        await self.store.save_summary(self.session_id, summary, summary_message_count)
 
     def _message_to_dict(self, message: BaseMessage, sources: list[str] = None, image_links: list[dict] = None) -> dict:
         if message.type == "ai":
@@ -77,7 +84,7 @@ class CustomMongoDBChatMessageHistory(BaseChatMessageHistory):
                 "timestamp": datetime.now()
             }
 
-    def _dict_to_message(self, data: dict) -> BaseMessage:
+    def _dict_to_message(self, data: dict) -> dict:
         msg_type = data["type"]
         content = data["data"]["content"]
         sources = data["data"].get("sources", [])
@@ -91,6 +98,71 @@ class CustomMongoDBChatMessageHistory(BaseChatMessageHistory):
             raise ValueError(f"Unsupported message type: {msg_type}")
         
 
+def get_chat_history(session_id: str, max_recent_messages: int = 100) -> CustomMongoDBChatMessageHistory:
+    """
+    History store for a session, backed by the bucketed message store on the shared Mongo client.
+    """
+    return CustomMongoDBChatMessageHistory(
+        session_id=session_id,
+        store=message_bucket_store,
+        max_recent_messages=max_recent_messages
+    )
+
+
+class SessionChatHistory:
+    """
+    Per-connection history for a session: loaded from the store once, kept in a bounded
+    in-memory window and written through to the store on every append. message_count follows the
+    store's sequence numbers, so it also counts messages other connections appended to the session.
+    """
+
+    def __init__(self, store: CustomMongoDBChatMessageHistory, session: dict, recent: list, max_messages: int = 20):
+        self.store = store
+        self.session_id = store.session_id
+        self.message_count = session.get("message_count", 0)
+        # rolling summary of the conversation up to message number summary_message_count
+        self.summary = session.get("summary", "")
+        self.summary_message_count = session.get("summary_message_count", 0)
+        self.summary_in_progress = False
+        self.recent = deque(recent, maxlen=max_messages)
+
+    @property
+    def messages(self) -> list[dict]:
+        return list(self.recent)
+
+    @traced("chat_history.add_user_message")
+    async def add_user_message(self, message: str) -> None:
+        seq = await self.store.add_user_message(message)
+        self.recent.append({"role": "human", "content": message})
+        self.message_count = seq + 1
+
+    @traced("chat_history.add_ai_message")
+    async def add_ai_message(self, message: str, sources: list[str]=None, image_links: list[dict]=None) -> None:
+        seq = await self.store.add_ai_message(message, sources=sources, image_links=image_links)
+        self.recent.append({"role": "assistant", "content": message, "sources": sources or [], "image_links": image_links or []})
+        self.message_count = seq + 1
+
+    async def clear(self) -> None:
+        await self.store.clear()
+        self.recent.clear()
+        self.message_count = 0
+        self.summary, self.summary_message_count = "", 0
+
+    def needs_summary(self, every_turns: int) -> bool:
+        unsummarized = self.message_count - self.summary_message_count
+        return not self.summary_in_progress and unsummarized >= every_turns * 2
+
+
+async def load_session_history(session_id: str, max_messages: int = 20) -> SessionChatHistory:
+    """
+    Read the last max_messages of a session once, for the lifetime of a WebSocket connection.
+    """
+    store = get_chat_history(session_id, max_recent_messages=max_messages)
+    session = await store.get_session()
+    recent = await store.recent_messages(max_messages, total=session.get("message_count", 0))
+    return SessionChatHistory(store, session, recent, max_messages=max_messages)
+
+
 class FirestoreChatMessageHistory(BaseChatMessageHistory):
     def __init__(self, session_id: str, collection_name: str = "chat_histories"):
         self.session_id = session_id
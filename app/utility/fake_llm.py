@@ -0,0 +1,111 @@
+import asyncio, hashlib, random, re, time
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# (seconds before the first token, tokens per second after it); 0 tokens per second means no delay
+FAKE_LLM_PROFILES = {
+    "instant": (0.0, 0),
+    "fast": (0.15, 200),
+    "gemini": (0.6, 90),
+    "slow": (2.0, 25),
+}
+
+_WORDS = (
+    "energy light force motion plants cells water heat matter atoms sound electricity "
+    "example diagram process system surface pressure reaction change structure balance "
+    "students notice everyday simple because which means that when this helps explain"
+).split()
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Offline stand-in for the tutor's chat model, selected with LLM_PROVIDER=fake.
+    Replies are deterministic for a given prompt and shaped like what each tutor prompt
+    expects (intent labels, quiz markdown, topics), streamed at the profile's latency and token rate.
+    """
+
+    profile: str = "fast"
+    first_token_seconds: float = 0.15
+    tokens_per_second: float = 200
+    answer_words: int = 250
+    seed: int = 0
+    model: str = "fake-tutor"
+
+    @classmethod
+    def from_profile(cls, profile: str, **kwargs) -> "FakeChatModel":
+        first_token_seconds, tokens_per_second = FAKE_LLM_PROFILES[profile]
+        return cls(profile=profile, first_token_seconds=first_token_seconds,
+                   tokens_per_second=tokens_per_second, **kwargs)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-tutor"
+
+    @staticmethod
+    def _pieces(text: str) -> list[str]:
+        return re.findall(r"\S+\s*", text)
+
+    def _token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def respond(self, messages) -> str:
+        system = next((m.content for m in messages if m.type == "system"), "")
+        question = next((m.content for m in reversed(messages) if m.type == "human"), "")
+        question = question.replace("User's query:", "").strip()
+        subject = " ".join(re.findall(r"[A-Za-z]+", question)[:6]) or "the topic"
+
+        if "intent classifier" in system:
+            return "quiz" if re.search(r"\b(quiz|test|questions?)\b", question, re.I) else "explanation"
+        if "question generator" in system:
+            return (
+                f"### Question:\nWhich statement about {subject} is correct?\n\n"
+                "**A.** It depends only on colour\n**B.** It follows a predictable process\n"
+                "**C.** It never changes\n**D.** It cannot be observed\n\n"
+                "**Correct Answer:** B\n\n**Explanation:** The explanation described a predictable process.\n\n"
+                "**Difficulty:** easy\n\n**Subject:** Science"
+            )
+        if "topic generator" in system:
+            return subject.title()
+        if "search query" in system:
+            return f"{subject.lower()} educational diagram"
+        if "summar" in system:
+            return f"The student asked about {subject} and the tutor explained the key ideas with examples."
+
+        rng = random.Random(self.seed + int(hashlib.sha256(question.encode("utf-8")).hexdigest()[:8], 16))
+        sentences, words = [f"## {subject.title()}\n\n"], 0
+        while words < self.answer_words:
+            sentence = rng.sample(_WORDS, 12)
+            sentences.append(" ".join(sentence).capitalize() + ". ")
+            words += len(sentence)
+        return "".join(sentences).strip()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text = self.respond(messages)
+        time.sleep(self.first_token_seconds + self._token_delay() * len(self._pieces(text)))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text = self.respond(messages)
+        await asyncio.sleep(self.first_token_seconds + self._token_delay() * len(self._pieces(text)))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token_seconds)
+        for index, piece in enumerate(self._pieces(self.respond(messages))):
+            if index:
+                time.sleep(self._token_delay())
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.first_token_seconds)
+        for index, piece in enumerate(self._pieces(self.respond(messages))):
+            if index:
+                await asyncio.sleep(self._token_delay())
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
@@ -2,7 +2,9 @@ from fastapi import APIRouter, HTTPException, Response, Query
 import requests
 from io import BytesIO
 from PIL import Image
+from utility.metrics import dependency_seconds, timed
 
+image_proxy_fetch_seconds = dependency_seconds.labels("image_proxy_fetch")
 
 image_router = APIRouter(
     responses={404: {"description": "Not found"}},
@@ -12,7 +14,8 @@ image_router = APIRouter(
 @image_router.get("/proxy-image")
 async def get_image_thumbnail(url: str, width:int = 300):
     try:
-        resp = requests.get(url, timeout=5)
+        with timed(image_proxy_fetch_seconds):
+            resp = requests.get(url, timeout=5)
         image = Image.open(BytesIO(resp.content))
         image.thumbnail((width, width))
         thumb_io = BytesIO()
@@ -0,0 +1,167 @@
+import json, math, os, re
+from collections import Counter
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets")
+MODEL_PATH = os.path.join(ASSETS_DIR, "intent_classifier.json")
+TRAINING_DATA_PATH = os.path.join(ASSETS_DIR, "intent_training_data.json")
+
+INTENT_LABELS = ("explanation", "quiz", "general")
+RULE_CONFIDENCE = 0.95
+
+# High precision patterns, a rule only decides the intent when exactly one label matches
+INTENT_RULES = {
+    "quiz": [
+        re.compile(r"\b(quiz|mcqs?|multiple[- ]choice|practice questions?)\b", re.IGNORECASE),
+        re.compile(r"\btest (me|my|myself)\b", re.IGNORECASE),
+        re.compile(r"\b(ask|give|generate|create|make) (me )?(a |an |one more |another |some )?(questions?|mcq)\b", re.IGNORECASE),
+    ],
+    "explanation": [
+        re.compile(r"^\s*((can|could) you )?(please )?(explain|describe|define|teach me|help me (understand|learn))\b", re.IGNORECASE),
+        re.compile(r"^\s*(what|why) (is|are) (the |a |an )?(?!you\b|your\b|it\b|that\b|this\b)\w+|^\s*how (does|do) (?!you\b|i\b)\w+", re.IGNORECASE),
+    ],
+    "general": [
+        re.compile(r"^\s*(hi|hello|hey|thanks|thank you|ok|okay|bye|good (morning|night|evening))\b[\s!.]*$", re.IGNORECASE),
+        re.compile(r"\b(last|previous) (question|message)\b|\bwhat did (i|we|you) (just )?(ask|say|talk)", re.IGNORECASE),
+        re.compile(r"\b(who|what) are you\b|\byour name\b", re.IGNORECASE),
+    ],
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercased unigrams and bigrams used as TF-IDF features.
+    """
+    words = _TOKEN_RE.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def _tfidf(tokens: list[str], idf: dict[str, float]) -> dict[str, float]:
+    counts = Counter(t for t in tokens if t in idf)
+    vector = {t: (1 + math.log(c)) * idf[t] for t, c in counts.items()}
+    norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+    return {t: v / norm for t, v in vector.items()}
+
+
+def _softmax(scores: dict[str, float]) -> dict[str, float]:
+    top = max(scores.values())
+    exp = {k: math.exp(v - top) for k, v in scores.items()}
+    total = sum(exp.values())
+    return {k: v / total for k, v in exp.items()}
+
+
+def train_model(samples: list[dict], epochs: int = 400, learning_rate: float = 2.0, l2: float = 1e-4) -> dict:
+    """
+    Train a TF-IDF + multinomial logistic regression model on {"text", "label"} samples.
+    Returns the JSON serialisable model artifact.
+    """
+    documents = [tokenize(s["text"]) for s in samples]
+    doc_freq = Counter(t for tokens in documents for t in set(tokens))
+    idf = {t: math.log((1 + len(documents)) / (1 + df)) + 1 for t, df in doc_freq.items()}
+    vectors = [_tfidf(tokens, idf) for tokens in documents]
+    labels = [s["label"] for s in samples]
+
+    weights = {label: {} for label in INTENT_LABELS}
+    bias = {label: 0.0 for label in INTENT_LABELS}
+    n = len(vectors)
+
+    # full batch gradient descent, deterministic so the artifact is reproducible
+    for _ in range(epochs):
+        grad_w = {label: Counter() for label in INTENT_LABELS}
+        grad_b = {label: 0.0 for label in INTENT_LABELS}
+        for vector, label in zip(vectors, labels):
+            scores = {l: bias[l] + sum(weights[l].get(t, 0.0) * v for t, v in vector.items()) for l in INTENT_LABELS}
+            probs = _softmax(scores)
+            for l in INTENT_LABELS:
+                error = probs[l] - (1.0 if l == label else 0.0)
+                grad_b[l] += error
+                for t, v in vector.items():
+                    grad_w[l][t] += error * v
+        for l in INTENT_LABELS:
+            bias[l] -= learning_rate * grad_b[l] / n
+            w = weights[l]
+            for t in set(w) | set(grad_w[l]):
+                w[t] = w.get(t, 0.0) - learning_rate * (grad_w[l][t] / n + l2 * w.get(t, 0.0))
+
+    return {
+        "labels": list(INTENT_LABELS),
+        "idf": {t: round(v, 6) for t, v in idf.items()},
+        "weights": {l: {t: round(v, 6) for t, v in w.items() if abs(v) > 1e-4} for l, w in weights.items()},
+        "bias": bias,
+    }
+
+
+class IntentClassifier:
+    """
+    In-process intent classifier: regex rules first, then a small TF-IDF + linear model.
+    classify() returns (None, confidence) when neither is confident enough so the caller
+    can fall back to the LLM.
+    """
+
+    def __init__(self, model_path: str = MODEL_PATH, confidence_threshold: float = 0.8):
+        self.confidence_threshold = confidence_threshold
+        self.model = None
+        if os.path.exists(model_path):
+            with open(model_path, "r") as f:
+                self.model = json.load(f)
+        else:
+            print(f"Intent model not found at {model_path}, using rules only.")
+        self.counters = {"rule_hits": 0, "model_hits": 0, "llm_fallbacks": 0}
+
+    def _match_rules(self, text: str):
+        matched = {label for label, patterns in INTENT_RULES.items() if any(p.search(text) for p in patterns)}
+        return matched.pop() if len(matched) == 1 else None
+
+    def predict_proba(self, text: str) -> dict[str, float]:
+        if not self.model:
+            return {}
+        vector = _tfidf(tokenize(text), self.model["idf"])
+        scores = {
+            label: self.model["bias"][label] + sum(self.model["weights"][label].get(t, 0.0) * v for t, v in vector.items())
+            for label in self.model["labels"]
+        }
+        return _softmax(scores)
+
+    def classify(self, text: str) -> tuple[str | None, float]:
+        text = text or ""
+        label = self._match_rules(text)
+        if label:
+            self.counters["rule_hits"] += 1
+            return label, RULE_CONFIDENCE
+
+        probs = self.predict_proba(text)
+        if probs:
+            label, confidence = max(probs.items(), key=lambda item: item[1])
+            if confidence >= self.confidence_threshold:
+                self.counters["model_hits"] += 1
+                return label, confidence
+        else:
+            confidence = 0.0
+
+        self.counters["llm_fallbacks"] += 1
+        return None, confidence
+
+    def stats(self) -> dict:
+        total = sum(self.counters.values())
+        local = self.counters["rule_hits"] + self.counters["model_hits"]
+        return {
+            **self.counters,
+            "confidence_threshold": self.confidence_threshold,
+            "local_hit_rate": local / total if total else 0.0,
+        }
+
+
+intent_classifier = IntentClassifier(confidence_threshold=float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", 0.8)))
+
+
+if __name__ == "__main__":
+    # Retrain the shipped artifact: python -m utility.intent_classifier
+    with open(TRAINING_DATA_PATH, "r") as f:
+        samples = json.load(f)
+    model = train_model(samples)
+    with open(MODEL_PATH, "w") as f:
+        json.dump(model, f)
+    classifier = IntentClassifier(MODEL_PATH)
+    correct = sum(1 for s in samples if max(classifier.predict_proba(s["text"]).items(), key=lambda i: i[1])[0] == s["label"])
+    print(f"Trained intent model on {len(samples)} samples, training accuracy: {correct / len(samples):.2%}")
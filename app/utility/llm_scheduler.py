@@ -0,0 +1,256 @@
+import asyncio, heapq, itertools, os, time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from google.api_core import exceptions as google_exceptions
+from langchain_core.callbacks import AsyncCallbackHandler, BaseCallbackManager
+from langchain_core.runnables import ensure_config
+from utility.metrics import llm_call_seconds, llm_queue_seconds, timed
+from utility.tracing import tracer
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # streaming answers and anything on a tutor turn's critical path
+    QUIZ = 1         # quiz generation
+    BACKGROUND = 2   # topics, image search queries, summaries
+
+
+# provider errors worth another attempt: rate limits, overload and timeouts
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+
+class LoadShedError(Exception):
+    """
+    Raised when low priority work is rejected because the LLM queue is saturated.
+    """
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def try_acquire(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def seconds_until_available(self) -> float:
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    async def acquire(self):
+        while not self.try_acquire():
+            await asyncio.sleep(self.seconds_until_available())
+
+
+class TokenWatcher(AsyncCallbackHandler):
+    """
+    Notes whether a call has streamed any token to the callbacks (and from there to the client).
+    """
+
+    def __init__(self):
+        self.emitted = False
+
+    async def on_llm_new_token(self, token: str, **kwargs):
+        if token:
+            self.emitted = True
+
+
+def with_callback(config, handler):
+    config = ensure_config(config)
+    callbacks = config.get("callbacks")
+    if isinstance(callbacks, BaseCallbackManager):
+        callbacks = callbacks.copy()
+        callbacks.add_handler(handler, inherit=True)
+    else:
+        callbacks = [*(callbacks or []), handler]
+    return {**config, "callbacks": callbacks}
+
+
+class LLMScheduler:
+    """
+    Gate in front of the LLM provider: at most max_concurrency calls in flight, a token bucket
+    rate limit on call starts, and a priority queue so interactive work is admitted first.
+    Calls wait in one priority queue for both a slot and a rate limit token, only the head of the
+    queue takes tokens, so throttled calls are still admitted in priority order and counted in the
+    queue depth. Background work is shed once shed_queue_depth calls are already waiting.
+    Failed calls are retried here (the model clients do not retry), up to max_retries times with
+    exponential backoff, each attempt taking a new token and slot.
+    """
+
+    def __init__(self, max_concurrency: int = 8, requests_per_second: float = 5, burst: int = 10,
+                 shed_queue_depth: int = 16, max_retries: int = 2, retry_backoff_seconds: float = 1.0):
+        self.max_concurrency = max_concurrency
+        self.shed_queue_depth = shed_queue_depth
+        self.max_retries = max_retries
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.bucket = TokenBucket(requests_per_second, burst)
+        self.active = 0
+        self._waiters = []  # heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+        self._refill_timer: asyncio.TimerHandle | None = None
+        self.counters = {
+            p.name.lower(): {"admitted": 0, "shed": 0, "retried": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+            for p in Priority
+        }
+
+    def queue_depth(self, priority: Priority | None = None) -> int:
+        return sum(1 for p, _, f in self._waiters if not f.done() and (priority is None or p == priority))
+
+    async def _acquire(self, priority: Priority):
+        if self.active < self.max_concurrency and not self._waiters and self.bucket.try_acquire():
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was handed over just as we were cancelled, pass it on
+                self._release()
+            raise
+
+    def _dispatch(self):
+        """
+        Admit waiters from the head of the queue while there are free slots and tokens. When the
+        head only lacks a token, check again once the bucket has refilled.
+        """
+        while self._waiters and self.active < self.max_concurrency:
+            future = self._waiters[0][2]
+            if future.done():
+                heapq.heappop(self._waiters)  # cancelled while waiting
+                continue
+            if not self.bucket.try_acquire():
+                if self._refill_timer is None:
+                    self._refill_timer = asyncio.get_running_loop().call_later(
+                        self.bucket.seconds_until_available(), self._refilled)
+                return
+            heapq.heappop(self._waiters)
+            self.active += 1
+            future.set_result(None)
+
+    def _refilled(self):
+        self._refill_timer = None
+        self._dispatch()
+
+    def _release(self):
+        self.active -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority):
+        stats = self.counters[priority.name.lower()]
+        if priority == Priority.BACKGROUND and self.queue_depth() >= self.shed_queue_depth:
+            stats["shed"] += 1
+            raise LoadShedError(f"LLM queue saturated ({self.queue_depth()} waiting), shedding background work")
+
+        enqueued_at = time.monotonic()
+        await self._acquire(priority)
+        try:
+            waited = time.monotonic() - enqueued_at
+            llm_queue_seconds.labels(priority.name.lower()).observe(waited)
+            stats["admitted"] += 1
+            stats["wait_seconds_total"] += waited
+            stats["wait_seconds_max"] = max(stats["wait_seconds_max"], waited)
+            yield
+        finally:
+            self._release()
+
+    async def retry_or_raise(self, priority: Priority, attempt: int, error: Exception):
+        """
+        Sleep before the next attempt of a call that failed with error, or re-raise it when
+        it is not retryable or the call is out of retries.
+        """
+        if not isinstance(error, RETRYABLE_ERRORS) or attempt >= self.max_retries:
+            raise error
+        self.counters[priority.name.lower()]["retried"] += 1
+        delay = self.retry_backoff_seconds * 2 ** attempt
+        print(f"LLM call failed ({type(error).__name__}), retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+    def bind(self, llm, priority: Priority, template: str = "default") -> "ScheduledLLM":
+        return ScheduledLLM(llm, self, priority, template)
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": {p.name.lower(): self.queue_depth(p) for p in Priority},
+            "priorities": {
+                name: {**c, "wait_seconds_average": c["wait_seconds_total"] / c["admitted"] if c["admitted"] else 0.0}
+                for name, c in self.counters.items()
+            },
+        }
+
+
+class ScheduledLLM:
+    """
+    Chat model wrapper whose calls go through the scheduler at a fixed priority.
+    Call durations are recorded under the prompt template the wrapper is bound to.
+    A streaming call holds its slot until the stream is exhausted or closed. Calls are only retried
+    when they failed before their first token: ainvoke() under a streaming graph already sent its
+    tokens to the client through the callbacks.
+    """
+
+    def __init__(self, llm, scheduler: LLMScheduler, priority: Priority, template: str = "default"):
+        self.llm = llm
+        self.scheduler = scheduler
+        self.priority = priority
+        self.template = template
+        self.call_seconds = llm_call_seconds.labels(template, priority.name.lower())
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        watcher = TokenWatcher()
+        config = with_callback(config, watcher)
+        with tracer.span(f"llm.{self.template}", activate=False, priority=self.priority.name.lower()):
+            for attempt in itertools.count():
+                try:
+                    async with self.scheduler.slot(self.priority):
+                        with timed(self.call_seconds):
+                            return await self.llm.ainvoke(input, config, **kwargs)
+                except Exception as e:
+                    if watcher.emitted:
+                        raise  # part of the answer already went out
+                    await self.scheduler.retry_or_raise(self.priority, attempt, e)
+
+    async def astream(self, *args, **kwargs):
+        with tracer.span(f"llm.{self.template}", activate=False, priority=self.priority.name.lower(),
+                         stream=True) as span:
+            chunks = 0
+            for attempt in itertools.count():
+                try:
+                    async with self.scheduler.slot(self.priority):
+                        with timed(self.call_seconds):
+                            async for chunk in self.llm.astream(*args, **kwargs):
+                                chunks += 1
+                                yield chunk
+                    break
+                except Exception as e:
+                    if chunks:
+                        raise  # part of the answer already went out
+                    await self.scheduler.retry_or_raise(self.priority, attempt, e)
+            if span:
+                span.set(chunks=chunks)
+
+
+llm_scheduler = LLMScheduler(
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", 8)),
+    requests_per_second=float(os.getenv("LLM_REQUESTS_PER_SECOND", 5)),
+    burst=int(os.getenv("LLM_BURST", 10)),
+    shed_queue_depth=int(os.getenv("LLM_SHED_QUEUE_DEPTH", 16)),
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", 2)),
+)
@@ -0,0 +1,125 @@
+import functools, time
+from contextlib import contextmanager
+from prometheus_client import Histogram, CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Seconds, from sub-millisecond Mongo round trips up to slow LLM generations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+node_seconds = Histogram(
+    "tutor_node_seconds", "Duration of a tutor graph node", ["node"], buckets=LATENCY_BUCKETS)
+llm_call_seconds = Histogram(
+    "tutor_llm_call_seconds", "Duration of an LLM call, excluding scheduler queueing", ["template", "priority"],
+    buckets=LATENCY_BUCKETS)
+llm_queue_seconds = Histogram(
+    "tutor_llm_queue_seconds", "Time an LLM call waited for the scheduler", ["priority"], buckets=LATENCY_BUCKETS)
+mongo_command_seconds = Histogram(
+    "mongo_command_seconds", "Duration of a Mongo command", ["command", "outcome"], buckets=LATENCY_BUCKETS)
+dependency_seconds = Histogram(
+    "tutor_dependency_seconds", "Duration of a call to an external dependency", ["dependency"],
+    buckets=LATENCY_BUCKETS)
+time_to_first_token_seconds = Histogram(
+    "tutor_time_to_first_token_seconds", "Time from receiving a question to sending the first streamed token",
+    buckets=LATENCY_BUCKETS)
+turn_seconds = Histogram(
+    "tutor_turn_seconds", "Duration of a tutor websocket turn", ["outcome"], buckets=LATENCY_BUCKETS)
+background_job_lag_seconds = Histogram(
+    "background_job_lag_seconds", "Time a background job waited from its first enqueue to its start", ["queue"],
+    buckets=LATENCY_BUCKETS)
+background_job_seconds = Histogram(
+    "background_job_seconds", "Duration of a background job", ["queue", "outcome"], buckets=LATENCY_BUCKETS)
+
+
+@contextmanager
+def timed(histogram):
+    """
+    Observe the duration of the block on a histogram (or labelled child).
+    """
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started_at)
+
+
+def timed_dependency(dependency: str):
+    """
+    Decorator for blocking calls to an external dependency.
+    """
+    histogram = dependency_seconds.labels(dependency)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(histogram):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_node(name: str, node):
+    """
+    Wrap an async graph node so its duration is recorded under its name.
+    """
+    histogram = node_seconds.labels(name)
+
+    @functools.wraps(node)
+    async def wrapper(state, config):
+        with timed(histogram):
+            return await node(state, config)
+    return wrapper
+
+
+# Stats keys that only ever go up since the process started, exported as counters
+COUNTER_STATS = {
+    "admitted", "shed", "retried", "rate_limited", "pending_full", "turns", "waited",
+    "rule_hits", "model_hits", "llm_fallbacks", "hits", "exact_hits", "misses", "embedding_errors", "bypassed", "stored", "coalesced",
+    "invalidations", "started", "committed", "cancelled", "failed", "wasted_chunks", "wasted_tokens",
+    "latency_saved_seconds", "truncated_turns", "traces", "sampled", "exported", "stalls", "enqueued",
+    "processed", "errors",
+}
+
+
+def is_counter_stat(key: str) -> bool:
+    return key in COUNTER_STATS or key.endswith("_total")
+
+
+class StatsCollector:
+    """
+    Exposes the in-process stats dicts (caches, scheduler, admission) at scrape time: running totals
+    (COUNTER_STATS and *_total keys) as the tutor_<source>_total counter, everything else (sizes,
+    maxima, ratios, settings) as the tutor_<source> gauge.
+    Nested keys are joined with underscores, non-numeric values are skipped.
+    """
+
+    def __init__(self, sources: dict):
+        self.sources = sources
+
+    @staticmethod
+    def _flatten(stats: dict, prefix: str = ""):
+        for key, value in stats.items():
+            name = f"{prefix}_{key}" if prefix else str(key)
+            if isinstance(value, dict):
+                yield from StatsCollector._flatten(value, name)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield name, str(key), value
+
+    def collect(self):
+        for source, get_stats in self.sources.items():
+            gauge = GaugeMetricFamily(f"tutor_{source}", f"Internal {source} stats", labels=["stat"])
+            counter = CounterMetricFamily(f"tutor_{source}", f"Internal {source} running totals", labels=["stat"])
+            try:
+                for name, key, value in self._flatten(get_stats()):
+                    (counter if is_counter_stat(key) else gauge).add_metric([name], value)
+            except Exception as e:
+                print(f"Error collecting {source} stats: {e}")
+            yield gauge
+            yield counter
+
+
+def register_stats(sources: dict):
+    REGISTRY.register(StatsCollector(sources))
+
+
+def render_metrics() -> tuple[bytes, str]:
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,5 +1,7 @@
 import re
+from utility.tracing import traced
 
+@traced("quiz.extract_mcq")
 def extract_mcq(md_text):
     # Extract question
     question_match = re.search(r'### Question:\s*(.+)', md_text)
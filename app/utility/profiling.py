@@ -0,0 +1,166 @@
+import asyncio, os, sys, threading, time, traceback
+from collections import Counter, deque
+
+# Report the event loop as stalled when a heartbeat is this late, 0 disables the watchdog
+LOOP_STALL_THRESHOLD_MS = float(os.getenv("LOOP_STALL_THRESHOLD_MS", 100))
+LOOP_HEARTBEAT_MS = 20
+
+_APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _frame_label(frame) -> str:
+    filename = frame.f_code.co_filename
+    filename = os.path.relpath(filename, _APP_ROOT) if filename.startswith(_APP_ROOT) else os.path.basename(filename)
+    return f"{filename}:{frame.f_code.co_name}"
+
+
+def _is_app_frame(frame) -> bool:
+    filename = frame.f_code.co_filename
+    return filename.startswith(_APP_ROOT) and "site-packages" not in filename
+
+
+def collapse_stack(frame) -> list[str]:
+    """
+    Frames of a stack as labels, outermost first.
+    """
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of running threads from a background thread and aggregates them as
+    collapsed stacks ("thread;outer;...;inner count"), the input format of flamegraph.pl and speedscope.
+    Only one profile runs at a time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = False
+
+    def profile(self, seconds: float, interval: float = 0.01, thread_ids: set[int] | None = None) -> dict:
+        """
+        Blocking: sample for `seconds`, meant to run in a worker thread.
+        """
+        with self.lock:
+            if self.running:
+                raise RuntimeError("A profile is already running")
+            self.running = True
+        try:
+            own_thread = threading.get_ident()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = Counter()
+            samples = 0
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread or (thread_ids and thread_id not in thread_ids):
+                        continue
+                    stack = [names.get(thread_id, str(thread_id))] + collapse_stack(frame)
+                    stacks[";".join(stack)] += 1
+                samples += 1
+                time.sleep(interval)
+            return {"seconds": seconds, "interval": interval, "samples": samples, "stacks": stacks}
+        finally:
+            with self.lock:
+                self.running = False
+
+    @staticmethod
+    def folded(result: dict) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in result["stacks"].most_common())
+
+
+class LoopStallWatchdog:
+    """
+    Detects event loop stalls: a task on the loop updates a heartbeat every LOOP_HEARTBEAT_MS and a
+    watchdog thread checks it. When the heartbeat is late by more than the threshold, the loop thread's
+    stack is captured while it is still blocked, logged once per stall and counted per call site
+    (the innermost frame in the app's own code).
+    """
+
+    def __init__(self, threshold_ms: float, heartbeat_ms: float = LOOP_HEARTBEAT_MS, max_recent: int = 50):
+        self.threshold = threshold_ms / 1000
+        self.heartbeat = heartbeat_ms / 1000
+        self.last_beat = time.perf_counter()
+        self.loop_thread_id = None
+        self.stalled_since = None
+        self.call_sites = Counter()
+        self.call_site_seconds = Counter()
+        self.recent = deque(maxlen=max_recent)
+        self.counters = {"stalls": 0, "stall_seconds_total": 0.0, "stall_seconds_max": 0.0}
+        self._current_site = None
+        self._task = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self.threshold <= 0 or self._task is not None:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.perf_counter()
+        self._task = loop.create_task(self._beat())
+        threading.Thread(target=self._watch, name="loop-stall-watchdog", daemon=True).start()
+        print(f"Event loop stall watchdog started, threshold {self.threshold * 1000:.0f}ms")
+
+    async def _beat(self):
+        while True:
+            now = time.perf_counter()
+            if self.stalled_since is not None:
+                self._finish_stall(now)
+            self.last_beat = now
+            await asyncio.sleep(self.heartbeat)
+
+    def _finish_stall(self, now: float):
+        duration = now - self.stalled_since
+        self.counters["stall_seconds_total"] += duration
+        self.counters["stall_seconds_max"] = max(self.counters["stall_seconds_max"], duration)
+        self.call_site_seconds[self._current_site] += duration
+        if self.recent and self.recent[-1]["call_site"] == self._current_site:
+            self.recent[-1]["duration_ms"] = duration * 1000
+        self.stalled_since = None
+
+    def _watch(self):
+        while True:
+            time.sleep(self.heartbeat)
+            last_beat = self.last_beat
+            lag = time.perf_counter() - last_beat
+            if lag < self.threshold + self.heartbeat or self.stalled_since is not None:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            call_site, stack = self._call_site(frame)
+            self.stalled_since = last_beat + self.heartbeat
+            self._current_site = call_site
+            self.counters["stalls"] += 1
+            self.call_sites[call_site] += 1
+            self.recent.append({"at": time.time(), "call_site": call_site, "duration_ms": None, "stack": stack})
+            print(f"Event loop blocked for over {lag * 1000:.0f}ms at {call_site}\n{stack}")
+
+    @staticmethod
+    def _call_site(frame) -> tuple[str, str]:
+        stack = "".join(traceback.format_stack(frame))
+        site = frame
+        while site is not None and not _is_app_frame(site):
+            site = site.f_back
+        site = site or frame
+        return f"{_frame_label(site)}:{site.f_lineno}", stack
+
+    def stats(self) -> dict:
+        return {**self.counters, "threshold_ms": self.threshold * 1000}
+
+    def report(self) -> dict:
+        return {
+            **self.stats(),
+            "call_sites": [
+                {"call_site": site, "stalls": count, "stall_seconds": self.call_site_seconds[site]}
+                for site, count in self.call_sites.most_common()
+            ],
+            "recent": list(self.recent),
+        }
+
+
+sampling_profiler = SamplingProfiler()
+stall_watchdog = LoopStallWatchdog(LOOP_STALL_THRESHOLD_MS)
@@ -0,0 +1,131 @@
+import asyncio, hashlib, json, os, re, sqlite3, threading, time
+from collections import defaultdict
+from cachetools import TLRUCache
+
+
+def normalize_prompt(prompt_value) -> str:
+    """
+    Render a prompt value to text and collapse case and whitespace differences.
+    """
+    text = prompt_value.to_string() if hasattr(prompt_value, "to_string") else str(prompt_value)
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+class SQLitePromptStore:
+    """
+    Optional on-disk tier so cached results survive restarts and are shared between workers on a host.
+    """
+
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS prompt_cache ("
+                "key TEXT PRIMARY KEY, template TEXT, value TEXT, expires_at REAL)"
+            )
+            self.connection.commit()
+
+    def get(self, key: str):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value, expires_at FROM prompt_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return row[0], row[1] - time.time()
+
+    def set(self, key: str, template_name: str, value: str, ttl: float) -> None:
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO prompt_cache (key, template, value, expires_at) VALUES (?, ?, ?, ?)",
+                (key, template_name, value, time.time() + ttl),
+            )
+            self.connection.commit()
+
+    def purge_expired(self) -> None:
+        with self.lock:
+            self.connection.execute("DELETE FROM prompt_cache WHERE expires_at <= ?", (time.time(),))
+            self.connection.commit()
+
+
+class PromptCache:
+    """
+    Caches the text result of short auxiliary LLM prompts (topics, intents, search queries).
+    Keys combine the template name, the normalized rendered prompt and the model settings.
+    Results live in an in-memory LRU tier and, when sqlite_path is set, an on-disk SQLite tier.
+    """
+
+    def __init__(self, model_settings: dict, max_entries: int = 1024, sqlite_path: str | None = None,
+                 default_ttl: float = 3600, template_ttls: dict[str, float] | None = None):
+        self.model_settings = model_settings
+        self.default_ttl = default_ttl
+        self.template_ttls = template_ttls or {}
+        # values are (result, ttl) so every template keeps its own expiry
+        self.memory = TLRUCache(maxsize=max_entries, ttu=lambda _key, value, now: now + value[1], timer=time.monotonic)
+        self.lock = threading.Lock()
+        self.disk = SQLitePromptStore(sqlite_path) if sqlite_path else None
+        if self.disk:
+            self.disk.purge_expired()
+        self.counters = defaultdict(lambda: {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+
+    def make_key(self, template_name: str, prompt_value) -> str:
+        payload = json.dumps(
+            {"template": template_name, "prompt": normalize_prompt(prompt_value), "model": self.model_settings},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def ttl_for(self, template_name: str) -> float:
+        return self.template_ttls.get(template_name, self.default_ttl)
+
+    def _get_memory(self, template_name: str, key: str):
+        with self.lock:
+            value = self.memory.get(key)
+        if value is not None:
+            self.counters[template_name]["memory_hits"] += 1
+            return value[0]
+        return None
+
+    def _get_disk(self, template_name: str, key: str):
+        if not self.disk:
+            return None
+        found = self.disk.get(key)
+        if found is None:
+            return None
+        result, remaining_ttl = found
+        with self.lock:
+            self.memory[key] = (result, remaining_ttl)
+        self.counters[template_name]["disk_hits"] += 1
+        return result
+
+    def _set(self, template_name: str, key: str, result: str) -> None:
+        ttl = self.ttl_for(template_name)
+        if ttl <= 0:
+            return
+        with self.lock:
+            self.memory[key] = (result, ttl)
+        if self.disk:
+            self.disk.set(key, template_name, result, ttl)
+
+    async def aget_or_invoke(self, template_name: str, prompt_value, llm, config=None) -> str:
+        key = self.make_key(template_name, prompt_value)
+        result = self._get_memory(template_name, key)
+        if result is None and self.disk:
+            result = await asyncio.to_thread(self._get_disk, template_name, key)
+        if result is None:
+            self.counters[template_name]["misses"] += 1
+            result = (await llm.ainvoke(prompt_value, config)).content.strip()
+            if self.disk:
+                await asyncio.to_thread(self._set, template_name, key, result)
+            else:
+                self._set(template_name, key, result)
+        return result
+
+    def stats(self) -> dict:
+        templates = {}
+        for template_name, counts in self.counters.items():
+            lookups = sum(counts.values())
+            hits = counts["memory_hits"] + counts["disk_hits"]
+            templates[template_name] = {**counts, "hit_rate": hits / lookups if lookups else 0.0}
+        return {"size": len(self.memory), "disk_enabled": self.disk is not None, "templates": templates}
@@ -1,10 +1,13 @@
 from db_utility.mongo_db import mongo_db
 from uuid import uuid4
 from datetime import datetime
-from fastapi import HTTPException, status, Depends, APIRouter
+from fastapi import HTTPException, status, Depends, APIRouter, Body
 from utility.auth import get_current_user_from_firebase_token
 from typing_extensions import Literal, TypedDict
-from analytics.user_performance_metrics import updateStudentBasicMetricInDB
+from analytics.user_performance_metrics import metrics_publish_queue, student_metrics_cache
+from utility.auth import user_profile_cache
+from analytics.metric_counters import student_metric_counters
+from utility.tracing import traced
 
 class QuizResult(TypedDict):
     quiz_id: str
@@ -22,6 +25,9 @@ difficulty_level_score_mapping = {
     "hard": 30
 }
 
+# Results accepted by one /save-user-quiz-results request
+MAX_QUIZ_RESULTS_PER_BATCH = 100
+
 quiz_router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
@@ -31,7 +37,8 @@ users_collection = mongo_db["users"]
 quiz_submissions_collection = mongo_db["quiz_submissions"]
 
 
-def save_quiz(quiz_data: dict) -> str:
+@traced("save_quiz")
+async def save_quiz(quiz_data: dict) -> str:
     """
     Save a quiz to the MongoDB collection.
     
@@ -41,57 +48,117 @@ def save_quiz(quiz_data: dict) -> str:
     quiz_data["_id"] = str(uuid4())  # Generate a unique ID for the quiz
     quiz_data["created_at"] = datetime.now()
 
-    result = quiz_collection.insert_one(quiz_data)
+    result = await quiz_collection.insert_one(quiz_data)
 
     if not result.acknowledged:
         raise Exception("Failed to save quiz to the database")
     return quiz_data
 
+def invalidate_user_caches(user_id: str):
+    """
+    A submission changes the profile (last_quiz_submission_time) and, once published, the metrics.
+    """
+    user_profile_cache.invalidate(user_id)
+    student_metrics_cache.invalidate(user_id)
+
+
+def build_submission(quiz_result: dict, user_id: str) -> tuple[str, dict]:
+    """
+    Validate a client quiz result and return its quiz_id and the submission fields to store.
+    """
+    # Validate + build plain dict
+    validated = QuizResult(**quiz_result, user_id=user_id, responded_at=datetime.utcnow())
+    doc = validated.model_dump() if hasattr(validated, "model_dump") else dict(validated)
+
+    # compute score
+    doc["score"] = difficulty_level_score_mapping.get(doc.get("difficulty", "easy"), 1) if doc.get("is_correct") else 0
+
+    return doc["quiz_id"], {
+        "is_correct": doc["is_correct"],
+        "selected_option": doc.get("selected_option"),
+        "score": doc["score"],
+        "difficulty": doc.get("difficulty"),
+        "subject": doc.get("subject"),
+        "responded_at": doc["responded_at"],
+    }
+
+
 @quiz_router.post("/save-user-quiz-result")
 async def save_user_quiz_result(quiz_result: dict, user: dict = Depends(get_current_user_from_firebase_token)):
     try:
-        # Validate + build plain dict
-        validated = QuizResult(**quiz_result, user_id=user["user_id"], responded_at=datetime.utcnow())
-        doc = validated.model_dump() if hasattr(validated, "model_dump") else dict(validated)
-
-        # compute score
-        doc["score"] = difficulty_level_score_mapping.get(doc.get("difficulty", "easy"), 1) if doc.get("is_correct") else 0
-
-        user_id = doc["user_id"]
-        quiz_id = doc["quiz_id"]
-
-        # Upsert on (user_id, quiz_id)
-        result = quiz_submissions_collection.update_one(
-            {"user_id": user_id, "quiz_id": quiz_id},
-            {
-                "$set": {
-                    "is_correct": doc["is_correct"],
-                    "selected_option": doc.get("selected_option"),
-                    "score": doc["score"],
-                    "difficulty": doc.get("difficulty"),
-                    "subject": doc.get("subject"),
-                    "responded_at": doc["responded_at"],
-                },
-                "$setOnInsert": {
-                    "user_id": user_id,
-                    "quiz_id": quiz_id,
-                    "created_at": datetime.now(),
-                },
-            },
-            upsert=True,
-        )
+        user_id = user["user_id"]
+        quiz_id, submission = build_submission(quiz_result, user_id)
+
+        # Upsert on (user_id, quiz_id) and move the user's metric counters by the difference
+        # from their previous answer, if any
+        previous, _ = await student_metric_counters.record_submission(user_id, quiz_id, submission)
 
         # Update user's last submission time after successful upsert
-        users_collection.update_one(
+        await users_collection.update_one(
             {"_id": user_id},
             {"$set": {"last_quiz_submission_time": datetime.now()}}
         )
 
-        # Recompute metrics after DB is updated
-        updateStudentBasicMetricInDB(user_id)
+        # Metrics are published to Firestore in the background, once per burst of submissions
+        metrics_publish_queue.enqueue(user_id)
+        invalidate_user_caches(user_id)
 
-        status = "created" if result.upserted_id is not None else "updated"
+        status = "created" if previous is None else "updated"
         return {"message": f"Quiz result {status} successfully", "quiz_id": quiz_id}
 
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@quiz_router.post("/save-user-quiz-results")
+async def save_user_quiz_results(quiz_results: list[dict] = Body(...),
+                                 user: dict = Depends(get_current_user_from_firebase_token)):
+    """
+    Save the results of a multi-question quiz in one request: one bulk write for the answers,
+    one user update and one metrics update. Returns a status per result, in request order.
+    A quiz answered twice in the batch keeps its last answer.
+    """
+    if not quiz_results or len(quiz_results) > MAX_QUIZ_RESULTS_PER_BATCH:
+        raise HTTPException(status_code=400,
+                            detail=f"Send between 1 and {MAX_QUIZ_RESULTS_PER_BATCH} quiz results")
+    user_id = user["user_id"]
+
+    items, submissions = [], {}
+    for index, quiz_result in enumerate(quiz_results):
+        try:
+            quiz_id, submission = build_submission(quiz_result, user_id)
+        except Exception as e:
+            items.append({"index": index, "quiz_id": quiz_result.get("quiz_id"), "status": "error", "detail": str(e)})
+            continue
+        # a later answer to the same quiz replaces this one
+        submissions.pop(quiz_id, None)
+        submissions[quiz_id] = submission
+        items.append({"index": index, "quiz_id": quiz_id})
+
+    statuses = {}
+    if submissions:
+        try:
+            statuses = await student_metric_counters.record_submissions(user_id, submissions)
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                detail=f"Error saving quiz results: {str(e)}")
+
+    last_index = {item["quiz_id"]: item["index"] for item in items if "status" not in item}
+    for item in items:
+        if "status" in item:
+            continue
+        if last_index[item["quiz_id"]] != item["index"]:
+            item.update(status="skipped", detail="Replaced by a later result for the same quiz")
+        else:
+            item.update(statuses[item["quiz_id"]])
+
+    if any(item["status"] in ("created", "updated") for item in items):
+        await users_collection.update_one(
+            {"_id": user_id},
+            {"$set": {"last_quiz_submission_time": datetime.now()}}
+        )
+        metrics_publish_queue.enqueue(user_id)
+        invalidate_user_caches(user_id)
+
+    saved = sum(item["status"] in ("created", "updated") for item in items)
+    return {"message": f"Saved {saved} of {len(items)} quiz results", "results": items}
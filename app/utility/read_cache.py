@@ -0,0 +1,69 @@
+import asyncio
+from cachetools import TTLCache
+
+
+class ReadThroughCache:
+    """
+    In-process TTL + LRU cache in front of a slow read (a Mongo profile, a Firestore metrics document).
+    Concurrent misses for the same key share one load. Writers call invalidate() or set() after
+    changing the source, a load that was already in flight then does not repopulate the cache.
+    Each worker process has its own cache, so other workers can serve a value up to ttl seconds old.
+    Cached values are shared, callers must not mutate them.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.inflight: dict[str, asyncio.Future] = {}
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "invalidations": 0}
+
+    async def get_or_load(self, key: str, load):
+        """
+        Cached value for key, or the result of `await load()`. None results are not cached.
+        """
+        value = self.entries.get(key)
+        if value is not None:
+            self.counters["hits"] += 1
+            return value
+        future = self.inflight.get(key)
+        if future is not None:
+            self.counters["coalesced"] += 1
+            return await asyncio.shield(future)
+
+        self.counters["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            value = await load()
+        except Exception as e:
+            future.set_exception(e)
+            # retrieved here so an unshared failure is not reported as never retrieved
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(value)
+            if value is not None and self.inflight.get(key) is future:
+                self.entries[key] = value
+            return value
+        finally:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+
+    def set(self, key: str, value):
+        self.inflight.pop(key, None)
+        self.entries[key] = value
+
+    def invalidate(self, key: str):
+        self.counters["invalidations"] += 1
+        self.inflight.pop(key, None)
+        self.entries.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.counters["hits"] + self.counters["misses"] + self.counters["coalesced"]
+        return {
+            **self.counters,
+            "size": len(self.entries),
+            "hit_rate": (self.counters["hits"] + self.counters["coalesced"]) / lookups if lookups else 0.0,
+        }
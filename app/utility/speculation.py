@@ -0,0 +1,92 @@
+import asyncio, contextvars, time
+from utility.context_packer import estimate_tokens
+
+speculation_stats = {
+    "started": 0,
+    "committed": 0,
+    "cancelled": 0,
+    "failed": 0,
+    "wasted_chunks": 0,
+    "wasted_tokens": 0,
+    "latency_saved_seconds": 0.0,
+}
+
+
+class SpeculativeStream:
+    """
+    Starts an LLM stream ahead of knowing whether its output is needed.
+    Chunks are buffered until the caller either commits (and replays them with stream())
+    or cancels the generation.
+    """
+
+    def __init__(self, llm, prompt_factory):
+        self.chunks: list[str] = []
+        self.done = False
+        self.error = None
+        self.started_at = time.perf_counter()
+        self.first_chunk_at = None
+        self._updated = asyncio.Event()
+        # run in an empty context so the buffered chunks are not streamed by the
+        # enclosing graph node's callbacks before we decide to release them
+        self.task = asyncio.create_task(self._run(llm, prompt_factory), context=contextvars.Context())
+        speculation_stats["started"] += 1
+
+    async def _run(self, llm, prompt_factory):
+        try:
+            prompt = await prompt_factory()
+            async for chunk in llm.astream(prompt):
+                if self.first_chunk_at is None:
+                    self.first_chunk_at = time.perf_counter()
+                self.chunks.append(chunk.content)
+                self._updated.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = e
+            speculation_stats["failed"] += 1
+        finally:
+            self.done = True
+            self._updated.set()
+
+    def commit(self):
+        # started only at commit, the first token would come time-to-first-token after it: the head
+        # start is the time already spent generating, capped at that time to first token
+        saved = time.perf_counter() - self.started_at
+        if self.first_chunk_at is not None:
+            saved = min(saved, self.first_chunk_at - self.started_at)
+        speculation_stats["committed"] += 1
+        speculation_stats["latency_saved_seconds"] += saved
+        print(f"Speculative answer committed, {saved:.3f}s head start")
+
+    def cancel(self):
+        self.task.cancel()
+        text = "".join(self.chunks)
+        speculation_stats["cancelled"] += 1
+        speculation_stats["wasted_chunks"] += len(self.chunks)
+        speculation_stats["wasted_tokens"] += estimate_tokens(text)
+        print(f"Speculative answer cancelled after {len(self.chunks)} chunks")
+
+    async def stream(self):
+        """
+        Yield the buffered chunks, then keep yielding live chunks until the generation ends.
+        """
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                break
+            self._updated.clear()
+            if index == len(self.chunks) and not self.done:
+                await self._updated.wait()
+        if self.error:
+            raise self.error
+
+
+def get_speculation_stats() -> dict:
+    stats = dict(speculation_stats)
+    stats["average_latency_saved_seconds"] = (
+        stats["latency_saved_seconds"] / stats["committed"] if stats["committed"] else 0.0
+    )
+    return stats
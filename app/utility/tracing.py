@@ -0,0 +1,212 @@
+import contextvars, functools, inspect, json, os, queue, random, threading, time
+from collections import deque
+from contextlib import contextmanager
+from uuid import uuid4
+
+# Share of tutor turns traced; turns slower than TRACE_SLOW_SECONDS are always kept when it is set
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.05))
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", 0))
+# Comma separated: memory, jsonl
+TRACE_EXPORTERS = os.getenv("TRACE_EXPORTERS", "memory")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces/tutor_traces.jsonl")
+
+
+class Trace:
+    def __init__(self, sampled: bool):
+        self.trace_id = uuid4().hex
+        self.sampled = sampled
+        self.spans: list[dict] = []
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def add(self, span: dict):
+        with self.lock:
+            # spans of background work that outlives the root are dropped
+            if not self.closed:
+                self.spans.append(span)
+
+    def close(self) -> list[dict]:
+        with self.lock:
+            self.closed = True
+            return sorted(self.spans, key=lambda span: span["start_time"])
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attributes", "start_time", "started_at", "error")
+
+    def __init__(self, trace: Trace, name: str, parent_id: str | None, attributes: dict):
+        self.trace = trace
+        self.span_id = uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start_time = time.time()
+        self.started_at = time.perf_counter()
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self) -> float:
+        duration = time.perf_counter() - self.started_at
+        self.trace.add({
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration_ms": duration * 1000,
+            "attributes": self.attributes,
+            "error": self.error,
+        })
+        return duration
+
+
+class InMemoryExporter:
+    """
+    Keeps the most recent traces for inspection from the process itself.
+    """
+
+    def __init__(self, max_traces: int = 200):
+        self.traces = deque(maxlen=max_traces)
+
+    def export(self, spans: list[dict]):
+        self.traces.append(spans)
+
+    def recent(self, limit: int = 20) -> list[list[dict]]:
+        return list(self.traces)[-limit:]
+
+
+class JsonlExporter:
+    """
+    Appends one JSON line per span to a file from a background thread, off the event loop.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.queue = queue.SimpleQueue()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        threading.Thread(target=self._write_loop, name="trace-writer", daemon=True).start()
+
+    def export(self, spans: list[dict]):
+        self.queue.put(spans)
+
+    def _write_loop(self):
+        with open(self.path, "a") as f:
+            while True:
+                spans = self.queue.get()
+                for span in spans:
+                    f.write(json.dumps(span, default=str) + "\n")
+                f.flush()
+
+
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """
+    Minimal span tracer. A root span starts a trace (subject to sampling), spans opened while it
+    is current become its children, including in tasks and threads started from the same context.
+    Outside a trace, span() does nothing, so instrumented code costs a context variable lookup.
+    """
+
+    def __init__(self, sample_rate: float, slow_seconds: float = 0, exporters: list | None = None):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.exporters = exporters or []
+        self.counters = {"traces": 0, "sampled": 0, "exported": 0}
+
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        """
+        Root span of a trace, e.g. one tutor turn.
+        """
+        self.counters["traces"] += 1
+        sampled = random.random() < self.sample_rate
+        if not sampled and not self.slow_seconds:
+            yield None
+            return
+        trace = Trace(sampled)
+        root = Span(trace, name, None, attributes)
+        token = _current_span.set(root)
+        try:
+            yield root
+        except BaseException as e:
+            root.error = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            duration = root.finish()
+            spans = trace.close()
+            if sampled or duration >= self.slow_seconds:
+                self.counters["sampled"] += 1
+                self._export(spans)
+
+    @contextmanager
+    def span(self, name: str, activate: bool = True, **attributes):
+        """
+        Child span of the current span. With activate=False the span does not become current,
+        which is required around async generators since they resume in other contexts.
+        """
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+        span = Span(parent.trace, name, parent.span_id, attributes)
+        token = _current_span.set(span) if activate else None
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            if token is not None:
+                _current_span.reset(token)
+            span.finish()
+
+    def current(self) -> Span | None:
+        return _current_span.get()
+
+    def _export(self, spans: list[dict]):
+        for exporter in self.exporters:
+            try:
+                exporter.export(spans)
+            except Exception as e:
+                print(f"Error exporting trace: {e}")
+        self.counters["exported"] += 1
+
+    def stats(self) -> dict:
+        return {**self.counters, "sample_rate": self.sample_rate, "slow_seconds": self.slow_seconds}
+
+
+def traced(name: str):
+    """
+    Decorator recording a span around a sync or async function while a trace is active.
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+memory_exporter = InMemoryExporter()
+_exporters = []
+for _name in filter(None, (name.strip() for name in TRACE_EXPORTERS.split(","))):
+    if _name == "memory":
+        _exporters.append(memory_exporter)
+    elif _name == "jsonl":
+        _exporters.append(JsonlExporter(TRACE_FILE))
+    else:
+        raise ValueError(f"Unknown trace exporter: {_name}")
+
+tracer = Tracer(TRACE_SAMPLE_RATE, TRACE_SLOW_SECONDS, _exporters)
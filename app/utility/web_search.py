@@ -1,11 +1,24 @@
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import os
+from utility.cassette import cassette
+from utility.metrics import timed_dependency
+from utility.tracing import traced
 
 GOOGLE_API_KEY = os.getenv('GOOGLE_SEARCH_API_KEY')
 GOOGLE_CX = os.getenv('GOOGLE_SEARCH_CX')
 
+@traced("google_image_search")
+@timed_dependency("google_image_search")
 def google_image_search(query, num_results=10):
+    return cassette.call("image_search", {"query": query, "num_results": num_results},
+                         lambda: _search_images(query, num_results))
+
+
+def _search_images(query, num_results):
+    if not GOOGLE_API_KEY:
+        # offline runs (load tests, CI) have no search credentials
+        return []
     try:
         service = build("customsearch", "v1", developerKey=GOOGLE_API_KEY)
         response = service.cse().list(